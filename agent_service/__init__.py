@@ -0,0 +1 @@
+from .agent_service import AgentService, DEFAULT_MAX_USER_QUEUE
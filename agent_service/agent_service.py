@@ -0,0 +1,310 @@
+import asyncio
+import collections
+import json
+import math
+import queue
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from instrumentation import increment, export_prometheus, enable_metrics
+
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_QUEUE = 100
+DEFAULT_MAX_USER_QUEUE = 10
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8080
+USER_HEADER = 'X-User-Id'
+MAX_BODY_BYTES = 64 * 1024
+
+_VALID_USER_ID = re.compile(r"^[A-Za-z0-9._@:-]{1,128}$")
+
+
+class _Job:
+    __slots__ = ('user_id', 'text', 'events', 'enqueued_at')
+
+    def __init__(self, user_id, text):
+        self.user_id = user_id
+        self.text = text
+        # Thread-safe, so the event loop can hand events to the HTTP thread serving the caller.
+        self.events = queue.Queue()
+        self.enqueued_at = time.monotonic()
+
+    def emit(self, event, data):
+        self.events.put((event, data))
+
+
+class AgentService:
+    """
+    Long-running HTTP front-end that serves many callers from one AsyncRequestEngine.
+
+    :param engine: The AsyncRequestEngine requests are run on.
+    :param workers: Requests processed at the same time.
+    :param max_queue: Requests allowed to wait for a worker. Beyond that, callers get 429 with Retry-After.
+    :param max_user_queue: Requests one user may have waiting; more from that user get 429 as well.
+
+    Each caller identifies itself with the X-User-Id header and gets its own conversation (lookup id
+    'user:<id>'). A user's requests run one at a time, in order: while one is in flight, the next ones wait
+    in that user's own queue rather than occupying workers, so one busy user can't hold up the others.
+    Endpoints:
+
+    - POST /v1/requests {"text": ...}: the answer as JSON, or as Server-Sent Events (queued, started,
+      delta, completed / error) when the request accepts text/event-stream.
+    - GET /health: queue depth, capacity and worker status as JSON.
+    - GET /metrics: instrumentation metrics plus service gauges in Prometheus text format. Starting the
+      service enables metrics, so the request counters and spans are recorded.
+    """
+
+    def __init__(self, engine, workers=DEFAULT_WORKERS, max_queue=DEFAULT_MAX_QUEUE, host=DEFAULT_HOST, port=DEFAULT_PORT,
+                 max_user_queue=DEFAULT_MAX_USER_QUEUE):
+        self.engine = engine
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_user_queue = max_user_queue
+        self._http = ThreadingHTTPServer((host, port), _make_handler(self))
+        self._http.daemon_threads = True
+        self._loop = None
+        # _queue only holds jobs whose user has nothing in flight; a user's later jobs wait in _user_jobs.
+        self._queue = None
+        self._user_jobs = {}  # user_id -> deque of jobs behind the one in _queue or in flight
+        self._waiting = 0  # jobs not yet picked up by a worker, in either place
+        self._ready = threading.Event()
+        self._busy = 0
+        self._avg_latency = None
+        self._lock = threading.Lock()
+
+    @property
+    def address(self):
+        return self._http.server_address[:2]
+
+    def start(self):
+        """
+        Starts the event loop with its workers and the HTTP server, each on a background thread.
+        """
+        enable_metrics()
+        threading.Thread(target=self._run_loop, name="agent-service-loop", daemon=True).start()
+        self._ready.wait()
+        threading.Thread(target=self._http.serve_forever, name="agent-service-http", daemon=True).start()
+        return self
+
+    def serve_forever(self):
+        self.start()
+        host, port = self.address
+        print(f"Serving m-agent on http://{host}:{port} with {self.workers} workers (queue {self.max_queue}).")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            print("Shutting down.")
+        finally:
+            self.stop()
+
+    def stop(self):
+        self._http.shutdown()
+        self._http.server_close()
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def _run_loop(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.Queue()
+        for _ in range(self.workers):
+            self._loop.create_task(self._worker())
+        self._loop.call_soon(self._ready.set)
+        try:
+            self._loop.run_forever()
+        finally:
+            # stop() ended the loop: cancel the workers and any request still running, then close it.
+            tasks = asyncio.all_tasks(self._loop)
+            for task in tasks:
+                task.cancel()
+            self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self._loop.close()
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            with self._lock:
+                self._waiting -= 1
+                self._busy += 1
+            job.emit('started', {'queued_ms': round((time.monotonic() - job.enqueued_at) * 1000)})
+            started = time.monotonic()
+            try:
+                response = await self.engine.process_user_request(
+                    job.text, f"user:{job.user_id}", on_delta=lambda text: job.emit('delta', {'text': text}))
+                if response is None:
+                    job.emit('error', {'error': "The request could not be completed."})
+                else:
+                    job.emit('completed', {'response': response})
+            except Exception as e:
+                job.emit('error', {'error': str(e)})
+            finally:
+                self._record_latency(time.monotonic() - started)
+                with self._lock:
+                    self._busy -= 1
+                self._queue.task_done()
+                self._release_user(job.user_id)
+
+    def _release_user(self, user_id):
+        # Runs on the event loop: hands the user's next job to the workers, or marks the user idle.
+        jobs = self._user_jobs[user_id]
+        if jobs:
+            self._queue.put_nowait(jobs.popleft())
+        else:
+            del self._user_jobs[user_id]
+
+    def _record_latency(self, seconds):
+        with self._lock:
+            self._avg_latency = seconds if self._avg_latency is None else 0.8 * self._avg_latency + 0.2 * seconds
+
+    def submit(self, user_id, text):
+        """
+        Queues a request from any thread. Returns the job, or None when the queue is full.
+        """
+        job = _Job(user_id, text)
+
+        def enqueue():
+            user_jobs = self._user_jobs.get(user_id)
+            if self._waiting >= self.max_queue or (user_jobs is not None and len(user_jobs) >= self.max_user_queue):
+                return False
+            with self._lock:
+                self._waiting += 1
+            # Emitted before a worker can pick the job up, so 'queued' always precedes 'started'.
+            job.emit('queued', {'position': self._waiting})
+            if user_jobs is None:
+                self._user_jobs[user_id] = collections.deque()
+                self._queue.put_nowait(job)
+            else:
+                user_jobs.append(job)
+            return True
+
+        accepted = asyncio.run_coroutine_threadsafe(_call(enqueue), self._loop).result()
+        increment("service_requests", outcome="accepted" if accepted else "rejected")
+        return job if accepted else None
+
+    def retry_after(self):
+        """
+        Seconds until a queue slot is likely to free up, from the queue depth and recent request latency.
+        """
+        with self._lock:
+            latency = self._avg_latency or 1.0
+        return max(1, math.ceil(self._waiting / self.workers * latency))
+
+    def health(self):
+        with self._lock:
+            busy, latency, depth = self._busy, self._avg_latency, self._waiting
+        return {'status': "overloaded" if depth >= self.max_queue else "ok", 'queue_depth': depth,
+                'max_queue': self.max_queue, 'workers': self.workers, 'busy_workers': busy,
+                'avg_latency_ms': round(latency * 1000) if latency is not None else None}
+
+    def metrics(self):
+        health = self.health()
+        gauges = [
+            "# TYPE m_agent_service_queue_depth gauge", f"m_agent_service_queue_depth {health['queue_depth']}",
+            "# TYPE m_agent_service_queue_capacity gauge", f"m_agent_service_queue_capacity {health['max_queue']}",
+            "# TYPE m_agent_service_busy_workers gauge", f"m_agent_service_busy_workers {health['busy_workers']}",
+            "# TYPE m_agent_service_workers gauge", f"m_agent_service_workers {health['workers']}",
+        ]
+        return export_prometheus() + '\n'.join(gauges) + '\n'
+
+
+async def _call(function):
+    return function()
+
+def _make_handler(service):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            path = urlparse(self.path).path
+            if path == '/health':
+                health = service.health()
+                self._send_json(200 if health['status'] == "ok" else 503, health)
+            elif path == '/metrics':
+                self._send(200, 'text/plain; version=0.0.4', service.metrics().encode('utf-8'))
+            else:
+                self._send_json(404, {'error': "Not found."})
+
+        def do_POST(self):
+            if urlparse(self.path).path != '/v1/requests':
+                return self._send_json(404, {'error': "Not found."})
+
+            user_id = self.headers.get(USER_HEADER, '')
+            if not _VALID_USER_ID.match(user_id):
+                return self._send_json(400, {'error': f"Missing or invalid {USER_HEADER} header."})
+
+            try:
+                length = int(self.headers.get('Content-Length') or 0)
+            except ValueError:
+                length = -1
+            if length < 0:
+                # Without a valid length the body can't be skipped, so the connection can't be reused.
+                self.close_connection = True
+                return self._send_json(400, {'error': "Invalid Content-Length header."})
+            if length > MAX_BODY_BYTES:
+                self.close_connection = True
+                return self._send_json(413, {'error': "Request body too large."})
+            try:
+                text = json.loads(self.rfile.read(length) or b"{}").get('text')
+            except (ValueError, AttributeError):
+                text = None
+            if not isinstance(text, str) or not text.strip():
+                return self._send_json(400, {'error': "Body must be a JSON object with a non-empty 'text'."})
+
+            job = service.submit(user_id, text)
+            if job is None:
+                retry_after = service.retry_after()
+                return self._send_json(429, {'error': "Too many requests queued, retry later.", 'retry_after': retry_after},
+                                       headers={'Retry-After': str(retry_after)})
+
+            if 'text/event-stream' in self.headers.get('Accept', ''):
+                self._stream_events(job)
+            else:
+                self._wait_for_result(job)
+
+        def _wait_for_result(self, job):
+            while True:
+                event, data = job.events.get()
+                if event == 'completed':
+                    return self._send_json(200, data)
+                if event == 'error':
+                    return self._send_json(502, data)
+
+        def _stream_events(self, job):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            self.close_connection = True
+            try:
+                while True:
+                    event, data = job.events.get()
+                    self.wfile.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode('utf-8'))
+                    self.wfile.flush()
+                    if event in ('completed', 'error'):
+                        return
+            except (BrokenPipeError, ConnectionResetError):
+                # The caller went away; the request itself still finishes in the background.
+                return
+
+        def _send_json(self, status, payload, headers=None):
+            self._send(status, 'application/json', json.dumps(payload).encode('utf-8'), headers)
+
+        def _send(self, status, content_type, data, headers=None):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+    return Handler
@@ -0,0 +1 @@
+from .assistant_registry import assistant_registry_key, tools_fingerprint, lookup_assistant, register_assistant, forget_assistant, SQLiteAssistantRegistry, create_default_registry, set_assistant_registry
@@ -0,0 +1,143 @@
+import glob
+import hashlib
+import json
+import os
+import shelve
+import sqlite3
+import threading
+
+REGISTRY_DB = "assistants.sqlite3"
+LEGACY_SHELVE_DB = "assistants_db"
+
+# Resolved records are kept in memory so repeat lookups don't query the database.
+_registry_cache = {}
+_registry_lock = threading.Lock()
+_registry = None
+
+def _digest(payload):
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+def assistant_registry_key(name, model, instructions):
+    """
+    Identifies an assistant by the parts that define it: name, model and instructions template.
+    """
+    return _digest({'name': name, 'model': model, 'instructions': instructions})
+
+def tools_fingerprint(tools):
+    """
+    Hashes the tool schema, so a changed schema can be detected and pushed to the existing assistant.
+    """
+    return _digest(tools)
+
+
+class SQLiteAssistantRegistry:
+    """
+    Registry records in SQLite (WAL mode), so batch and service processes sharing a working directory can
+    all read and write it, like the thread store.
+    """
+
+    def __init__(self, path=REGISTRY_DB):
+        self.path = path
+        self._local = threading.local()
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS assistants ("
+            " registry_key TEXT PRIMARY KEY,"
+            " assistant_id TEXT NOT NULL,"
+            " tools_fingerprint TEXT NOT NULL)"
+        )
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._connection().execute(
+            "SELECT assistant_id, tools_fingerprint FROM assistants WHERE registry_key = ?", (key,)).fetchone()
+        return {'assistant_id': row[0], 'tools_fingerprint': row[1]} if row else None
+
+    def put(self, key, record):
+        self._connection().execute(
+            "INSERT INTO assistants (registry_key, assistant_id, tools_fingerprint) VALUES (?, ?, ?)"
+            " ON CONFLICT(registry_key) DO UPDATE SET assistant_id = excluded.assistant_id,"
+            " tools_fingerprint = excluded.tools_fingerprint",
+            (key, record['assistant_id'], record['tools_fingerprint']))
+
+    def delete(self, key, assistant_id):
+        # Conditional, so a record another process already re-pointed is left alone.
+        self._connection().execute(
+            "DELETE FROM assistants WHERE registry_key = ? AND assistant_id = ?", (key, assistant_id))
+
+    def import_shelve(self, shelve_path=LEGACY_SHELVE_DB):
+        """
+        Copies the records of the old shelve registry, keeping existing rows.
+        """
+        with shelve.open(shelve_path, flag='r') as registry_shelf:
+            entries = list(registry_shelf.items())
+        self._connection().executemany(
+            "INSERT OR IGNORE INTO assistants (registry_key, assistant_id, tools_fingerprint) VALUES (?, ?, ?)",
+            [(key, record['assistant_id'], record['tools_fingerprint']) for key, record in entries])
+        return len(entries)
+
+
+def create_default_registry(path=REGISTRY_DB):
+    """
+    SQLite registry. A new database picks up the records of the old shelve registry, if present.
+    """
+    is_new = not os.path.exists(path)
+    registry = SQLiteAssistantRegistry(path)
+    if is_new and glob.glob(LEGACY_SHELVE_DB + "*"):
+        try:
+            print(f"Imported {registry.import_shelve(LEGACY_SHELVE_DB)} assistants from {LEGACY_SHELVE_DB}")
+        except Exception as e:
+            print(f"Failed to import assistants from {LEGACY_SHELVE_DB}: {e}")
+    return registry
+
+def _get_registry():
+    # Called with _registry_lock held.
+    global _registry
+    if _registry is None:
+        _registry = create_default_registry()
+    return _registry
+
+def set_assistant_registry(registry):
+    """
+    Replaces the registry used by the module-level functions, e.g. with one on a temporary path in tests.
+    """
+    global _registry
+    with _registry_lock:
+        _registry = registry
+        _registry_cache.clear()
+
+def lookup_assistant(key):
+    """
+    Returns the registered record {'assistant_id', 'tools_fingerprint'} for the key, or None.
+    """
+    with _registry_lock:
+        record = _registry_cache.get(key)
+        if record is None:
+            record = _get_registry().get(key)
+            if record is not None:
+                _registry_cache[key] = record
+        return record
+
+def register_assistant(key, assistant_id, fingerprint):
+    record = {'assistant_id': assistant_id, 'tools_fingerprint': fingerprint}
+    with _registry_lock:
+        _get_registry().put(key, record)
+        _registry_cache[key] = record
+    return record
+
+def forget_assistant(key, assistant_id):
+    """
+    Drops the record for the key if it still points at assistant_id, e.g. after the assistant was deleted.
+    """
+    with _registry_lock:
+        _get_registry().delete(key, assistant_id)
+        cached = _registry_cache.get(key)
+        if cached is not None and cached['assistant_id'] == assistant_id:
+            del _registry_cache[key]
@@ -0,0 +1,293 @@
+import email.parser
+import email.policy
+import itertools
+import json
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+from calendar_package.event_cache import event_bounds
+
+CALENDAR_PREFIX = "/calendar/v3"
+BATCH_PATH = "/batch/calendar/v3"
+
+ROUTES = [
+    ("GET", r"/calendars/(?P<calendar_id>[^/]+)/events", "list_events"),
+    ("POST", r"/calendars/(?P<calendar_id>[^/]+)/events", "insert_event"),
+    ("GET", r"/calendars/(?P<calendar_id>[^/]+)/events/(?P<event_id>[^/]+)", "get_event"),
+    ("PUT", r"/calendars/(?P<calendar_id>[^/]+)/events/(?P<event_id>[^/]+)", "update_event"),
+    ("DELETE", r"/calendars/(?P<calendar_id>[^/]+)/events/(?P<event_id>[^/]+)", "delete_event"),
+    ("POST", r"/freeBusy", "free_busy"),
+]
+
+
+class FakeCalendarServer:
+    """
+    In-process HTTP server that speaks enough of the Google Calendar v3 REST API for m-agent.
+
+    Supports events list (time range, paging, syncToken incremental sync), insert, get, update, delete,
+    freeBusy queries and the multipart batch endpoint. Calendars that were never seeded or written to count as
+    not found for freeBusy.
+
+    :param api_latency: Seconds added to every HTTP request (once per batch, not per batched item).
+    :param rate_limit_every: If set, every Nth insert/update/delete is rejected with 429.
+    :param time_zone: The time zone of every calendar; all-day events are placed in it.
+    """
+
+    def __init__(self, api_latency=0.0, rate_limit_every=None, host='127.0.0.1', port=0, time_zone='UTC'):
+        self.api_latency = api_latency
+        self.rate_limit_every = rate_limit_every
+        self.time_zone = time_zone
+        self.call_counts = Counter()
+        self._calendars = {}
+        self._seq = itertools.count(1)
+        self._last_seq = 0
+        self._mutations = itertools.count(1)
+        self._lock = threading.RLock()
+        self._server = ThreadingHTTPServer((host, port), _make_handler(self))
+        self._server.daemon_threads = True
+
+    @property
+    def root_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name="fake-calendar", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def discovery_document(self, document):
+        """
+        Returns a copy of the Calendar v3 discovery document pointed at this server.
+        """
+        document = dict(document, rootUrl=self.root_url, baseUrl=self.root_url + "calendar/v3/",
+                        batchPath=BATCH_PATH.lstrip('/'))
+        return document
+
+    def seed(self, calendar_id, events):
+        for event in events:
+            self.insert_event(event, {}, calendar_id)
+
+    def _touch(self, event):
+        self._last_seq = next(self._seq)
+        event['_seq'] = self._last_seq
+        event['updated'] = datetime.utcnow().isoformat() + 'Z'
+        event['etag'] = f'"{self._last_seq}"'
+
+    def _rate_limited(self):
+        return self.rate_limit_every and next(self._mutations) % self.rate_limit_every == 0
+
+    def list_events(self, body, query, calendar_id):
+        with self._lock:
+            events = list(self._calendars.get(calendar_id, {}).values())
+            sync_seq = self._last_seq
+
+        if 'syncToken' in query:
+            since = int(query['syncToken'])
+            events = [event for event in events if event['_seq'] > since]
+        else:
+            if query.get('showDeleted') != 'true':
+                events = [event for event in events if event.get('status') != 'cancelled']
+            if 'timeMin' in query or 'timeMax' in query:
+                time_min = datetime.fromisoformat(query['timeMin'].replace('Z', '+00:00')).timestamp() if 'timeMin' in query else float('-inf')
+                time_max = datetime.fromisoformat(query['timeMax'].replace('Z', '+00:00')).timestamp() if 'timeMax' in query else float('inf')
+                events = [event for event in events if event_bounds(event, self.time_zone)[1] > time_min
+                          and event_bounds(event, self.time_zone)[0] < time_max]
+            if query.get('orderBy') == 'startTime':
+                events.sort(key=lambda event: event_bounds(event, self.time_zone)[0])
+
+        offset = int(query.get('pageToken') or 0)
+        limit = int(query.get('maxResults', 250))
+        page = events[offset:offset + limit]
+        response = {'kind': "calendar#events", 'timeZone': self.time_zone, 'items': [_public(event) for event in page]}
+        if offset + limit < len(events):
+            response['nextPageToken'] = str(offset + limit)
+        else:
+            response['nextSyncToken'] = str(sync_seq)
+        return 200, response
+
+    def insert_event(self, body, query, calendar_id):
+        if self._rate_limited():
+            return _rate_limit_error()
+        event = dict(body, id=body.get('id') or uuid.uuid4().hex, status=body.get('status', 'confirmed'))
+        event['htmlLink'] = f"https://calendar.example/event?eid={event['id']}"
+        with self._lock:
+            if event['id'] in self._calendars.get(calendar_id, {}):
+                return 409, {'error': {'code': 409, 'message': "The requested identifier already exists.",
+                                       'errors': [{'reason': "duplicate"}]}}
+            self._touch(event)
+            self._calendars.setdefault(calendar_id, {})[event['id']] = event
+        return 200, _public(event)
+
+    def get_event(self, body, query, calendar_id, event_id):
+        event = self._calendars.get(calendar_id, {}).get(event_id)
+        if event is None or event.get('status') == 'cancelled':
+            return _not_found(event_id)
+        return 200, _public(event)
+
+    def update_event(self, body, query, calendar_id, event_id):
+        if self._rate_limited():
+            return _rate_limit_error()
+        with self._lock:
+            existing = self._calendars.get(calendar_id, {}).get(event_id)
+            if existing is None or existing.get('status') == 'cancelled':
+                return _not_found(event_id)
+            event = dict(body, id=event_id, status=body.get('status', 'confirmed'), htmlLink=existing['htmlLink'])
+            if 'start' not in event or 'end' not in event:
+                return 400, {'error': {'code': 400, 'message': "Missing end time.", 'errors': [{'reason': "required"}]}}
+            self._touch(event)
+            self._calendars[calendar_id][event_id] = event
+        return 200, _public(event)
+
+    def delete_event(self, body, query, calendar_id, event_id):
+        if self._rate_limited():
+            return _rate_limit_error()
+        with self._lock:
+            event = self._calendars.get(calendar_id, {}).get(event_id)
+            if event is None or event.get('status') == 'cancelled':
+                return _not_found(event_id, status=410)
+            event['status'] = 'cancelled'
+            self._touch(event)
+        return 204, None
+
+    def free_busy(self, body, query):
+        time_min = datetime.fromisoformat(body['timeMin'].replace('Z', '+00:00')).timestamp()
+        time_max = datetime.fromisoformat(body['timeMax'].replace('Z', '+00:00')).timestamp()
+        calendars = {}
+        for item in body.get('items', []):
+            with self._lock:
+                events = self._calendars.get(item['id'])
+                events = list(events.values()) if events is not None else None
+            if events is None:
+                calendars[item['id']] = {'errors': [{'domain': "global", 'reason': "notFound"}], 'busy': []}
+                continue
+            bounds = sorted(event_bounds(event, self.time_zone) for event in events
+                            if event.get('status') != 'cancelled' and event.get('transparency') != 'transparent')
+            merged = []
+            for start, end in bounds:
+                if end <= time_min or start >= time_max:
+                    continue
+                start, end = max(start, time_min), min(end, time_max)
+                if merged and start <= merged[-1][1]:
+                    merged[-1][1] = max(merged[-1][1], end)
+                else:
+                    merged.append([start, end])
+            calendars[item['id']] = {'busy': [{'start': _rfc3339(start), 'end': _rfc3339(end)} for start, end in merged]}
+        return 200, {'kind': "calendar#freeBusy", 'timeMin': body['timeMin'], 'timeMax': body['timeMax'], 'calendars': calendars}
+
+    def route(self, method, path, query, body):
+        for route_method, pattern, name in _COMPILED_ROUTES:
+            match = pattern.match(path)
+            if route_method == method and match:
+                with self._lock:
+                    self.call_counts[f"{method} {name}"] += 1
+                params = {key: unquote(value) for key, value in match.groupdict().items()}
+                return getattr(self, name)(body, query, **params)
+        return 404, {'error': {'code': 404, 'message': f"Unknown route {method} {path}"}}
+
+    def batch(self, content_type, payload):
+        """
+        Executes a multipart/mixed batch request and returns (content_type, body) of the multipart response.
+        """
+        with self._lock:
+            self.call_counts["POST batch"] += 1
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            b"Content-Type: " + content_type.encode('ascii') + b"\r\n\r\n" + payload)
+        boundary = "batch_" + uuid.uuid4().hex
+        parts = []
+        for part in message.iter_parts():
+            content_id = part['Content-ID'].strip('<>')
+            inner_request = part.get_payload(decode=True).decode('utf-8').replace('\r\n', '\n')
+            request_line, _, rest = inner_request.partition('\n')
+            _, _, inner_body = rest.partition('\n\n')
+            method, url, _ = request_line.split(' ', 2)
+            parsed = urlparse(url)
+            path = parsed.path[len(CALENDAR_PREFIX):]
+            query = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+            body = json.loads(inner_body) if inner_body.strip() else {}
+            status, response = self.route(method, path, query, body)
+
+            response_body = json.dumps(response) if response is not None else ''
+            parts.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} {_REASONS.get(status, 'OK')}\r\nContent-Type: application/json; charset=UTF-8\r\n"
+                f"Content-Length: {len(response_body.encode('utf-8'))}\r\n\r\n{response_body}\r\n")
+        body = ''.join(parts) + f"--{boundary}--\r\n"
+        return f"multipart/mixed; boundary={boundary}", body.encode('utf-8')
+
+
+_COMPILED_ROUTES = [(method, re.compile(pattern + "$"), name) for method, pattern, name in ROUTES]
+_REASONS = {200: "OK", 204: "No Content", 400: "Bad Request", 404: "Not Found", 409: "Conflict", 410: "Gone",
+            429: "Too Many Requests"}
+
+def _public(event):
+    return {key: value for key, value in event.items() if not key.startswith('_')}
+
+def _rfc3339(timestamp):
+    return datetime.utcfromtimestamp(timestamp).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def _not_found(event_id, status=404):
+    return status, {'error': {'code': status, 'message': f"Event {event_id} not found.", 'errors': [{'reason': "notFound"}]}}
+
+def _rate_limit_error():
+    return 429, {'error': {'code': 429, 'message': "Rate Limit Exceeded", 'errors': [{'reason': "rateLimitExceeded"}]}}
+
+def _make_handler(server):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body go out in separate writes; without this, delayed ACKs add ~40ms per request.
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def _dispatch(self, method):
+            parsed = urlparse(self.path)
+            length = int(self.headers.get('Content-Length') or 0)
+            payload = self.rfile.read(length) if length else b""
+
+            if server.api_latency:
+                time.sleep(server.api_latency)
+
+            if method == "POST" and parsed.path == BATCH_PATH:
+                content_type, data = server.batch(self.headers['Content-Type'], payload)
+                return self._send(200, content_type, data)
+
+            if not parsed.path.startswith(CALENDAR_PREFIX):
+                return self._send(404, 'application/json', b'{}')
+            query = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+            body = json.loads(payload) if payload.strip() else {}
+            status, response = server.route(method, parsed.path[len(CALENDAR_PREFIX):], query, body)
+            data = json.dumps(response).encode('utf-8') if response is not None else b''
+            self._send(status, 'application/json; charset=UTF-8', data)
+
+        def _send(self, status, content_type, data):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self._dispatch("GET")
+
+        def do_POST(self):
+            self._dispatch("POST")
+
+        def do_PUT(self):
+            self._dispatch("PUT")
+
+        def do_DELETE(self):
+            self._dispatch("DELETE")
+
+    return Handler
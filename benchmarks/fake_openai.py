@@ -0,0 +1,312 @@
+import itertools
+import json
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# (method, path pattern, handler name). Patterns are matched against the path without the /v1 prefix.
+ROUTES = [
+    ("POST", r"/assistants", "create_assistant"),
+    ("GET", r"/assistants/(?P<assistant_id>[^/]+)", "retrieve_assistant"),
+    ("POST", r"/assistants/(?P<assistant_id>[^/]+)", "update_assistant"),
+    ("POST", r"/threads", "create_thread"),
+    ("GET", r"/threads/(?P<thread_id>[^/]+)", "retrieve_thread"),
+    ("DELETE", r"/threads/(?P<thread_id>[^/]+)", "delete_thread"),
+    ("POST", r"/threads/(?P<thread_id>[^/]+)/messages", "create_message"),
+    ("GET", r"/threads/(?P<thread_id>[^/]+)/messages", "list_messages"),
+    ("POST", r"/threads/(?P<thread_id>[^/]+)/runs", "create_run"),
+    ("GET", r"/threads/(?P<thread_id>[^/]+)/runs/(?P<run_id>[^/]+)", "retrieve_run"),
+    ("POST", r"/threads/(?P<thread_id>[^/]+)/runs/(?P<run_id>[^/]+)/submit_tool_outputs", "submit_tool_outputs"),
+    ("POST", r"/chat/completions", "chat_completion"),
+]
+
+
+class FakeAssistantsServer:
+    """
+    In-process HTTP server that speaks enough of the OpenAI Assistants API for m-agent's pipeline.
+
+    :param scripts: A list of (substring, script) pairs. A run uses the first script whose substring occurs in
+                    the thread's latest user message, or default_script.
+    :param default_script: {'tool_rounds': [[{'name', 'arguments'}, ...], ...], 'reply': str}. Each tool round
+                           becomes one 'requires_action' step; the reply is posted once all rounds are done.
+    :param api_latency: Seconds added to every HTTP request.
+    :param run_latency: Seconds the "model" takes per run step, before each 'requires_action' or completion.
+
+    Runs support both polling and stream=True (server-sent events). call_counts counts requests per route.
+    """
+
+    def __init__(self, scripts=None, default_script=None, api_latency=0.0, run_latency=0.05, host='127.0.0.1', port=0):
+        self.scripts = scripts or []
+        self.default_script = default_script or {'tool_rounds': [], 'reply': "Done."}
+        self.api_latency = api_latency
+        self.run_latency = run_latency
+        self.call_counts = Counter()
+        self._assistants = {}
+        self._threads = {}
+        self._messages = {}
+        self._runs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.RLock()
+        self._server = ThreadingHTTPServer((host, port), _make_handler(self))
+        self._server.daemon_threads = True
+        self._server_thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._server_thread = threading.Thread(target=self._server.serve_forever, name="fake-openai", daemon=True)
+        self._server_thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _new_id(self, prefix):
+        return f"{prefix}_{next(self._ids)}"
+
+    def _script_for(self, thread_id):
+        text = ''
+        for message in reversed(self._messages[thread_id]):
+            if message['role'] == 'user':
+                text = message['content'][0]['text']['value']
+                break
+        for substring, script in self.scripts:
+            if substring in text:
+                return script
+        return self.default_script
+
+    # Assistants
+
+    def create_assistant(self, body, query):
+        assistant = dict(body, id=self._new_id("asst"), object="assistant", created_at=int(time.time()))
+        with self._lock:
+            self._assistants[assistant['id']] = assistant
+        return 200, assistant
+
+    def retrieve_assistant(self, body, query, assistant_id):
+        assistant = self._assistants.get(assistant_id)
+        return (200, assistant) if assistant else _not_found("assistant", assistant_id)
+
+    def update_assistant(self, body, query, assistant_id):
+        with self._lock:
+            assistant = self._assistants.get(assistant_id)
+            if assistant is None:
+                return _not_found("assistant", assistant_id)
+            assistant.update(body)
+        return 200, assistant
+
+    # Threads and messages
+
+    def create_thread(self, body, query):
+        thread = {'id': self._new_id("thread"), 'object': "thread", 'created_at': int(time.time()), 'metadata': {}}
+        with self._lock:
+            self._threads[thread['id']] = thread
+            self._messages[thread['id']] = []
+        for message in body.get('messages', []):
+            self._add_message(thread['id'], message['role'], message['content'])
+        return 200, thread
+
+    def retrieve_thread(self, body, query, thread_id):
+        thread = self._threads.get(thread_id)
+        return (200, thread) if thread else _not_found("thread", thread_id)
+
+    def delete_thread(self, body, query, thread_id):
+        with self._lock:
+            if self._threads.pop(thread_id, None) is None:
+                return _not_found("thread", thread_id)
+            self._messages.pop(thread_id, None)
+        return 200, {'id': thread_id, 'object': "thread.deleted", 'deleted': True}
+
+    def _add_message(self, thread_id, role, content, run_id=None, assistant_id=None):
+        if isinstance(content, str):
+            content = [{'type': 'text', 'text': {'value': content, 'annotations': []}}]
+        message = {'id': self._new_id("msg"), 'object': "thread.message", 'created_at': int(time.time()),
+                   'thread_id': thread_id, 'role': role, 'content': content, 'run_id': run_id,
+                   'assistant_id': assistant_id, 'status': "completed", 'attachments': [], 'metadata': {}}
+        with self._lock:
+            self._messages[thread_id].append(message)
+        return message
+
+    def create_message(self, body, query, thread_id):
+        if thread_id not in self._threads:
+            return _not_found("thread", thread_id)
+        return 200, self._add_message(thread_id, body['role'], body['content'])
+
+    def list_messages(self, body, query, thread_id):
+        if thread_id not in self._threads:
+            return _not_found("thread", thread_id)
+        with self._lock:
+            messages = list(self._messages[thread_id])
+        if query.get('order', 'desc') == 'desc':
+            messages.reverse()
+        if 'run_id' in query:
+            messages = [message for message in messages if message['run_id'] == query['run_id']]
+        if 'after' in query:
+            ids = [message['id'] for message in messages]
+            messages = messages[ids.index(query['after']) + 1:] if query['after'] in ids else []
+        limit = int(query.get('limit', 20))
+        page = messages[:limit]
+        return 200, {'object': "list", 'data': page, 'first_id': page[0]['id'] if page else None,
+                     'last_id': page[-1]['id'] if page else None, 'has_more': len(messages) > limit}
+
+    # Runs
+
+    def create_run(self, body, query, thread_id):
+        if thread_id not in self._threads:
+            return _not_found("thread", thread_id)
+        if body['assistant_id'] not in self._assistants:
+            return _not_found("assistant", body['assistant_id'])
+        run = {'id': self._new_id("run"), 'object': "thread.run", 'created_at': int(time.time()),
+               'thread_id': thread_id, 'assistant_id': body['assistant_id'], 'status': "queued",
+               'required_action': None, 'last_error': None, 'model': "fake", 'instructions': "",
+               'tools': [], 'metadata': {}}
+        state = {'run': run, 'script': self._script_for(thread_id), 'round': 0, 'ready_at': time.monotonic() + self.run_latency}
+        with self._lock:
+            self._runs[run['id']] = state
+        if body.get('stream'):
+            return 200, self._stream_step(state, first=True)
+        return 200, run
+
+    def retrieve_run(self, body, query, thread_id, run_id):
+        state = self._runs.get(run_id)
+        if state is None:
+            return _not_found("run", run_id)
+        with self._lock:
+            if state['run']['status'] in ("queued", "in_progress") and time.monotonic() >= state['ready_at']:
+                self._advance(state)
+            elif state['run']['status'] == "queued":
+                state['run']['status'] = "in_progress"
+            return 200, dict(state['run'])
+
+    def submit_tool_outputs(self, body, query, thread_id, run_id):
+        state = self._runs.get(run_id)
+        if state is None:
+            return _not_found("run", run_id)
+        with self._lock:
+            run = state['run']
+            if run['status'] != "requires_action":
+                return 400, {'error': {'message': f"Run {run_id} is not waiting for tool outputs.", 'type': "invalid_request_error"}}
+            expected = {call['id'] for call in run['required_action']['submit_tool_outputs']['tool_calls']}
+            submitted = {output['tool_call_id'] for output in body.get('tool_outputs', [])}
+            if expected != submitted:
+                return 400, {'error': {'message': f"Expected outputs for {sorted(expected)}, got {sorted(submitted)}.", 'type': "invalid_request_error"}}
+            run.update(status="queued", required_action=None)
+            state['round'] += 1
+            state['ready_at'] = time.monotonic() + self.run_latency
+        if body.get('stream'):
+            return 200, self._stream_step(state)
+        return 200, dict(run)
+
+    def _advance(self, state):
+        # Called with the (reentrant) lock held, once the run's latency has elapsed.
+        run, script = state['run'], state['script']
+        if state['round'] < len(script['tool_rounds']):
+            tool_calls = [{'id': self._new_id("call"), 'type': "function",
+                           'function': {'name': call['name'], 'arguments': json.dumps(call['arguments'])}}
+                          for call in script['tool_rounds'][state['round']]]
+            run.update(status="requires_action",
+                       required_action={'type': "submit_tool_outputs", 'submit_tool_outputs': {'tool_calls': tool_calls}})
+        else:
+            self._add_message(run['thread_id'], "assistant", script['reply'], run_id=run['id'], assistant_id=run['assistant_id'])
+            run.update(status="completed")
+
+    def _stream_step(self, state, first=False):
+        def events():
+            if first:
+                yield "thread.run.created", dict(state['run'])
+            delay = state['ready_at'] - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            with self._lock:
+                state['run']['status'] = "in_progress"
+                self._advance(state)
+                run = dict(state['run'])
+            yield f"thread.run.{run['status']}", run
+        return events()
+
+    def chat_completion(self, body, query):
+        reply = f"Answer to: {body['messages'][-1]['content']}"
+        time.sleep(self.run_latency)
+        return 200, {'id': self._new_id("chatcmpl"), 'object': "chat.completion", 'created': int(time.time()),
+                     'model': body.get('model', "fake"),
+                     'choices': [{'index': 0, 'finish_reason': "stop",
+                                  'message': {'role': "assistant", 'content': reply}}],
+                     'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}}
+
+
+def _not_found(kind, object_id):
+    return 404, {'error': {'message': f"No {kind} found with id '{object_id}'.", 'type': "invalid_request_error"}}
+
+def _make_handler(server):
+    compiled = [(method, re.compile(pattern + "$"), name) for method, pattern, name in ROUTES]
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body go out in separate writes; without this, delayed ACKs add ~40ms per request.
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def _dispatch(self, method):
+            parsed = urlparse(self.path)
+            path = parsed.path[len("/v1"):] if parsed.path.startswith("/v1") else parsed.path
+            query = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+            length = int(self.headers.get('Content-Length') or 0)
+            body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+
+            if server.api_latency:
+                time.sleep(server.api_latency)
+
+            for route_method, pattern, name in compiled:
+                match = pattern.match(path)
+                if route_method == method and match:
+                    with server._lock:
+                        server.call_counts[f"{method} {name}"] += 1
+                    status, payload = getattr(server, name)(body, query, **match.groupdict())
+                    break
+            else:
+                status, payload = 404, {'error': {'message': f"Unknown route {method} {path}", 'type': "invalid_request_error"}}
+
+            if isinstance(payload, dict):
+                self._send_json(status, payload)
+            else:
+                self._send_events(payload)
+
+        def _send_json(self, status, payload):
+            data = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _send_events(self, events):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            for event, data in events:
+                self.wfile.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode('utf-8'))
+                self.wfile.flush()
+            self.wfile.write(b"event: done\ndata: [DONE]\n\n")
+            self.wfile.flush()
+            self.close_connection = True
+
+        def do_GET(self):
+            self._dispatch("GET")
+
+        def do_POST(self):
+            self._dispatch("POST")
+
+        def do_DELETE(self):
+            self._dispatch("DELETE")
+
+    return Handler
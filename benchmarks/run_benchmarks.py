@@ -0,0 +1,239 @@
+"""
+Offline end-to-end benchmarks for m-agent.
+
+Runs the real pipeline (process_user_request, AsyncRequestEngine and the calendar tools) against in-process
+stand-ins for the OpenAI Assistants API and the Google Calendar v3 API, and prints one JSON object per
+scenario with latency percentiles, throughput and API-call counts.
+
+    python benchmarks/run_benchmarks.py --requests 50 --run-latency 0.05 --output bench.jsonl
+"""
+import argparse
+import asyncio
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+import assistant_registry
+import call_scheduler
+import instrumentation
+import thread_store
+from calendar_package import google_calendar_utils
+from benchmarks.fake_calendar import FakeCalendarServer
+from benchmarks.fake_openai import FakeAssistantsServer
+
+SCENARIOS = ("single_query", "multi_tool", "bulk_scheduling", "concurrent")
+
+
+def load_m_agent():
+    spec = importlib.util.spec_from_file_location("m_agent", os.path.join(REPO_ROOT, "m-agent.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def _window(days_from_now, days):
+    start = (datetime.utcnow() + timedelta(days=days_from_now)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return start.strftime('%Y-%m-%dT%H:%M:%S'), (start + timedelta(days=days)).strftime('%Y-%m-%dT%H:%M:%S')
+
+def _event_arguments(summary, start):
+    return {'event_summary': summary, 'event_location': "Room 1", 'event_description': "benchmark",
+            'start_time': start.isoformat(), 'end_time': (start + timedelta(minutes=30)).isoformat(),
+            'start_time_zone': "UTC", 'end_time_zone': "UTC"}
+
+def build_scripts():
+    """
+    Tool-call scripts for the fake assistant, keyed by a marker in the user's message.
+    """
+    tomorrow = _window(1, 1)
+    first_monday = (datetime.utcnow() + timedelta(days=7 - datetime.utcnow().weekday())).replace(
+        hour=10, minute=0, second=0, microsecond=0)
+    return [
+        ("[single_query]", {
+            'tool_rounds': [[{'name': "list_events", 'arguments': {
+                'calendar_id': "primary", 'max_results': 10, 'start_time': tomorrow[0], 'end_time': tomorrow[1], 'timezone': "UTC"}}]],
+            'reply': "You have a few meetings tomorrow."}),
+        ("[multi_tool]", {
+            'tool_rounds': [
+                [{'name': "list_events", 'arguments': {
+                    'calendar_id': "primary", 'max_results': 50, 'start_time': start, 'end_time': end, 'timezone': "UTC"}}
+                 for start, end in (_window(0, 1), _window(1, 1), _window(7, 7))],
+                [{'name': "add_calendar_event", 'arguments': _event_arguments("Follow-up", first_monday)}],
+            ],
+            'reply': "Checked three ranges and scheduled the follow-up."}),
+        ("[bulk_scheduling]", {
+            'tool_rounds': [[{'name': "add_calendar_events", 'arguments': {
+                'events': [_event_arguments(f"1:1 week {week}", first_monday + timedelta(weeks=week)) for week in range(13)]}}]],
+            'reply': "Scheduled your weekly 1:1s for the quarter."}),
+    ]
+
+def seed_events(calendar, count=200):
+    start = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    calendar.seed("primary", [
+        {'summary': f"Seed event {i}",
+         'start': {'dateTime': (start + timedelta(hours=5 * i)).isoformat() + "+00:00", 'timeZone': "UTC"},
+         'end': {'dateTime': (start + timedelta(hours=5 * i, minutes=45)).isoformat() + "+00:00", 'timeZone': "UTC"}}
+        for i in range(count)])
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+class BenchmarkEnvironment:
+    """
+    Starts both fake servers and points a freshly loaded m-agent module at them, inside a temporary directory.
+    """
+
+    def __init__(self, run_latency, api_latency, stream):
+        self.run_latency = run_latency
+        self.api_latency = api_latency
+        self.stream = stream
+
+    def __enter__(self):
+        from googleapiclient.discovery import build_from_document
+        from openai import AsyncOpenAI, OpenAI
+        import httplib2
+
+        self._previous_cwd = os.getcwd()
+        self._tmpdir = tempfile.TemporaryDirectory(prefix="m-agent-bench-")
+        os.chdir(self._tmpdir.name)
+
+        self.openai_server = FakeAssistantsServer(scripts=build_scripts(), run_latency=self.run_latency,
+                                                  api_latency=self.api_latency).start()
+        self.calendar_server = FakeCalendarServer(api_latency=self.api_latency).start()
+        seed_events(self.calendar_server)
+
+        self.m_agent = load_m_agent()
+        self.m_agent._config_data = {'openai_api_key': "benchmark", 'timezone': "UTC"}
+        self.client = OpenAI(api_key="benchmark", base_url=self.openai_server.base_url, max_retries=0)
+        self.async_client = AsyncOpenAI(api_key="benchmark", base_url=self.openai_server.base_url, max_retries=0)
+        self.m_agent._client = self.client
+        self.m_agent._async_client = self.async_client
+
+        document = self.calendar_server.discovery_document(google_calendar_utils.get_discovery_document())
+        # Unauthorized clients pointed at the fake server, pooled the way the tool functions use them.
+        google_calendar_utils.set_service_pool(google_calendar_utils.ServicePool(
+            lambda: build_from_document(document, http=httplib2.Http())))
+        google_calendar_utils._event_caches.clear()
+        thread_store.set_thread_store(thread_store.InMemoryThreadStore())
+        # A registry left over from an earlier environment would point at assistants the new fake server doesn't know.
+        assistant_registry.set_assistant_registry(assistant_registry.SQLiteAssistantRegistry(os.path.join(self._tmpdir.name, "assistants.sqlite3")))
+        # Measure the pipeline, not our own quota.
+        call_scheduler.configure_schedulers({'openai': {'rate': 1e6, 'burst': 1e6}, 'calendar': {'rate': 1e6, 'burst': 1e6}})
+
+        instrumentation.enable_metrics()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        instrumentation.disable_metrics()
+        assistant_registry.set_assistant_registry(None)
+        self.openai_server.stop()
+        self.calendar_server.stop()
+        os.chdir(self._previous_cwd)
+        self._tmpdir.cleanup()
+        return False
+
+    def snapshot_counts(self):
+        return dict(self.openai_server.call_counts), dict(self.calendar_server.call_counts)
+
+
+def _diff(after, before):
+    return {key: value - before.get(key, 0) for key, value in after.items() if value - before.get(key, 0)}
+
+def run_scenario(env, scenario, requests, concurrency):
+    m_agent = env.m_agent
+    instrumentation.registry.reset()
+    openai_before, calendar_before = env.snapshot_counts()
+    latencies = []
+    errors = 0
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if scenario == "concurrent":
+            engine = m_agent.AsyncRequestEngine(env.async_client, list_tools=m_agent.user_proxy_list_tools,
+                                                timezone_config="UTC", max_concurrency=concurrency, stream=env.stream)
+
+            async def timed(user_input, lookup_id):
+                request_started = time.perf_counter()
+                response = await engine.process_user_request(user_input, lookup_id)
+                latencies.append(time.perf_counter() - request_started)
+                return response
+
+            async def run_all():
+                return await asyncio.gather(*(timed(f"[single_query] request {i}", f"bench-{i % concurrency}")
+                                              for i in range(requests)))
+
+            responses = asyncio.run(run_all())
+            errors = sum(response is None for response in responses)
+        else:
+            for i in range(requests):
+                request_started = time.perf_counter()
+                response = m_agent.process_user_request(env.client, f"[{scenario}] request {i}", None,
+                                                        m_agent.user_proxy_list_tools, f"{scenario}-{i % 10}",
+                                                        "UTC", stream=env.stream)
+                latencies.append(time.perf_counter() - request_started)
+                errors += response is None
+    elapsed = time.perf_counter() - started
+
+    openai_after, calendar_after = env.snapshot_counts()
+    counters = {(counter['name'], tuple(sorted(counter['labels'].items()))): counter['value']
+                for counter in instrumentation.registry.snapshot()['counters']}
+    latencies.sort()
+    return {
+        'scenario': scenario,
+        'stream': env.stream,
+        'requests': requests,
+        'concurrency': concurrency if scenario == "concurrent" else 1,
+        'errors': errors,
+        'latency_ms': {
+            'p50': percentile(latencies, 0.50) * 1000,
+            'p95': percentile(latencies, 0.95) * 1000,
+            'p99': percentile(latencies, 0.99) * 1000,
+            'mean': sum(latencies) / len(latencies) * 1000,
+            'max': latencies[-1] * 1000,
+        },
+        'requests_per_sec': requests / elapsed if elapsed else None,
+        'poll_iterations': counters.get(("poll_iterations", ()), 0),
+        'openai_calls': _diff(openai_after, openai_before),
+        'calendar_calls': _diff(calendar_after, calendar_before),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS,
+                        help="Scenario to run (repeatable); all scenarios by default.")
+    parser.add_argument('--requests', type=int, default=20, help="Requests per scenario.")
+    parser.add_argument('--concurrency', type=int, default=50, help="Concurrent lookup ids for the 'concurrent' scenario.")
+    parser.add_argument('--run-latency', type=float, default=0.05, help="Seconds the fake model spends per run step.")
+    parser.add_argument('--api-latency', type=float, default=0.0, help="Seconds added to every fake API request.")
+    parser.add_argument('--poll', action='store_true', help="Drive runs by polling instead of streaming.")
+    parser.add_argument('--output', help="Append results to this JSON-lines file as well as printing them.")
+    args = parser.parse_args(argv)
+
+    results = []
+    with BenchmarkEnvironment(args.run_latency, args.api_latency, stream=not args.poll) as env:
+        for scenario in args.scenario or SCENARIOS:
+            result = run_scenario(env, scenario, args.requests, args.concurrency)
+            results.append(result)
+            print(json.dumps(result))
+
+    if args.output:
+        with open(args.output, 'a') as output_file:
+            for result in results:
+                output_file.write(json.dumps(result) + '\n')
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,2 @@
-from .google_calendar_utils import list_events, add_calendar_event, update_or_cancel_event, get_calendar_service
\ No newline at end of file
+from .google_calendar_utils import list_events, iter_events, add_calendar_event, update_or_cancel_event, get_calendar_service, add_calendar_events, update_or_cancel_events, batch_calendar_mutations, checkout_service, set_service_pool, find_free_slots
+from .service_pool import ServicePool
@@ -0,0 +1,219 @@
+import bisect
+import itertools
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from urllib.parse import quote
+import pytz
+from call_scheduler import call_api
+
+EVENT_CACHE_DIR = 'event_cache'
+DEFAULT_MIN_SYNC_INTERVAL = 30  # seconds between incremental syncs
+SYNC_PAGE_SIZE = 2500  # the API maximum
+# The event fields the cache keeps: what list_events shows, plus what free/busy needs to tell if an event
+# blocks time. Only the user's own attendee entry is kept.
+SYNC_EVENT_KEYS = ('id', 'status', 'summary', 'location', 'start', 'end', 'htmlLink', 'recurringEventId', 'transparency',
+                   'attendees')
+SYNC_FIELDS = ('nextPageToken,nextSyncToken,timeZone,items(id,status,summary,location,start,end,htmlLink,'
+               'recurringEventId,transparency,attendees(self,responseStatus))')
+
+
+def event_bounds(event, time_zone='UTC'):
+    """
+    Returns the (start, end) of an event as POSIX timestamps.
+
+    All-day events only carry a date; they are placed at midnight in the event's timeZone, or else in
+    time_zone, which should be the calendar's time zone (the 'timeZone' of an events list response).
+    """
+    return _event_time(event['start'], time_zone), _event_time(event['end'], time_zone)
+
+def _event_time(event_time, time_zone):
+    if 'dateTime' in event_time:
+        return datetime.fromisoformat(event_time['dateTime']).timestamp()
+    tz = pytz.timezone(event_time.get('timeZone') or time_zone)
+    return tz.localize(datetime.fromisoformat(event_time['date'])).timestamp()
+
+
+def trim_event(event):
+    """
+    Drops what the cache doesn't keep from an event (see SYNC_EVENT_KEYS), e.g. a full insert response.
+    """
+    event = {key: event[key] for key in SYNC_EVENT_KEYS if key in event}
+    if 'attendees' in event:
+        event['attendees'] = [{key: attendee[key] for key in ('self', 'responseStatus') if key in attendee}
+                              for attendee in event['attendees'] if attendee.get('self')]
+        if not event['attendees']:
+            del event['attendees']
+    return event
+
+
+class EventCache:
+    """
+    Local copy of one calendar's events, kept current with the Calendar API's incremental sync.
+
+    The first sync fetches every event; later syncs pass the stored syncToken and only receive what changed.
+    Events are indexed by start time, so a range query is a bisect plus a short scan; all-day events are
+    placed in the calendar's time zone, as the API does. The events and the syncToken are saved to disk, so a
+    restart resumes with an incremental sync instead of a full one.
+    """
+
+    def __init__(self, calendar_id, path=None, min_sync_interval=DEFAULT_MIN_SYNC_INTERVAL):
+        self.calendar_id = calendar_id
+        self.path = path or os.path.join(EVENT_CACHE_DIR, quote(calendar_id, safe='') + '.json')
+        self.min_sync_interval = min_sync_interval
+        self.sync_token = None
+        self.time_zone = 'UTC'
+        self._events = {}
+        self._bounds = {}  # event_id -> (start, end)
+        self._index = []  # sorted (start, end, event_id)
+        self._max_duration = 0
+        self._last_sync = None
+        self._lock = threading.RLock()
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as cache_file:
+                data = json.load(cache_file)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable event cache {self.path}: {e}")
+            return
+        with self._lock:
+            self._reset()
+            self.sync_token = data.get('sync_token')
+            self.time_zone = data.get('time_zone') or 'UTC'
+            for event in data.get('events', []):
+                self._upsert(event)
+
+    def save(self):
+        with self._lock:
+            data = {'calendar_id': self.calendar_id, 'sync_token': self.sync_token, 'time_zone': self.time_zone,
+                    'events': list(self._events.values())}
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as cache_file:
+            json.dump(data, cache_file)
+        os.replace(tmp_path, self.path)
+
+    def sync(self, service, force=False):
+        """
+        Brings the cache up to date, at most once per min_sync_interval unless forced.
+        """
+        with self._lock:
+            if not force and self.sync_token and self._last_sync is not None \
+                    and time.monotonic() - self._last_sync < self.min_sync_interval:
+                return
+
+            try:
+                changed = self._sync_pages(service)
+            except Exception as e:
+                # 410 Gone: the sync token expired, start over with a full sync.
+                if getattr(getattr(e, 'resp', None), 'status', None) != 410:
+                    raise
+                print(f"Sync token for calendar '{self.calendar_id}' expired, running a full sync.")
+                self.sync_token = None
+                changed = self._sync_pages(service)
+
+            self._last_sync = time.monotonic()
+            if changed:
+                self.save()
+
+    def _sync_pages(self, service):
+        params = {'calendarId': self.calendar_id, 'singleEvents': True, 'maxResults': SYNC_PAGE_SIZE, 'fields': SYNC_FIELDS}
+        full_sync = not self.sync_token
+        if full_sync:
+            # A full sync replaces everything; keep the old state in case it fails part-way.
+            previous = (self._events, self._bounds, self._index, self._max_duration)
+            self._reset()
+        else:
+            params['syncToken'] = self.sync_token
+
+        changed = full_sync
+        page_token = None
+        try:
+            while True:
+                response = call_api("calendar", "events.list", service.events().list(pageToken=page_token, **params).execute,
+                                    labels={'sync': 'full' if full_sync else 'incremental'})
+                if response.get('timeZone') and response['timeZone'] != self.time_zone:
+                    self.set_time_zone(response['timeZone'])
+                    changed = True
+                for event in response.get('items', []):
+                    self.apply(event)
+                    changed = True
+                page_token = response.get('nextPageToken')
+                if not page_token:
+                    self.sync_token = response.get('nextSyncToken')
+                    return changed
+        except Exception:
+            if full_sync:
+                self._events, self._bounds, self._index, self._max_duration = previous
+            raise
+
+    def _reset(self):
+        self._events = {}
+        self._bounds = {}
+        self._index = []
+        self._max_duration = 0
+
+    def set_time_zone(self, time_zone):
+        """
+        Sets the calendar's time zone and re-places the all-day events in it.
+        """
+        with self._lock:
+            self.time_zone = time_zone
+            events = list(self._events.values())
+            self._reset()
+            for event in events:
+                self._upsert(event)
+
+    def apply(self, event):
+        """
+        Applies one event resource as returned by the API: cancelled events are removed, others upserted.
+        """
+        with self._lock:
+            if event.get('status') == 'cancelled':
+                self._remove(event['id'])
+            elif 'start' in event and 'end' in event:
+                self._upsert(event)
+
+    def remove(self, event_id):
+        with self._lock:
+            self._remove(event_id)
+
+    def _upsert(self, event):
+        event = trim_event(event)
+        self._remove(event['id'])
+        start, end = event_bounds(event, self.time_zone)
+        self._events[event['id']] = event
+        self._bounds[event['id']] = (start, end)
+        bisect.insort(self._index, (start, end, event['id']))
+        self._max_duration = max(self._max_duration, end - start)
+
+    def _remove(self, event_id):
+        if self._events.pop(event_id, None) is None:
+            return
+        entry = (*self._bounds.pop(event_id), event_id)
+        position = bisect.bisect_left(self._index, entry)
+        if position < len(self._index) and self._index[position] == entry:
+            del self._index[position]
+
+    def query(self, time_min, time_max, max_results=None):
+        """
+        Returns the events overlapping [time_min, time_max) (POSIX timestamps), ordered by start time.
+        """
+        with self._lock:
+            # No event starting before time_min - max_duration can still be running at time_min.
+            position = bisect.bisect_left(self._index, (time_min - self._max_duration,))
+            results = []
+            for start, end, event_id in itertools.islice(self._index, position, None):
+                if start >= time_max:
+                    break
+                if end > time_min or start >= time_min:
+                    results.append(self._events[event_id])
+                    if max_results and len(results) >= max_results:
+                        break
+            return results
@@ -0,0 +1,113 @@
+from datetime import date, datetime
+from tool_output import longest_fitting_prefix
+
+
+def _local_start_end(event, tz):
+    """
+    Returns (start, end, all_day) with start and end as datetimes in tz, or as dates for all-day events.
+    """
+    if 'date' in event['start']:
+        return date.fromisoformat(event['start']['date']), date.fromisoformat(event['end']['date']), True
+    start = datetime.fromisoformat(event['start']['dateTime']).astimezone(tz)
+    end = datetime.fromisoformat(event['end']['dateTime']).astimezone(tz)
+    return start, end, False
+
+def _day_offset(value, anchor):
+    day = value if not isinstance(value, datetime) else value.date()
+    return (day - anchor).days
+
+def _format_offsets(offsets):
+    """
+    [0, 1, 2, 3] -> '+0..+3'; [0, 7, 14] -> '+0..+14 every 7d'; otherwise a comma-separated list.
+    """
+    if len(offsets) >= 3:
+        steps = {b - a for a, b in zip(offsets, offsets[1:])}
+        if len(steps) == 1:
+            step = steps.pop()
+            return f"{offsets[0]:+d}..{offsets[-1]:+d}" + (f" every {step}d" if step > 1 else "")
+    return ','.join(f"{offset:+d}" for offset in offsets)
+
+def _group_key(event, start, end, all_day):
+    # Instances of one series that keep the series' time and title collapse into a single row.
+    series = event.get('recurringEventId')
+    if not series:
+        return ('event', event.get('id'))
+    if all_day:
+        return ('series', series, event.get('summary'), (end - start).days)
+    return ('series', series, event.get('summary'), start.time(), end - start)
+
+def _row_time(start, end, all_day, anchor):
+    if all_day:
+        days = (end - start).days
+        return "all day" if days <= 1 else f"all day, {days} days"
+    if start.date() == end.date():
+        return f"{start:%H:%M}-{end:%H:%M}"
+    return f"{start:%H:%M}-{_day_offset(end, anchor):+d} {end:%H:%M}"
+
+def event_rows(events, tz, anchor):
+    """
+    Builds one compact row per event, with recurring instances that share time and title folded together.
+    """
+    groups = {}
+    for event in events:
+        start, end, all_day = _local_start_end(event, tz)
+        key = _group_key(event, start, end, all_day)
+        group = groups.get(key)
+        if group is None:
+            groups[key] = {'event': event, 'start': start, 'end': end, 'all_day': all_day,
+                           'offsets': [_day_offset(start, anchor)]}
+        else:
+            group['offsets'].append(_day_offset(start, anchor))
+
+    rows = []
+    for group in groups.values():
+        event, start = group['event'], group['start']
+        row = f"{group['offsets'][0]:+d} {start:%a} {_row_time(start, group['end'], group['all_day'], anchor)} {event.get('summary', '(no title)')}"
+        if event.get('location'):
+            row += f" @ {event['location']}"
+        if len(group['offsets']) > 1:
+            row += f" x{len(group['offsets'])} on {_format_offsets(group['offsets'])} series={event['recurringEventId']}"
+        else:
+            row += f" id={event.get('id')}"
+        rows.append(row)
+    return rows
+
+def format_event_table(events, tz, anchor, budget_tokens):
+    """
+    Renders events as a compact table that fits the token budget.
+
+    :param events: Events ordered by start time.
+    :param tz: pytz timezone all times are shown in.
+    :param anchor: The date row offsets count from (+0 is the anchor, +1 the day after).
+    :param budget_tokens: Upper bound for the estimated size of the table.
+    :return: (table, shown) where shown is how many leading events the table covers.
+
+    Only a prefix of the events is rendered, so a caller can resume right after the last one shown.
+    """
+    def render(count):
+        header = f"{count} events; times in {tz.zone}; +N = days after {anchor:%a %Y-%m-%d}"
+        return '\n'.join([header] + event_rows(events[:count], tz, anchor))
+
+    shown = longest_fitting_prefix(len(events), render, budget_tokens)
+    return render(shown), shown
+
+def format_event_list(events, tz):
+    """
+    Renders events for a person to read: one line per event with its day, time, title and location,
+    without the ids and day offsets of the table meant for the assistant.
+    """
+    lines = []
+    for event in events:
+        start, end, all_day = _local_start_end(event, tz)
+        if all_day:
+            days = (end - start).days
+            when = f"{start:%a %b %d}, all day" + (f" ({days} days)" if days > 1 else "")
+        elif start.date() == end.date():
+            when = f"{start:%a %b %d}, {start:%H:%M}-{end:%H:%M}"
+        else:
+            when = f"{start:%a %b %d}, {start:%H:%M} to {end:%a %b %d} {end:%H:%M}"
+        line = f"- {when}: {event.get('summary', '(no title)')}"
+        if event.get('location'):
+            line += f" ({event['location']})"
+        lines.append(line)
+    return '\n'.join(lines)
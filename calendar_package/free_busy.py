@@ -0,0 +1,104 @@
+import math
+from datetime import datetime, time, timedelta
+
+
+class IntervalTree:
+    """
+    Static interval tree over busy blocks (start, end, label), with start and end as POSIX timestamps.
+
+    The blocks are kept sorted by start and read as an implicit balanced tree (the middle block of a range is
+    its root), with each subtree's latest end stored alongside. An overlap query skips every subtree that ends
+    before the queried range, so it costs O(log n + k) for k results.
+    """
+
+    def __init__(self, blocks):
+        self._blocks = sorted(blocks, key=lambda block: (block[0], block[1]))
+        self._max_end = [0.0] * len(self._blocks)
+        self._build(0, len(self._blocks))
+
+    def __len__(self):
+        return len(self._blocks)
+
+    def _build(self, low, high):
+        if low >= high:
+            return float('-inf')
+        middle = (low + high) // 2
+        self._max_end[middle] = max(self._blocks[middle][1], self._build(low, middle), self._build(middle + 1, high))
+        return self._max_end[middle]
+
+    def overlapping(self, start, end):
+        """
+        Returns the blocks overlapping [start, end), ordered by start.
+        """
+        results = []
+        self._collect(0, len(self._blocks), start, end, results)
+        return results
+
+    def _collect(self, low, high, start, end, results):
+        if low >= high:
+            return
+        middle = (low + high) // 2
+        if self._max_end[middle] <= start:
+            return
+        self._collect(low, middle, start, end, results)
+        block = self._blocks[middle]
+        if block[0] < end:
+            if block[1] > start:
+                results.append(block)
+            # Blocks to the right start even later, so they can only overlap if this one starts before 'end'.
+            self._collect(middle + 1, high, start, end, results)
+
+    def free_gaps(self, start, end):
+        """
+        Yields the (gap_start, gap_end) stretches of [start, end) not covered by any block.
+        """
+        cursor = start
+        for block_start, block_end, _ in self.overlapping(start, end):
+            if block_start > cursor:
+                yield cursor, block_start
+            cursor = max(cursor, block_end)
+        if cursor < end:
+            yield cursor, end
+
+
+def search_windows(time_min, time_max, tz, day_start=None, day_end=None, include_weekends=True):
+    """
+    Splits [time_min, time_max) (aware datetimes) into the windows a slot may fall in, as timestamp pairs.
+
+    :param day_start: Local time of day windows open (datetime.time), or None for midnight.
+    :param day_end: Local time of day windows close, or None for the end of the day.
+    :param include_weekends: Whether Saturdays and Sundays get a window.
+    """
+    windows = []
+    day = time_min.astimezone(tz).date()
+    last_day = time_max.astimezone(tz).date()
+    while day <= last_day:
+        if include_weekends or day.weekday() < 5:
+            # Localized per day, so the windows follow daylight saving changes.
+            opens = tz.localize(datetime.combine(day, day_start or time.min))
+            closes = tz.localize(datetime.combine(day, day_end)) if day_end else tz.localize(
+                datetime.combine(day + timedelta(days=1), time.min))
+            start, end = max(opens, time_min).timestamp(), min(closes, time_max).timestamp()
+            if start < end:
+                windows.append((start, end))
+        day += timedelta(days=1)
+    return windows
+
+def free_slots(tree, windows, duration, step=None, max_results=None):
+    """
+    Returns the first free stretch of each gap that can hold 'duration' seconds, as (slot_start, gap_end).
+
+    :param tree: IntervalTree of the busy blocks.
+    :param windows: Timestamp pairs from search_windows, in order.
+    :param step: If set, slots start on a multiple of this many seconds (e.g. 900 for quarter hours).
+    :param max_results: Stop after this many slots.
+    """
+    slots = []
+    for window_start, window_end in windows:
+        for gap_start, gap_end in tree.free_gaps(window_start, window_end):
+            slot_start = math.ceil(gap_start / step) * step if step else gap_start
+            if slot_start + duration <= gap_end:
+                slots.append((slot_start, gap_end))
+                if max_results and len(slots) >= max_results:
+                    return slots
+    return slots
@@ -1,10 +1,19 @@
+import itertools
+import json
 import os
 import pickle
+import random
+import threading
+import time
+import uuid
 from datetime import datetime, timedelta
 import pytz
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
+from call_scheduler import call_api, error_status
+from tool_output import encode_cursor, decode_cursor
+from .event_cache import EventCache, event_bounds
+from .event_format import format_event_table
+from .free_busy import IntervalTree, search_windows, free_slots
+from .service_pool import ServicePool
 
 # Scopes and OAuth 2.0 Credentials File
 SCOPES = ['https://www.googleapis.com/auth/calendar']
@@ -13,7 +22,28 @@ CALENDAR_ID = 'primary'  # or your calendar ID
 
 
 
-def get_calendar_service():
+# Refresh the OAuth token this long before it expires, off the request path.
+CREDENTIAL_REFRESH_MARGIN = 300
+CREDENTIAL_REFRESH_RETRY_DELAY = 30
+
+_credentials = None
+_credentials_lock = threading.Lock()
+# Reentrant, so a refresh can be started while the lock is already held (see ensure_fresh_credentials).
+credentials_refresh_lock = threading.RLock()
+_service = None
+_service_lock = threading.Lock()
+# Pooled clients for the tool functions; each holds its own HTTP transport, since httplib2 isn't thread-safe.
+SERVICE_POOL_SIZE = 8
+HTTP_TIMEOUT = 60
+_service_pool = None
+_service_pool_lock = threading.Lock()
+_discovery_document = None
+
+
+def load_credentials():
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    from google.auth.transport.requests import Request
+
     creds = None
     # Load the saved credentials if they exist
     if os.path.exists('token.pickle'):
@@ -28,76 +58,457 @@ def get_calendar_service():
             flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_FILE, SCOPES)
             creds = flow.run_local_server(port=0)
         # Save the credentials for the next run
-        with open('token.pickle', 'wb') as token:
-            pickle.dump(creds, token)
+        save_credentials(creds)
+    return creds
 
-    service = build('calendar', 'v3', credentials=creds)
-    return service
+def save_credentials(creds):
+    with open('token.pickle', 'wb') as token:
+        pickle.dump(creds, token)
 
-# Initialize the Google Calendar API client using OAuth
-service = get_calendar_service()
+def get_credentials():
+    """
+    Loads the OAuth credentials on first use and starts refreshing them in the background.
+    """
+    global _credentials
+    if _credentials is None:
+        with _credentials_lock:
+            if _credentials is None:
+                _credentials = load_credentials()
+                threading.Thread(target=_refresh_credentials_forever, name="calendar-credential-refresh",
+                                 daemon=True).start()
+    return _credentials
 
+def refresh_credentials(creds):
+    from google.auth.transport.requests import Request
 
+    with credentials_refresh_lock:
+        creds.refresh(Request())
+        save_credentials(creds)
 
-def format_event_time(event_time_str, timezone_str):
-    # Parse the datetime string and convert it to the specified timezone
-    event_time = datetime.fromisoformat(event_time_str)
-    timezone = pytz.timezone(timezone_str)
-    event_time = event_time.astimezone(timezone)
+def _refresh_credentials_forever():
+    while True:
+        creds = _credentials
+        if creds is None or getattr(creds, 'expiry', None) is None or not getattr(creds, 'refresh_token', None):
+            return
+        # google-auth keeps expiry as a naive UTC datetime.
+        wait = (creds.expiry - datetime.utcnow()).total_seconds() - CREDENTIAL_REFRESH_MARGIN
+        if wait > 0:
+            time.sleep(wait)
+            continue
+        try:
+            refresh_credentials(creds)
+        except Exception as e:
+            print(f"Failed to refresh Google Calendar credentials: {e}")
+            time.sleep(CREDENTIAL_REFRESH_RETRY_DELAY)
 
-    # Format the datetime in the specified format
-    return event_time.strftime('%A, %B %d at %I:%M%p') + f" ({timezone_str})"
+def ensure_fresh_credentials():
+    """
+    Refreshes the shared credentials if they have expired, e.g. after the background refresh failed.
+    Concurrent callers wait for a single refresh instead of each starting their own.
+    """
+    creds = get_credentials()
+    if creds.valid or not getattr(creds, 'refresh_token', None):
+        return
+    with credentials_refresh_lock:
+        if not creds.valid:
+            refresh_credentials(creds)
 
+def get_discovery_document():
+    """
+    The Calendar v3 discovery document bundled with google-api-python-client, parsed once per process.
+    """
+    global _discovery_document
+    if _discovery_document is None:
+        from googleapiclient import discovery_cache
+        _discovery_document = json.loads(discovery_cache.get_static_doc('calendar', 'v3'))
+    return _discovery_document
 
+def get_calendar_service(credentials=None, http=None):
+    """
+    Builds a Calendar API client.
 
-def list_events(calendar_id='primary', max_results=10, start_time=None, end_time=None, timezone='UTC'):
-    # Initialize timezone
-    tz = pytz.timezone(timezone)
+    :param credentials: Credentials to authorize with; defaults to the shared ones.
+    :param http: An already authorized transport to use instead of credentials.
+    """
+    from googleapiclient.discovery import build, build_from_document
 
-    # Set default times if not provided
+    auth = {'http': http} if http is not None else {'credentials': credentials or get_credentials()}
+    try:
+        return build_from_document(get_discovery_document(), **auth)
+    except Exception as e:
+        print(f"Cached discovery document unavailable, building from discovery: {e}")
+        return build('calendar', 'v3', **auth)
+
+def build_pooled_service():
+    """
+    A client with its own persistent connection, authorized with the shared credentials object, so a
+    refresh done through any client (or in the background) is seen by all of them.
+    """
+    import httplib2
+    import google_auth_httplib2
+
+    http = google_auth_httplib2.AuthorizedHttp(get_credentials(), http=httplib2.Http(timeout=HTTP_TIMEOUT))
+    return get_calendar_service(http=http)
+
+def get_service_pool():
+    global _service_pool
+    if _service_pool is None:
+        with _service_pool_lock:
+            if _service_pool is None:
+                _service_pool = ServicePool(build_pooled_service, SERVICE_POOL_SIZE,
+                                            before_checkout=ensure_fresh_credentials)
+    return _service_pool
+
+def set_service_pool(pool):
+    """
+    Replaces the pool the tool functions check clients out of, e.g. to change its size or the client factory.
+    """
+    global _service_pool
+    with _service_pool_lock:
+        _service_pool = pool
+
+def checkout_service():
+    """
+    Lends a Calendar API client to the calling thread: 'with checkout_service() as service: ...'.
+    """
+    return get_service_pool().checkout()
+
+def get_service():
+    """
+    A single Google Calendar API client, created on first use rather than at import.
+
+    Its transport is not thread-safe; code that may run on several threads should use checkout_service().
+    """
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = get_calendar_service()
+    return _service
+
+def __getattr__(name):
+    # Keeps 'google_calendar_utils.service' working without building the client at import.
+    if name == 'service':
+        return get_service()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Answer list_events from a local, incrementally synced copy of each calendar.
+EVENT_CACHE_ENABLED = True
+_event_caches = {}
+_event_caches_lock = threading.Lock()
+
+def get_event_cache(calendar_id):
+    with _event_caches_lock:
+        cache = _event_caches.get(calendar_id)
+        if cache is None:
+            cache = _event_caches[calendar_id] = EventCache(calendar_id)
+        return cache
+
+def write_through(calendar_id, event=None, deleted_event_id=None):
+    """
+    Applies a successful insert/update/delete to the event cache, so it is visible without a sync.
+    """
+    if not EVENT_CACHE_ENABLED:
+        return
+    try:
+        cache = get_event_cache(calendar_id)
+        if deleted_event_id:
+            cache.remove(deleted_event_id)
+        else:
+            cache.apply(event)
+        cache.save()
+    except Exception as e:
+        print(f"Failed to update event cache for calendar '{calendar_id}': {e}")
+
+# events().list paging: at most 2500 per page; the fields mask trims each payload to what m-agent reads.
+DEFAULT_PAGE_SIZE = 250
+EVENT_LIST_FIELDS = 'nextPageToken,items(id,status,summary,location,start,end,htmlLink,recurringEventId)'
+
+def iter_events(calendar_id='primary', start_time=None, end_time=None, max_results=None,
+                page_size=DEFAULT_PAGE_SIZE, fields=EVENT_LIST_FIELDS):
+    """
+    Yields the events between two ISO 8601 datetimes (with UTC offset), ordered by start time.
+
+    :param max_results: Stop after this many events (None for all of them).
+    :param page_size: Events requested per API page.
+    :param fields: The fields mask sent with each page request.
+
+    Served from the event cache after an incremental sync; if the cache fails, pages are fetched from the
+    API lazily, so a consumer that stops early never requests the remaining pages.
+    """
+    if EVENT_CACHE_ENABLED:
+        events = None
+        try:
+            cache = get_event_cache(calendar_id)
+            with checkout_service() as service:
+                cache.sync(service)
+            events = cache.query(datetime.fromisoformat(start_time).timestamp(),
+                                 datetime.fromisoformat(end_time).timestamp(), max_results)
+        except Exception as e:
+            print(f"Event cache unavailable for calendar '{calendar_id}', querying the API: {e}")
+        if events is not None:
+            yield from events
+            return
+
+    remaining = max_results
+    page_token = None
+    while True:
+        page_max = min(page_size, remaining) if remaining is not None else page_size
+        # Checked out per page, so the client isn't held while the consumer works through the events.
+        with checkout_service() as service:
+            response = call_api("calendar", "events.list", service.events().list(
+                calendarId=calendar_id, timeMin=start_time, timeMax=end_time, maxResults=page_max, singleEvents=True,
+                orderBy='startTime', pageToken=page_token, fields=fields).execute)
+        for event in response.get('items', []):
+            yield event
+            if remaining is not None:
+                remaining -= 1
+                if remaining <= 0:
+                    return
+
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            return
+
+def resolve_time_range(start_time, end_time, tz):
+    """
+    Turns list_events' naive 'YYYY-MM-DDTHH:MM:SS' bounds into ISO 8601 strings in tz, defaulting to the next 7 days.
+    """
+    now = datetime.now(tz)
     if start_time is None:
-        start_time = datetime.now(tz).isoformat()
+        start_time = now.isoformat()
     else:
-        start_time = datetime.strptime(start_time, '%Y-%m-%dT%H:%M:%S').replace(tzinfo=tz).isoformat()
+        start_time = tz.localize(datetime.strptime(start_time, '%Y-%m-%dT%H:%M:%S')).isoformat()
 
     if end_time is None:
-        end_time = (datetime.now(tz) + timedelta(days=7)).isoformat()
+        end_time = (now + timedelta(days=7)).isoformat()
+    else:
+        end_time = tz.localize(datetime.strptime(end_time, '%Y-%m-%dT%H:%M:%S')).isoformat()
+    return start_time, end_time
+
+
+
+# Size of list_events' output, kept under the tool-output budget in m-agent.py so it is never cut there.
+LIST_EVENTS_TOKEN_BUDGET = 1200
+
+def list_events(calendar_id='primary', max_results=10, start_time=None, end_time=None, timezone='UTC', cursor=None):
+    """
+    Lists the events in a time range as a compact table (see event_format.format_event_table).
+
+    :param cursor: The cursor printed at the end of a previous, truncated result; it carries that call's
+                   arguments, so the other parameters are ignored when it is given.
+
+    Up to max_results events are listed per call. Rows that don't fit LIST_EVENTS_TOKEN_BUDGET are left out
+    and replaced by an "N more" line with a cursor for the next page.
+    """
+    offset = 0
+    if cursor:
+        try:
+            state = decode_cursor(cursor)
+            calendar_id, start_time, end_time, timezone = state['c'], state['s'], state['e'], state['z']
+            max_results, offset = state['n'], state['o']
+        except (ValueError, KeyError) as e:
+            return f"An error occurred: {e}"
+        tz = pytz.timezone(timezone)
     else:
-        end_time = datetime.strptime(end_time, '%Y-%m-%dT%H:%M:%S').replace(tzinfo=tz).isoformat()
+        # Initialize timezone once for the whole call
+        tz = pytz.timezone(timezone)
+
+        # Set default times if not provided
+        start_time, end_time = resolve_time_range(start_time, end_time, tz)
 
     # Print what the function is querying
     print(f"Querying Google Calendar API for events in calendar '{calendar_id}' from '{start_time}' to '{end_time}' with a maximum of {max_results} results in timezone '{timezone}'.")
 
     try:
-        events_result = service.events().list(calendarId=calendar_id, timeMin=start_time, timeMax=end_time,
-                                              maxResults=max_results, singleEvents=True,
-                                              orderBy='startTime').execute()
-        events = events_result.get('items', [])
+        # One event past the page tells whether more follow.
+        events = list(itertools.islice(iter_events(calendar_id, start_time, end_time, max_results=offset + max_results + 1),
+                                       offset, None))
         if not events:
             return 'No events found in that time span.'
+        page, beyond = events[:max_results], len(events) > max_results
+
+        anchor = datetime.fromisoformat(start_time).astimezone(tz).date()
+        table, shown = format_event_table(page, tz, anchor, LIST_EVENTS_TOKEN_BUDGET)
+        if shown < len(page) or beyond:
+            next_cursor = encode_cursor({'c': calendar_id, 's': start_time, 'e': end_time, 'z': timezone,
+                                         'n': max_results, 'o': offset + shown})
+            more = f"{len(page) - shown}{'+' if beyond else ''} more" if shown < len(page) else "More events"
+            table += f"\n{more}; call list_events with cursor={next_cursor} to continue."
+        print(table)
+        return table
+    except Exception as e:
+        return f"An error occurred: {e}"
+
+
+# Free/busy: blocks come from the event cache for calendars whose events we can read, and from the freeBusy
+# API otherwise (e.g. colleagues' calendars shared as free/busy only).
+FREEBUSY_MAX_CALENDARS = 50  # calendars per freeBusy query
+FREE_SLOT_STEP_MINUTES = 15
+FIND_FREE_SLOTS_MAX_RESULTS = 5
+_freebusy_only = set()
+
+def is_busy(event):
+    """
+    Whether an event blocks its time: not cancelled, not marked as free, and not declined by the user.
+    """
+    if event.get('status') == 'cancelled' or event.get('transparency') == 'transparent':
+        return False
+    return not any(attendee.get('self') and attendee.get('responseStatus') == 'declined'
+                   for attendee in event.get('attendees', []))
 
-        event_details = []
-        for event in events:
-            start = event['start'].get('dateTime', event['start'].get('date'))
-            end = event['end'].get('dateTime', event['end'].get('date'))
+def busy_blocks(calendar_ids, time_min, time_max):
+    """
+    Collects the busy blocks of several calendars between two aware datetimes.
+
+    :return: (blocks, unavailable) where blocks are (start, end, label) tuples with POSIX timestamps, and
+             unavailable maps each calendar whose free/busy could not be read to the reason.
+    """
+    blocks, remote, unavailable = [], [], {}
+    for calendar_id in calendar_ids:
+        if not EVENT_CACHE_ENABLED or calendar_id in _freebusy_only:
+            remote.append(calendar_id)
+            continue
+        try:
+            cache = get_event_cache(calendar_id)
+            with checkout_service() as service:
+                cache.sync(service)
+        except Exception as e:
+            if error_status(e) in (403, 404):
+                # We may only see this calendar's free/busy; don't try to list its events again.
+                _freebusy_only.add(calendar_id)
+            else:
+                print(f"Event cache unavailable for calendar '{calendar_id}', querying free/busy: {e}")
+            remote.append(calendar_id)
+            continue
+        for event in cache.query(time_min.timestamp(), time_max.timestamp()):
+            if is_busy(event):
+                blocks.append((*event_bounds(event, cache.time_zone), f"{event.get('summary', '(no title)')} on {calendar_id} id={event['id']}"))
 
-            start_formatted = format_event_time(start, event['start'].get('timeZone', timezone))
-            end_formatted = format_event_time(end, event['end'].get('timeZone', timezone))
-            print(f"{start_formatted} to {end_formatted} - {event['summary']}")
+    for chunk_start in range(0, len(remote), FREEBUSY_MAX_CALENDARS):
+        chunk = remote[chunk_start:chunk_start + FREEBUSY_MAX_CALENDARS]
+        body = {'timeMin': time_min.isoformat(), 'timeMax': time_max.isoformat(), 'items': [{'id': calendar_id} for calendar_id in chunk]}
+        with checkout_service() as service:
+            response = call_api("calendar", "freebusy.query", service.freebusy().query(body=body).execute)
+        for calendar_id in chunk:
+            entry = response.get('calendars', {}).get(calendar_id)
+            if entry is None or entry.get('errors'):
+                unavailable[calendar_id] = ', '.join(error.get('reason', 'unknown') for error in (entry or {}).get('errors', [])) or 'missing'
+                continue
+            for busy in entry.get('busy', []):
+                blocks.append((parse_api_time(busy['start']).timestamp(), parse_api_time(busy['end']).timestamp(),
+                               f"busy on {calendar_id}"))
+    return blocks, unavailable
 
-            event_details.append(f"{start} to {end} - {event['summary']}")
+def parse_api_time(value, timezone='UTC'):
+    """
+    Parses an RFC 3339 time; one without an offset is taken to be in timezone.
+    """
+    moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return moment if moment.tzinfo else pytz.timezone(timezone).localize(moment)
+
+def parse_clock(value):
+    return datetime.strptime(value, '%H:%M').time() if value else None
+
+def find_free_slots(duration_minutes, calendar_ids=None, start_time=None, end_time=None, timezone='UTC',
+                    working_hours_start='09:00', working_hours_end='17:00', include_weekends=False,
+                    max_results=FIND_FREE_SLOTS_MAX_RESULTS):
+    """
+    Finds the earliest slots of a given length that are free on every listed calendar.
 
-        return '\n'.join(event_details)
+    :param calendar_ids: The calendars that must all be free; defaults to the primary calendar.
+    :param start_time: 'YYYY-MM-DDTHH:MM:SS' in timezone, like list_events; the search defaults to the next 7 days.
+    :param working_hours_start: Local 'HH:MM' from which slots may start each day; empty to search from midnight.
+    :param working_hours_end: Local 'HH:MM' by which slots must end each day; empty to search until midnight.
+
+    One slot is listed per free gap, with the time the gap ends, so the assistant can offer a later start
+    within it. Slots start on a quarter hour (FREE_SLOT_STEP_MINUTES).
+    """
+    calendar_ids = calendar_ids or [CALENDAR_ID]
+    print(f"Finding free {duration_minutes}-minute slots on {', '.join(calendar_ids)} from '{start_time}' to '{end_time}' in timezone '{timezone}'.")
+    try:
+        tz = pytz.timezone(timezone)
+        start_time, end_time = resolve_time_range(start_time, end_time, tz)
+        time_min, time_max = datetime.fromisoformat(start_time), datetime.fromisoformat(end_time)
+        windows = search_windows(time_min, time_max, tz, parse_clock(working_hours_start), parse_clock(working_hours_end),
+                                 include_weekends)
+        blocks, unavailable = busy_blocks(calendar_ids, time_min, time_max)
+        slots = free_slots(IntervalTree(blocks), windows, duration_minutes * 60, FREE_SLOT_STEP_MINUTES * 60, max_results)
     except Exception as e:
         return f"An error occurred: {e}"
 
+    if slots:
+        lines = [f"Free {duration_minutes}-minute slots on {', '.join(calendar_ids)}; times in {tz.zone}:"]
+        for slot_start, gap_end in slots:
+            start = datetime.fromtimestamp(slot_start, tz)
+            end, gap_end = start + timedelta(minutes=duration_minutes), datetime.fromtimestamp(gap_end, tz)
+            until = f"{gap_end:%H:%M}" if gap_end.date() == start.date() else f"{gap_end:%a %H:%M}"
+            lines.append(f"{start:%a %Y-%m-%d %H:%M}-{end:%H:%M} (free until {until})")
+    else:
+        lines = [f"No free {duration_minutes}-minute slot on {', '.join(calendar_ids)} between {start_time} and {end_time}."]
+    if unavailable:
+        lines.append("Free/busy unknown, not taken into account: "
+                     + ', '.join(f"{calendar_id} ({reason})" for calendar_id, reason in unavailable.items()))
+    return '\n'.join(lines)
+
+def find_conflicts(calendar_id, event):
+    """
+    Returns labels of the busy blocks on the calendar that overlap the event body's time.
+    """
+    start = parse_api_time(event['start']['dateTime'], event['start'].get('timeZone') or 'UTC')
+    end = parse_api_time(event['end']['dateTime'], event['end'].get('timeZone') or 'UTC')
+    blocks, unavailable = busy_blocks([calendar_id], start, end)
+    if unavailable:
+        raise RuntimeError(f"Free/busy of calendar '{calendar_id}' is unavailable: {unavailable[calendar_id]}")
+    return [label for _, _, label in IntervalTree(blocks).overlapping(start.timestamp(), end.timestamp())]
 
 
-def add_calendar_event(event_summary, event_location, event_description, start_time, end_time, start_time_zone, end_time_zone):
+
+def add_calendar_event(event_summary, event_location, event_description, start_time, end_time, start_time_zone, end_time_zone,
+                       check_conflicts=False):
     """
     Adds an event to the Google Calendar.
+
+    :param check_conflicts: If true, the event is only created when its time is free on the calendar;
+                            otherwise the overlapping events are returned instead.
     """
-    event = {
+    event = build_event_body(event_summary, event_location, event_description, start_time, end_time, start_time_zone, end_time_zone)
+    if check_conflicts:
+        try:
+            conflicts = find_conflicts(CALENDAR_ID, event)
+        except Exception as e:
+            return f"An error occurred: {e}"
+        if conflicts:
+            return (f"Event not created, it overlaps: {'; '.join(conflicts)}. "
+                    "Call add_calendar_event with check_conflicts=false to create it anyway.")
+    try:
+        print(f"Created event '{event_summary}' at '{event_location}' starting from {start_time} to {end_time} in time zone {start_time_zone}.")
+        event_result = insert_event(CALENDAR_ID, event)
+        write_through(CALENDAR_ID, event_result)
+        return f"Event created: {event_result.get('htmlLink')}"
+    except Exception as e:
+        return f"An error occurred: {e}"
+
+def insert_event(calendar_id, event):
+    """
+    Inserts an event whose body carries a client-chosen id, so the insert can be retried safely: if an
+    earlier attempt did go through, the retry is rejected as a duplicate (409) and the stored event is returned.
+    """
+    with checkout_service() as service:
+        try:
+            return call_api("calendar", "events.insert", service.events().insert(calendarId=calendar_id, body=event).execute)
+        except Exception as e:
+            if error_status(e) != 409:
+                raise
+            return call_api("calendar", "events.get", service.events().get(calendarId=calendar_id, eventId=event['id']).execute)
+
+def new_event_id():
+    # Event ids may use the characters a-v and 0-9 (base32hex); a hex UUID qualifies.
+    return uuid.uuid4().hex
+
+def build_event_body(event_summary, event_location, event_description, start_time, end_time, start_time_zone, end_time_zone):
+    return {
+        'id': new_event_id(),
         'summary': event_summary,
         'location': event_location,
         'description': event_description,
@@ -110,28 +521,198 @@ def add_calendar_event(event_summary, event_location, event_description, start_t
             'timeZone': end_time_zone,
         },
     }
-    try:
-        print(f"Created event '{event_summary}' at '{event_location}' starting from {start_time} to {end_time} in time zone {start_time_zone}.")
-        event_result = service.events().insert(calendarId=CALENDAR_ID, body=event).execute()
-        return f"Event created: {event_result.get('htmlLink')}"
-    except Exception as e:
-        return f"An error occurred: {e}"
 
 def update_or_cancel_event(calendar_id='primary', event_id=None, update_body=None):
     if update_body:
         try:
-            updated_event = service.events().update(calendarId=calendar_id, eventId=event_id, body=update_body).execute()
+            with checkout_service() as service:
+                updated_event = call_api("calendar", "events.update", service.events().update(
+                    calendarId=calendar_id, eventId=event_id, body=update_body).execute)
+            write_through(calendar_id, updated_event)
             return f"Event updated: {updated_event.get('htmlLink')}"
         except Exception as e:
             return f"An error occurred: {e}"
 
     else:
         try:
-            service.events().delete(calendarId=calendar_id, eventId=event_id).execute()
+            with checkout_service() as service:
+                call_api("calendar", "events.delete", service.events().delete(calendarId=calendar_id, eventId=event_id).execute)
+            write_through(calendar_id, deleted_event_id=event_id)
             return 'Event deleted.'
         except Exception as e:
             return f"An error occurred: {e}"
 
+# The Calendar API accepts at most 50 requests per batch.
+BATCH_MAX_SIZE = 50
+BATCH_MAX_RETRIES = 5
+BATCH_RETRY_BASE_DELAY = 1.0
+# Seconds a batch may spend backing off; kept below m-agent's TOOL_CALL_TIMEOUT (30s), so the tool answers in time.
+BATCH_RETRY_DEADLINE = 20.0
+
+def is_rate_limit_error(exception):
+    status = getattr(getattr(exception, 'resp', None), 'status', None)
+    return status == 429 or (status == 403 and 'ratelimitexceeded' in str(exception).lower())
+
+def batch_calendar_mutations(inserts=None, updates=None, deletes=None, calendar_id=CALENDAR_ID):
+    """
+    Applies many inserts, updates and deletes through the batch HTTP endpoint.
+
+    :param inserts: Event bodies to insert.
+    :param updates: {'event_id', 'update_body'} items, optionally with their own 'calendar_id'.
+    :param deletes: Event IDs, or {'event_id'} items optionally with their own 'calendar_id'.
+    :param calendar_id: The calendar used by items that don't name one.
+    :return: One {'operation', 'event_id', 'event' or 'error'} result per item, inserts first, then updates, then deletes.
+
+    Requests are sent in chunks of BATCH_MAX_SIZE. Items rejected for rate limiting are resent in a later
+    batch with exponential backoff, up to BATCH_MAX_RETRIES times and while the backoff ends within
+    BATCH_RETRY_DEADLINE seconds of the start; items still rate limited after that are reported as errors.
+    Other failures are reported per item. An insert rejected as a duplicate (409) was already applied by an earlier attempt of the same batch, so
+    the stored event is looked up and reported as inserted, as insert_event does.
+    """
+    items = []
+    for body in inserts or []:
+        items.append({'operation': 'insert', 'calendar_id': calendar_id, 'event_id': None, 'body': body})
+    for update in updates or []:
+        items.append({'operation': 'update', 'calendar_id': update.get('calendar_id', calendar_id),
+                      'event_id': update['event_id'], 'body': update['update_body']})
+    for delete in deletes or []:
+        if isinstance(delete, str):
+            delete = {'event_id': delete}
+        items.append({'operation': 'delete', 'calendar_id': delete.get('calendar_id', calendar_id),
+                      'event_id': delete['event_id'], 'body': None})
+
+    results = [None] * len(items)
+    pending = list(range(len(items)))
+    attempt = 0
+    deadline = time.monotonic() + BATCH_RETRY_DEADLINE
+
+    while pending:
+        rate_limited = []
+        duplicates = []
+
+        def callback(request_id, response, exception):
+            index = int(request_id)
+            item = items[index]
+            if exception is None:
+                results[index] = {'operation': item['operation'], 'event_id': (response or {}).get('id', item['event_id']),
+                                  'event': response}
+            elif is_rate_limit_error(exception) and attempt < BATCH_MAX_RETRIES:
+                rate_limited.append(index)
+            elif error_status(exception) == 409 and item['operation'] == 'insert' and item['body'].get('id'):
+                duplicates.append(index)
+            else:
+                results[index] = {'operation': item['operation'], 'event_id': item['event_id'], 'error': str(exception)}
+
+        for chunk_start in range(0, len(pending), BATCH_MAX_SIZE):
+            try:
+                with checkout_service() as service:
+                    batch = service.new_batch_http_request(callback=callback)
+                    for index in pending[chunk_start:chunk_start + BATCH_MAX_SIZE]:
+                        batch.add(build_mutation_request(items[index], service), request_id=str(index))
+                    # Inserts carry their own ids (build_event_body), so resending a batch can't duplicate events.
+                    call_api("calendar", "batch", batch.execute, cost=len(pending[chunk_start:chunk_start + BATCH_MAX_SIZE]))
+            except Exception as e:
+                for index in pending[chunk_start:chunk_start + BATCH_MAX_SIZE]:
+                    if results[index] is None and index not in rate_limited:
+                        results[index] = {'operation': items[index]['operation'], 'event_id': items[index]['event_id'],
+                                          'error': str(e)}
+
+        for index in duplicates:
+            item = items[index]
+            try:
+                with checkout_service() as service:
+                    event = call_api("calendar", "events.get", service.events().get(
+                        calendarId=item['calendar_id'], eventId=item['body']['id']).execute)
+                results[index] = {'operation': 'insert', 'event_id': event.get('id'), 'event': event}
+            except Exception as e:
+                results[index] = {'operation': 'insert', 'event_id': item['body']['id'], 'error': str(e)}
+
+        pending = sorted(rate_limited)
+        if pending:
+            delay = BATCH_RETRY_BASE_DELAY * (2 ** attempt) * (0.5 + random.random())
+            if time.monotonic() + delay > deadline:
+                print(f"{len(pending)} calendar requests were rate limited, giving up: retrying would pass the deadline.")
+                for index in pending:
+                    results[index] = {'operation': items[index]['operation'], 'event_id': items[index]['event_id'],
+                                      'error': "Rate limited; not applied. Retry it later."}
+                break
+            print(f"{len(pending)} calendar requests were rate limited, retrying in {delay:.1f}s.")
+            time.sleep(delay)
+            attempt += 1
+
+    write_through_batch(items, results)
+    return results
+
+def build_mutation_request(item, service):
+    events = service.events()
+    if item['operation'] == 'insert':
+        return events.insert(calendarId=item['calendar_id'], body=item['body'])
+    if item['operation'] == 'update':
+        return events.update(calendarId=item['calendar_id'], eventId=item['event_id'], body=item['body'])
+    return events.delete(calendarId=item['calendar_id'], eventId=item['event_id'])
+
+def write_through_batch(items, results):
+    if not EVENT_CACHE_ENABLED:
+        return
+    touched = set()
+    for item, result in zip(items, results):
+        if 'error' in result:
+            continue
+        try:
+            cache = get_event_cache(item['calendar_id'])
+            if item['operation'] == 'delete':
+                cache.remove(item['event_id'])
+            else:
+                cache.apply(result['event'])
+            touched.add(cache)
+        except Exception as e:
+            print(f"Failed to update event cache for calendar '{item['calendar_id']}': {e}")
+    for cache in touched:
+        cache.save()
+
+def format_mutation_results(results):
+    lines = []
+    for number, result in enumerate(results, start=1):
+        if 'error' in result:
+            lines.append(f"{number}. An error occurred: {result['error']}")
+        elif result['operation'] == 'insert':
+            lines.append(f"{number}. Event created: {result['event'].get('htmlLink')}")
+        elif result['operation'] == 'update':
+            lines.append(f"{number}. Event updated: {result['event'].get('htmlLink')}")
+        else:
+            lines.append(f"{number}. Event deleted.")
+    return '\n'.join(lines)
+
+def add_calendar_events(events):
+    """
+    Adds several events to the Google Calendar in batched requests.
+
+    :param events: A list of dicts with the same fields as add_calendar_event's arguments.
+    """
+    try:
+        bodies = [build_event_body(**event) for event in events]
+        print(f"Creating {len(bodies)} events in batched requests.")
+        return format_mutation_results(batch_calendar_mutations(inserts=bodies))
+    except Exception as e:
+        return f"An error occurred: {e}"
+
+def update_or_cancel_events(changes, calendar_id='primary'):
+    """
+    Updates or cancels several events in batched requests.
+
+    :param changes: A list of {'event_id', 'update_body'} dicts; items without an update_body are cancelled.
+    """
+    updates = [change for change in changes if change.get('update_body')]
+    deletes = [change for change in changes if not change.get('update_body')]
+    try:
+        results = batch_calendar_mutations(updates=updates, deletes=deletes, calendar_id=calendar_id)
+    except Exception as e:
+        return f"An error occurred: {e}"
+    # Report results in the order the changes were given.
+    update_results, delete_results = iter(results[:len(updates)]), iter(results[len(updates):])
+    ordered = [next(update_results) if change.get('update_body') else next(delete_results) for change in changes]
+    return format_mutation_results(ordered)
+
 
 # Example usage
 # list_events()
@@ -0,0 +1,75 @@
+import contextlib
+import queue
+import threading
+from instrumentation import increment
+
+DEFAULT_POOL_SIZE = 8
+DEFAULT_CHECKOUT_TIMEOUT = 60
+
+
+class ServicePool:
+    """
+    A bounded pool of Calendar API clients, each with its own HTTP transport.
+
+    httplib2 transports are not thread-safe, so a client is only used by the thread that checked it out.
+    Each transport keeps its connections open between requests, so a returned client stays warm for the
+    next caller.
+
+    :param factory: Zero-argument callable that builds one client.
+    :param size: The most clients created; once all are checked out, callers wait for one to be returned.
+    :param before_checkout: Optional callable run before a client is handed out, e.g. to refresh shared credentials.
+    :param checkout_timeout: Seconds to wait for a free client before raising TimeoutError.
+    """
+
+    def __init__(self, factory, size=DEFAULT_POOL_SIZE, before_checkout=None, checkout_timeout=DEFAULT_CHECKOUT_TIMEOUT):
+        self.factory = factory
+        self.size = size
+        self.before_checkout = before_checkout
+        self.checkout_timeout = checkout_timeout
+        # LIFO, so the most recently used client (with the warmest connections) goes out first.
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            create = self._created < self.size
+            if create:
+                self._created += 1
+        if create:
+            try:
+                increment("calendar_pool_clients_created")
+                return self.factory()
+            except BaseException:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        increment("calendar_pool_waits")
+        try:
+            return self._idle.get(timeout=self.checkout_timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No Calendar API client became free within {self.checkout_timeout}s.")
+
+    @contextlib.contextmanager
+    def checkout(self):
+        """
+        Lends a client to the calling thread for the duration of the with block.
+        """
+        if self.before_checkout:
+            self.before_checkout()
+        service = self._acquire()
+        try:
+            yield service
+        finally:
+            self._idle.put(service)
+
+    def stats(self):
+        with self._lock:
+            created = self._created
+        return {'size': self.size, 'created': created, 'idle': self._idle.qsize()}
@@ -0,0 +1 @@
+from .call_scheduler import call_api, acall_api, configure_schedulers, get_scheduler, CallScheduler, TokenBucket, CircuitBreaker, CircuitOpenError, error_status, retry_after
@@ -0,0 +1,321 @@
+import asyncio
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from instrumentation import increment
+
+# Requests per second and burst size per API. The Calendar API's default quota is 600 requests per minute
+# per user; size 'openai' to your organization's rate limit. Override with configure_schedulers().
+DEFAULT_LIMITS = {
+    'openai': {'rate': 50.0, 'burst': 100},
+    'calendar': {'rate': 10.0, 'burst': 50},
+}
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BASE_DELAY = 0.5
+DEFAULT_MAX_DELAY = 30.0
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 30.0
+
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+# Statuses that mean the server did not act on the request, so even calls that aren't idempotent can be resent.
+REJECTED_STATUSES = {429}
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling an API that has been failing, until its circuit breaker lets a trial call through.
+    """
+
+
+def error_status(exception):
+    """
+    The HTTP status of an OpenAI (APIStatusError) or Google API client (HttpError) exception, or None.
+    """
+    status = getattr(exception, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(exception, 'resp', None), 'status', None)
+    try:
+        return int(status) if status is not None else None
+    except (TypeError, ValueError):
+        return None
+
+def is_transport_error(exception):
+    """
+    True for failures to reach the API at all: connection errors and timeouts.
+    """
+    if isinstance(exception, (ConnectionError, TimeoutError)):
+        return True
+    try:
+        import openai
+    except ImportError:
+        return False
+    return isinstance(exception, openai.APIConnectionError)
+
+def retry_after(exception):
+    """
+    Seconds the server asked us to wait (Retry-After, or OpenAI's retry-after-ms), or None.
+    """
+    response = getattr(exception, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if headers is None:
+        # httplib2 responses are dicts of lower-cased headers.
+        headers = getattr(exception, 'resp', None)
+    if not hasattr(headers, 'get'):
+        return None
+
+    value = headers.get('retry-after-ms')
+    if value is not None:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get('retry-after')
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    Token bucket shared by every caller of one API: 'rate' tokens per second, holding at most 'capacity'.
+
+    reserve() takes the tokens right away, letting the balance go negative, and returns how long the caller
+    must wait before using them; callers are therefore served in the order they asked.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, tokens=1):
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= min(tokens, self.capacity)
+            return max(-self._tokens / self.rate, 0.0)
+
+    def pause(self, seconds):
+        """
+        Holds back every caller for at least 'seconds', e.g. after the server answered 429.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+class CircuitBreaker:
+    """
+    Stops calls to an API after 'failure_threshold' consecutive server failures.
+
+    While open, calls fail fast with CircuitOpenError. After 'reset_timeout' seconds one trial call is let
+    through (half-open): success closes the breaker, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_timeout=DEFAULT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self, name):
+        with self._lock:
+            if self.state == "closed":
+                return
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            remaining = max(self.reset_timeout - (time.monotonic() - self._opened_at), 0.0)
+        increment("circuit_rejections", api=name)
+        raise CircuitOpenError(f"The {name} API is failing; not calling it for another {remaining:.0f}s.")
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+    def record_neutral(self):
+        # Neither healthy nor failing (e.g. rate limited): only frees the half-open trial slot.
+        with self._lock:
+            self._trial_in_flight = False
+
+
+class CallScheduler:
+    """
+    Runs the outbound calls to one API: rate limited by a shared token bucket, retried with exponential
+    backoff and jitter (or the server's Retry-After), and guarded by a circuit breaker.
+
+    :param name: The API name, used in metrics and errors.
+    :param rate: Calls per second allowed on average.
+    :param burst: Calls allowed at once after a quiet period.
+    :param max_retries: Retries after the first attempt.
+
+    Rate limiting (429), server errors (5xx), timeouts and connection errors are retried for idempotent calls.
+    Calls that are not idempotent (creating messages, runs, ...) are only retried on 429, where the server
+    rejected them without acting.
+    """
+
+    def __init__(self, name, rate, burst, max_retries=DEFAULT_MAX_RETRIES, base_delay=DEFAULT_BASE_DELAY,
+                 max_delay=DEFAULT_MAX_DELAY, failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout=DEFAULT_RESET_TIMEOUT):
+        self.name = name
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+    def _before_attempt(self, operation, cost, labels):
+        self.breaker.before_call(self.name)
+        wait = self.bucket.reserve(cost)
+        if wait > 0:
+            increment("api_throttled", api=self.name, operation=operation)
+        increment("api_calls", api=self.name, operation=operation, **labels)
+        return wait
+
+    def _retry_delay(self, exception, operation, attempt, idempotent):
+        """
+        Records the failure with the breaker and returns the delay before the next attempt, or None to give up.
+        """
+        status = error_status(exception)
+        transport = is_transport_error(exception)
+        if transport or (status is not None and status >= 500):
+            self.breaker.record_failure()
+        elif status == 429:
+            self.breaker.record_neutral()
+        else:
+            # The server answered; the request itself was wrong (4xx) or the error is ours.
+            self.breaker.record_success()
+            return None
+
+        if attempt >= self.max_retries or self.breaker.state == "open":
+            return None
+        if not (transport or status in RETRYABLE_STATUSES):
+            return None
+        if not idempotent and status not in REJECTED_STATUSES:
+            return None
+
+        delay = retry_after(exception)
+        if delay is None:
+            delay = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.5)
+        elif delay > self.max_delay:
+            return None
+        if status == 429:
+            self.bucket.pause(delay)
+        increment("api_retries", api=self.name, operation=operation, reason=str(status) if status else "transport")
+        return delay
+
+    def call(self, operation, function, idempotent=True, cost=1, labels=None):
+        """
+        Calls function() under the rate limit, retrying it as described above.
+
+        :param operation: The API operation, e.g. 'events.list', used in metrics.
+        :param function: Zero-argument callable making the request.
+        :param idempotent: Whether repeating the call is harmless.
+        :param cost: Quota units the call uses, e.g. the number of requests in a batch.
+        :param labels: Extra metric labels for api_calls.
+        """
+        attempt = 0
+        while True:
+            wait = self._before_attempt(operation, cost, labels or {})
+            if wait:
+                time.sleep(wait)
+            try:
+                result = function()
+            except Exception as e:
+                delay = self._retry_delay(e, operation, attempt, idempotent)
+                if delay is None:
+                    raise
+                print(f"{self.name} {operation} failed ({e}), retrying in {delay:.1f}s.")
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            return result
+
+    async def acall(self, operation, function, idempotent=True, cost=1, labels=None):
+        """
+        Async counterpart of call(): function() returns an awaitable, and waits yield to the event loop.
+        """
+        attempt = 0
+        while True:
+            wait = self._before_attempt(operation, cost, labels or {})
+            if wait:
+                await asyncio.sleep(wait)
+            try:
+                result = await function()
+            except Exception as e:
+                delay = self._retry_delay(e, operation, attempt, idempotent)
+                if delay is None:
+                    raise
+                print(f"{self.name} {operation} failed ({e}), retrying in {delay:.1f}s.")
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            return result
+
+
+_schedulers = {}
+_settings = {}
+_schedulers_lock = threading.Lock()
+
+def configure_schedulers(settings):
+    """
+    Overrides scheduler settings per API, e.g. {'openai': {'rate': 20, 'burst': 40, 'max_retries': 3}}.
+    Schedulers are rebuilt with the new settings on next use.
+    """
+    with _schedulers_lock:
+        for name, api_settings in (settings or {}).items():
+            _settings[name] = dict(_settings.get(name, {}), **api_settings)
+            _schedulers.pop(name, None)
+
+def get_scheduler(name):
+    scheduler = _schedulers.get(name)
+    if scheduler is None:
+        with _schedulers_lock:
+            scheduler = _schedulers.get(name)
+            if scheduler is None:
+                settings = dict(DEFAULT_LIMITS.get(name, DEFAULT_LIMITS['openai']), **_settings.get(name, {}))
+                scheduler = _schedulers[name] = CallScheduler(name, **settings)
+    return scheduler
+
+def call_api(api, operation, function, idempotent=True, cost=1, labels=None):
+    """
+    Runs function() through the scheduler of the named API ('openai' or 'calendar'). See CallScheduler.call.
+    """
+    return get_scheduler(api).call(operation, function, idempotent, cost, labels)
+
+async def acall_api(api, operation, function, idempotent=True, cost=1, labels=None):
+    """
+    Async counterpart of call_api.
+    """
+    return await get_scheduler(api).acall(operation, function, idempotent, cost, labels)
@@ -0,0 +1 @@
+from .instrumentation import span, increment, enable_metrics, disable_metrics, metrics_enabled, add_sink, remove_sink, export_prometheus, export_json, registry, MetricsRegistry, JsonLinesSink
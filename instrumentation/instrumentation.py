@@ -0,0 +1,192 @@
+import json
+import os
+import threading
+import time
+
+# Off by default; every span() / increment() call is then a flag check and nothing else.
+_enabled = os.environ.get("M_AGENT_METRICS", "").lower() in ("1", "true", "yes")
+
+# Histogram bucket upper bounds, in seconds.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class MetricsRegistry:
+    """
+    Aggregates counters and span-duration histograms in memory, keyed by name and labels.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name, value, labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {'count': 0, 'sum': 0.0, 'buckets': [0] * len(self.buckets)}
+            histogram['count'] += 1
+            histogram['sum'] += seconds
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram['buckets'][i] += 1
+
+    def snapshot(self):
+        """
+        Returns {'counters': [...], 'spans': [...]} with plain dicts, suitable for json.dumps.
+        """
+        with self._lock:
+            counters = [{'name': name, 'labels': dict(labels), 'value': value}
+                        for (name, labels), value in self._counters.items()]
+            spans = [{'name': name, 'labels': dict(labels), 'count': h['count'], 'sum': h['sum'],
+                      'buckets': dict(zip(self.buckets, h['buckets']))}
+                     for (name, labels), h in self._histograms.items()]
+        return {'counters': counters, 'spans': spans}
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def export_prometheus(self, prefix="m_agent"):
+        """
+        Renders the metrics in the Prometheus text exposition format.
+
+        Counters become '<prefix>_<name>_total'; spans become '<prefix>_<name>_seconds' histograms.
+        """
+        snapshot = self.snapshot()
+        lines = []
+        seen = set()
+        for counter in sorted(snapshot['counters'], key=lambda c: c['name']):
+            metric = f"{prefix}_{counter['name']}_total"
+            if metric not in seen:
+                seen.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{_format_labels(counter['labels'])} {counter['value']}")
+        for span_metric in sorted(snapshot['spans'], key=lambda s: s['name']):
+            metric = f"{prefix}_{span_metric['name']}_seconds"
+            if metric not in seen:
+                seen.add(metric)
+                lines.append(f"# TYPE {metric} histogram")
+            for bound, count in span_metric['buckets'].items():
+                lines.append(f"{metric}_bucket{_format_labels(span_metric['labels'], le=bound)} {count}")
+            lines.append(f"{metric}_bucket{_format_labels(span_metric['labels'], le='+Inf')} {span_metric['count']}")
+            lines.append(f"{metric}_sum{_format_labels(span_metric['labels'])} {span_metric['sum']}")
+            lines.append(f"{metric}_count{_format_labels(span_metric['labels'])} {span_metric['count']}")
+        return '\n'.join(lines) + '\n'
+
+def _format_labels(labels, **extra):
+    labels = dict(labels, **extra)
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+class JsonLinesSink:
+    """
+    Sink that appends every span and counter record to a file as one JSON object per line.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, record):
+        line = json.dumps(record, default=str)
+        with self._lock:
+            with open(self.path, 'a') as sink_file:
+                sink_file.write(line + '\n')
+
+
+registry = MetricsRegistry()
+_sinks = []
+
+
+class _Span:
+    __slots__ = ('name', 'labels', 'start')
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        labels = self.labels
+        if exc_type is not None:
+            labels = dict(labels, error=exc_type.__name__)
+        registry.observe(self.name, duration, labels)
+        _emit({'type': 'span', 'name': self.name, 'labels': labels, 'duration': duration, 'timestamp': time.time()})
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+def _emit(record):
+    for sink in _sinks:
+        try:
+            sink(record)
+        except Exception as e:
+            print(f"Metrics sink {sink!r} failed: {e}")
+
+def span(name, **labels):
+    """
+    Times the enclosed block: 'with span("run_create"): ...'. A no-op while metrics are disabled.
+    """
+    if not _enabled:
+        return _NOOP_SPAN
+    return _Span(name, labels)
+
+def increment(name, value=1, **labels):
+    if not _enabled:
+        return
+    registry.increment(name, value, labels)
+    if _sinks:
+        _emit({'type': 'counter', 'name': name, 'labels': labels, 'value': value, 'timestamp': time.time()})
+
+def enable_metrics():
+    global _enabled
+    _enabled = True
+
+def disable_metrics():
+    global _enabled
+    _enabled = False
+
+def metrics_enabled():
+    return _enabled
+
+def add_sink(sink):
+    """
+    Registers a callable that receives every span and counter record as a dict.
+    """
+    _sinks.append(sink)
+
+def remove_sink(sink):
+    _sinks.remove(sink)
+
+def export_prometheus(prefix="m_agent"):
+    return registry.export_prometheus(prefix)
+
+def export_json():
+    return json.dumps(registry.snapshot())
@@ -0,0 +1 @@
+from .intent_router import IntentRouter, create_default_router, parse_date_range, match_list_events, answer_list_events, BUILTIN_INTENTS, DEFAULT_CONFIDENCE_THRESHOLD
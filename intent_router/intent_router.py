@@ -0,0 +1,224 @@
+import re
+from datetime import date, datetime, timedelta
+import pytz
+from instrumentation import span, increment
+
+DEFAULT_CONFIDENCE_THRESHOLD = 0.8
+FAST_PATH_MAX_RESULTS = 50
+
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+NUMBER_WORDS = {'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6, 'seven': 7, 'ten': 10, 'fourteen': 14}
+
+# Words that may surround a calendar query without changing what is asked.
+FILLER_WORDS = {
+    "what", "what's", "whats", "is", "are", "there", "any", "anything", "do", "does", "i", "have", "got", "on", "in",
+    "for", "my", "me", "the", "a", "show", "list", "tell", "give", "get", "see", "check", "please", "can", "could",
+    "you", "would", "will", "be", "happening", "planned", "scheduled", "up", "coming", "upcoming", "all", "of",
+}
+# Anything that asks for a change goes to the assistant, whatever else the request says.
+MUTATION_WORDS = {
+    "add", "create", "book", "move", "reschedule", "cancel", "delete", "remove", "update", "change",
+    "rename", "invite", "set", "put", "clear", "free", "shift", "push",
+}
+# "schedule" is a noun after these words ("my schedule"), and a request to create something otherwise.
+SCHEDULE_NOUN = re.compile(r"\b(?:my|the|your|whole|full|daily) schedule\b")
+CALENDAR_NOUNS = re.compile(r"\b(?:calendar|schedule|agenda|events?|meetings?|appointments?|plans?)\b")
+# Words that change the meaning of a date range they precede ("until friday", "the week after next").
+DATE_QUALIFIERS = {"next", "last", "this", "following", "previous", "after", "before", "until", "till", "since", "from", "past"}
+# A range noun next to the date makes it part of a longer expression ("the week of 2024-05-06").
+RANGE_NOUNS = {"day", "days", "week", "weeks", "weekend", "weekends", "month", "months", "year", "years"}
+_TOKEN = re.compile(r"[a-z0-9'-]+")
+
+
+class IntentRouter:
+    """
+    Answers simple, deterministic requests locally instead of sending them to the assistant.
+
+    :param confidence_threshold: Matches scoring below this are left to the assistant.
+
+    Intents are registered as a matcher and a handler. matcher(text, now) returns None or
+    {'confidence': float between 0 and 1, 'params': dict}; handler(params, timezone) returns the reply, or None
+    to fall back to the assistant after all.
+    """
+
+    def __init__(self, confidence_threshold=DEFAULT_CONFIDENCE_THRESHOLD):
+        self.confidence_threshold = confidence_threshold
+        self._intents = []
+
+    def register(self, name, matcher, handler):
+        self._intents.append((name, matcher, handler))
+
+    def match(self, text, now):
+        """
+        Returns (name, match, handler) for the highest-scoring intent, or None.
+        """
+        best = None
+        for name, matcher, handler in self._intents:
+            match = matcher(text, now)
+            if match and (best is None or match['confidence'] > best[1]['confidence']):
+                best = (name, match, handler)
+        return best
+
+    def handle(self, text, timezone='UTC'):
+        """
+        Returns a reply for the request if an intent matched with enough confidence and answered it, otherwise None.
+        """
+        tz = pytz.timezone(timezone)
+        best = self.match(text, datetime.now(tz))
+        if best is None:
+            increment("fast_path", intent="none", outcome="no_match")
+            return None
+
+        name, match, handler = best
+        if match['confidence'] < self.confidence_threshold:
+            increment("fast_path", intent=name, outcome="low_confidence")
+            return None
+
+        with span("fast_path", intent=name):
+            response = handler(match['params'], timezone)
+        increment("fast_path", intent=name, outcome="answered" if response is not None else "handler_fallback")
+        return response
+
+
+def normalize_text(text):
+    return text.lower().replace('’', "'").strip()
+
+def parse_date_range(text, today):
+    """
+    Finds a date expression such as 'today', 'next week', 'on friday', 'next 3 days' or '2024-05-01' in text.
+
+    :param today: The current date in the user's timezone.
+    :return: (start_date, end_date, label, (span_start, span_end)) with end_date exclusive, or None.
+    """
+    match = re.search(r"\b(?:the )?day after tomorrow\b", text)
+    if match:
+        start = today + timedelta(days=2)
+        return start, start + timedelta(days=1), f"on {start:%A, %B %d}", match.span()
+
+    match = re.search(r"\b(today|tonight|tomorrow|yesterday)\b", text)
+    if match:
+        offset = {'today': 0, 'tonight': 0, 'tomorrow': 1, 'yesterday': -1}[match.group(1)]
+        start = today + timedelta(days=offset)
+        return start, start + timedelta(days=1), match.group(1), match.span()
+
+    match = re.search(r"\b(this|next) week\b", text)
+    if match:
+        next_monday = today + timedelta(days=7 - today.weekday())
+        if match.group(1) == 'this':
+            return today, next_monday, "this week", match.span()
+        return next_monday, next_monday + timedelta(days=7), "next week", match.span()
+
+    match = re.search(r"\b(?:(this|next) )?weekend\b", text)
+    if match:
+        next_monday = today + timedelta(days=7 - today.weekday())
+        if match.group(1) == 'next':
+            return next_monday + timedelta(days=5), next_monday + timedelta(days=7), "next weekend", match.span()
+        saturday = today + timedelta(days=(5 - today.weekday()) % 7) if today.weekday() != 6 else today
+        return saturday, next_monday, "this weekend", match.span()
+
+    match = re.search(r"\b(this|next) month\b", text)
+    if match:
+        first_of_next = (today.replace(day=1) + timedelta(days=32)).replace(day=1)
+        if match.group(1) == 'this':
+            return today, first_of_next, "this month", match.span()
+        return first_of_next, (first_of_next + timedelta(days=32)).replace(day=1), "next month", match.span()
+
+    match = re.search(r"\b(?:the )?next (\d{1,2}|" + '|'.join(NUMBER_WORDS) + r") days\b", text)
+    if match:
+        days = int(match.group(1)) if match.group(1).isdigit() else NUMBER_WORDS[match.group(1)]
+        return today, today + timedelta(days=days), f"over the next {days} days", match.span()
+
+    match = re.search(r"\b(?:(this|next|on) )?(" + '|'.join(WEEKDAYS) + r")\b", text)
+    if match:
+        days_ahead = (WEEKDAYS.index(match.group(2)) - today.weekday()) % 7
+        if match.group(1) == 'next' and days_ahead == 0:
+            days_ahead = 7
+        start = today + timedelta(days=days_ahead)
+        return start, start + timedelta(days=1), f"on {start:%A, %B %d}", match.span()
+
+    match = re.search(r"\b(\d{4}-\d{2}-\d{2})\b", text)
+    if match:
+        try:
+            start = date.fromisoformat(match.group(1))
+        except ValueError:
+            return None
+        return start, start + timedelta(days=1), f"on {start:%A, %B %d}", match.span()
+
+    return None
+
+def match_list_events(text, now):
+    """
+    Matches requests to see what is on the calendar in a date range, e.g. "what's on my calendar tomorrow?".
+
+    Confidence is the share of words explained by the date range, a calendar noun or filler words, lowered
+    when no calendar noun is present. Requests that mention a change, qualify the date range in a way the
+    parser didn't understand ("until friday", "last weekend", "the week of 2024-05-06"), or hold a second date
+    expression ("the weekend of 2024-05-04") are never matched: only the first date found would be answered.
+    """
+    text = normalize_text(text)
+    words = _TOKEN.findall(text)
+    if not words or MUTATION_WORDS.intersection(words):
+        return None
+    if "schedule" in words and not SCHEDULE_NOUN.search(text):
+        return None
+
+    found = parse_date_range(text, now.date())
+    if found is None:
+        return None
+    start, end, label, (span_start, span_end) = found
+    preceding = _TOKEN.findall(text[:span_start])
+    if preceding and preceding[-1] in DATE_QUALIFIERS:
+        return None
+    following = _TOKEN.findall(text[span_end:])
+    neighbours = preceding[-2:] if preceding[-1:] == ['of'] else preceding[-1:]
+    if RANGE_NOUNS.intersection(neighbours + following[:1]):
+        return None
+
+    remainder = text[:span_start] + ' ' + text[span_end:]
+    if parse_date_range(remainder, now.date()) is not None:
+        return None
+    has_noun = CALENDAR_NOUNS.search(remainder) is not None
+    remainder = CALENDAR_NOUNS.sub(' ', remainder)
+    unexplained = [word for word in _TOKEN.findall(remainder) if word not in FILLER_WORDS]
+
+    confidence = (1.0 if has_noun else 0.85) * (1 - len(unexplained) / len(words))
+    return {'confidence': confidence, 'params': {'start_date': start, 'end_date': end, 'label': label}}
+
+def answer_list_events(params, timezone):
+    """
+    Lists the events in the range for the user, or returns None (falling back to the assistant) if the
+    calendar can't be read.
+    """
+    from calendar_package import iter_events
+    from calendar_package.event_format import format_event_list
+    from calendar_package.google_calendar_utils import resolve_time_range
+
+    tz = pytz.timezone(timezone)
+    start_time, end_time = resolve_time_range(params['start_date'].strftime('%Y-%m-%dT00:00:00'),
+                                              params['end_date'].strftime('%Y-%m-%dT00:00:00'), tz)
+    try:
+        # One event past the limit tells whether the listing is complete.
+        events = list(iter_events('primary', start_time, end_time, max_results=FAST_PATH_MAX_RESULTS + 1))
+    except Exception as e:
+        print(f"Fast path could not read the calendar: {e}")
+        return None
+    if not events:
+        return f"You have nothing on your calendar {params['label']}."
+    listing = format_event_list(events[:FAST_PATH_MAX_RESULTS], tz)
+    if len(events) > FAST_PATH_MAX_RESULTS:
+        listing += "\n... and more. Ask me about a shorter period to see the rest."
+    return f"Here is your calendar {params['label']}:\n{listing}"
+
+BUILTIN_INTENTS = {
+    'list_events': (match_list_events, answer_list_events),
+}
+
+def create_default_router(confidence_threshold=DEFAULT_CONFIDENCE_THRESHOLD, intents=None):
+    """
+    A router with the built-in intents, or only those named in intents.
+    """
+    router = IntentRouter(confidence_threshold)
+    for name in intents if intents is not None else BUILTIN_INTENTS:
+        matcher, handler = BUILTIN_INTENTS[name]
+        router.register(name, matcher, handler)
+    return router
@@ -1,10 +1,22 @@
+import argparse
+import asyncio
+import contextlib
 import json
+import os
 import pytz
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from datetime import datetime
+import threading
 import time
-from openai import OpenAI
-from calendar_package import list_events, add_calendar_event, update_or_cancel_event
-from thread_store import store_thread, check_if_thread_exists
+from calendar_package import list_events, add_calendar_event, update_or_cancel_event, add_calendar_events, update_or_cancel_events, find_free_slots
+from thread_store import store_thread, check_if_thread_exists, replace_thread, record_thread_usage, get_thread_stats, invalidate_cached_thread
+from instrumentation import span, increment
+from call_scheduler import call_api, acall_api, configure_schedulers, error_status
+from response_cache import ResponseCache, cache_key
+from agent_service import AgentService, DEFAULT_MAX_USER_QUEUE
+from tool_output import encode_tool_output, estimate_tokens, read_continuation, DEFAULT_TOKEN_BUDGET
+from intent_router import create_default_router, DEFAULT_CONFIDENCE_THRESHOLD
+from assistant_registry import assistant_registry_key, tools_fingerprint, lookup_assistant, register_assistant, forget_assistant
 
 def read_config_file(file_path):
     """
@@ -31,32 +43,79 @@ def read_config_file(file_path):
     if not openai_api_key or not timezone_config:
         raise ValueError("Required configuration keys ('openai_api_key', 'timezone') are missing.")
 
-    return {'openai_api_key': openai_api_key, 'timezone': timezone_config}
-
-
-config_data = read_config_file('config.json')
-timezone_config = config_data['timezone']
-
-openai_api_key = config_data['openai_api_key']
-client = OpenAI(api_key=openai_api_key)
-
+    return {'openai_api_key': openai_api_key, 'timezone': timezone_config,
+            'thread_rollover': config.get('thread_rollover', {}), 'fast_path': config.get('fast_path', {}),
+            'rate_limits': config.get('rate_limits', {})}
+
+
+CONFIG_FILE = 'config.json'
+
+# Configuration and API clients are created on first use, so importing this module stays cheap.
+_config_data = None
+_client = None
+_async_client = None
+_lazy_init_lock = threading.Lock()
+
+def get_config():
+    global _config_data
+    if _config_data is None:
+        with _lazy_init_lock:
+            if _config_data is None:
+                config = read_config_file(CONFIG_FILE)
+                configure_schedulers(config['rate_limits'])
+                _config_data = config
+    return _config_data
+
+def get_client():
+    global _client
+    if _client is None:
+        from openai import OpenAI
+        api_key = get_config()['openai_api_key']
+        with _lazy_init_lock:
+            if _client is None:
+                # Retries are left to the call scheduler, which shares backoff and rate limits across calls.
+                _client = OpenAI(api_key=api_key, max_retries=0)
+    return _client
+
+def get_async_client():
+    global _async_client
+    if _async_client is None:
+        from openai import AsyncOpenAI
+        api_key = get_config()['openai_api_key']
+        with _lazy_init_lock:
+            if _async_client is None:
+                _async_client = AsyncOpenAI(api_key=api_key, max_retries=0)
+    return _async_client
+
+
+CHAT_SYSTEM_PROMPT = "You are a helpful assistant."
+
+# Answers to repeated general questions are served from cache; the SQLite tier survives restarts.
+CHAT_CACHE_TTL = 24 * 60 * 60
+CHAT_CACHE_MAX_BYTES = 16 * 1024 * 1024
+CHAT_CACHE_DISK_PATH = 'chat_cache.sqlite3'
+
+chat_response_cache = ResponseCache(max_bytes=CHAT_CACHE_MAX_BYTES, ttl=CHAT_CACHE_TTL, disk_path=CHAT_CACHE_DISK_PATH)
 
 def get_chat_response(user_input, model="gpt-4-1106-preview"):
     try:
-        completion = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content":"You are a helpful assistant."},
-                {"role": "user", "content":user_input}
-            ]
-        )
-        chat_response_text = completion.choices[0].message["content"]
-        return chat_response_text
+        key = cache_key(model, CHAT_SYSTEM_PROMPT, user_input)
+        return chat_response_cache.get_or_compute(key, lambda: create_chat_completion(user_input, model))
 
     except Exception as e:
         # API request exceptions
         return f"An error occurred: {str(e)}"
 
+def create_chat_completion(user_input, model):
+    completion = call_api("openai", "chat.completions.create", lambda: get_client().chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": CHAT_SYSTEM_PROMPT},
+            {"role": "user", "content": user_input}
+        ]
+    ))
+    return completion.choices[0].message.content
+
 user_proxy_list_tools=[{"type":"function",
                         "function":{
                             "name": "add_calendar_event",
@@ -71,11 +130,33 @@ user_proxy_list_tools=[{"type":"function",
                                     "end_time": {"type": "string"},
                                     "start_time_zone": {"type": "string"},
                                     "end_time_zone": {"type": "string"},
+                                    "check_conflicts": {"type": "boolean", "description": "Only create the event if its time is free on the calendar; otherwise the overlapping events are returned. Defaults to false."},
                                 },
                                 "required": ["event_summary", "event_location", "event_description", "start_time", "end_time", "start_time_zone", "end_time_zone"],
                             }
                         }
                         },
+                       {"type":"function",
+                        "function": {
+                            "name": "find_free_slots",
+                            "description": "Find the earliest times that are free on all the given calendars, e.g. the first free 30-minute slot this week",
+                            "parameters": {
+                                "type": "object",
+                                "properties": {
+                                    "duration_minutes": {"type": "integer"},
+                                    "calendar_ids": {"type": "array", "items": {"type": "string"}, "description": "Calendars that must all be free; defaults to the primary calendar"},
+                                    "start_time": {"type": "string", "format": "date-time", "description": "Start of the search in ISO 8601 format (YYYY-MM-DDTHH:MM:SS)"},
+                                    "end_time": {"type": "string", "format": "date-time", "description": "End of the search in ISO 8601 format (YYYY-MM-DDTHH:MM:SS)"},
+                                    "timezone": {"type": "string", "description": "Timezone of the search range, working hours and results"},
+                                    "working_hours_start": {"type": "string", "description": "HH:MM from which slots may start each day, default 09:00; empty for any time"},
+                                    "working_hours_end": {"type": "string", "description": "HH:MM by which slots must end each day, default 17:00; empty for any time"},
+                                    "include_weekends": {"type": "boolean"},
+                                    "max_results": {"type": "integer"}
+                                },
+                                "required": ["duration_minutes"]
+                            }
+                        }
+                        },
                        {"type":"function",
                         "function": {
                             "name": "list_events",
@@ -87,7 +168,8 @@ user_proxy_list_tools=[{"type":"function",
                                     "max_results": {"type": "integer"},
                                     "start_time": {"type": "string", "format": "date-time", "description": "Start time in ISO 8601 format (YYYY-MM-DDTHH:MM:SS)"},
                                     "end_time": {"type": "string", "format": "date-time", "description": "End time in ISO 8601 format (YYYY-MM-DDTHH:MM:SS)"},
-                                    "timezone": {"type": "string", "description": "Timezone in which the start and end times are specified"}
+                                    "timezone": {"type": "string", "description": "Timezone in which the start and end times are specified"},
+                                    "cursor": {"type": "string", "description": "Cursor from the end of a truncated list_events result, to fetch the next events. Other arguments are ignored when it is given."}
                                 },
                                 "required": ["calendar_id", "max_results"],
                                 "additionalProperties": True
@@ -109,6 +191,58 @@ user_proxy_list_tools=[{"type":"function",
                             }
                         }
                         },
+                       {"type":"function",
+                        "function":{
+                            "name": "add_calendar_events",
+                            "description": "Add several events to Google Calendar at once, e.g. a recurring series of meetings",
+                            "parameters": {
+                                "type": "object",
+                                "properties": {
+                                    "events": {
+                                        "type": "array",
+                                        "items": {
+                                            "type": "object",
+                                            "properties": {
+                                                "event_summary": {"type": "string"},
+                                                "event_location": {"type": "string"},
+                                                "event_description": {"type": "string"},
+                                                "start_time": {"type": "string"},
+                                                "end_time": {"type": "string"},
+                                                "start_time_zone": {"type": "string"},
+                                                "end_time_zone": {"type": "string"},
+                                            },
+                                            "required": ["event_summary", "event_location", "event_description", "start_time", "end_time", "start_time_zone", "end_time_zone"],
+                                        }
+                                    }
+                                },
+                                "required": ["events"],
+                            }
+                        }
+                        },
+                       {"type":"function",
+                        "function":{
+                            "name": "update_or_cancel_events",
+                            "description": "Update or cancel several events in Google Calendar at once. Changes without an update_body cancel the event",
+                            "parameters": {
+                                "type": "object",
+                                "properties": {
+                                    "calendar_id": {"type": "string"},
+                                    "changes": {
+                                        "type": "array",
+                                        "items": {
+                                            "type": "object",
+                                            "properties": {
+                                                "event_id": {"type": "string"},
+                                                "update_body": {"type": "object"}
+                                            },
+                                            "required": ["event_id"]
+                                        }
+                                    }
+                                },
+                                "required": ["changes"]
+                            }
+                        }
+                        },
                        {"type":"function",
                         "function":{
                             "name": "get_chat_response",
@@ -122,14 +256,45 @@ user_proxy_list_tools=[{"type":"function",
                                 "required": ["user_input"]
                             }
                         }
+                        },
+                       {"type":"function",
+                        "function":{
+                            "name": "read_more_tool_output",
+                            "description": "Read the rest of a tool output that ended with a 'more lines' or 'more characters' marker",
+                            "parameters": {
+                                "type": "object",
+                                "properties": {
+                                    "cursor": {"type": "string", "description": "The cursor from the marker"}
+                                },
+                                "required": ["cursor"]
+                            }
+                        }
                         }]
 
+# Token budget for each tool's output; anything longer is cut with an "N more" marker and a cursor for the rest.
+TOOL_OUTPUT_TOKEN_BUDGETS = {
+    "get_chat_response": 1000,
+}
+
+def read_more_tool_output(cursor):
+    """
+    Returns the part of an earlier tool output that was cut off; it is cut to the budget again if needed.
+    """
+    try:
+        return read_continuation(cursor)
+    except ValueError as e:
+        return f"An error occurred: {e}"
+
 # define dispatch table
 function_dispatch_table = {
     "add_calendar_event" : add_calendar_event,
     "list_events" : list_events,
+    "find_free_slots" : find_free_slots,
     "update_or_cancel_event" : update_or_cancel_event,
-    "get_chat_response" : get_chat_response
+    "add_calendar_events" : add_calendar_events,
+    "update_or_cancel_events" : update_or_cancel_events,
+    "get_chat_response" : get_chat_response,
+    "read_more_tool_output" : read_more_tool_output
 }
 
 
@@ -144,20 +309,21 @@ def create_or_retrieve_thread(user_input, lookup_id, client):
     :return: The thread object.
     """
 
-    thread_id = check_if_thread_exists(lookup_id)
-    thread = None
+    with span("thread_lookup"):
+        thread_id = check_if_thread_exists(lookup_id)
+        thread = None
 
-    if thread_id is None:
-        thread = create_new_thread(lookup_id, client)
-    else:
-        thread = retrieve_existing_thread(thread_id, lookup_id, client)
+        if thread_id is None:
+            thread = create_new_thread(lookup_id, client)
+        else:
+            thread = retrieve_existing_thread(thread_id, lookup_id, client)
 
     return thread
 
 def create_new_thread(lookup_id, client):
     print(f"Creating new thread with lookupId {lookup_id}")
     try:
-        thread = client.beta.threads.create()
+        thread = call_api("openai", "threads.create", lambda: client.beta.threads.create(), idempotent=False)
         store_thread(lookup_id, thread.id)
         return thread
     except Exception as e:
@@ -167,35 +333,204 @@ def create_new_thread(lookup_id, client):
 def retrieve_existing_thread(thread_id, lookup_id, client):
     print(f"Retrieving existing thread with lookupId {lookup_id}")
     try:
-        return client.beta.threads.retrieve(thread_id)
+        return call_api("openai", "threads.retrieve", lambda: client.beta.threads.retrieve(thread_id))
     except Exception as e:
         print(f"Failed to retrieve existing thread ({thread_id}): {e}")
         return None
 
-def add_message_to_thread(thread_id, user_input, client):
+def add_message_to_thread(thread_id, user_input, client, role="user"):
     try:
-        client.beta.threads.messages.create(
-            thread_id=thread_id,
-            role="user",
-            content=user_input
-        )
+        with span("message_add"):
+            call_api("openai", "messages.create", lambda: client.beta.threads.messages.create(
+                thread_id=thread_id,
+                role=role,
+                content=user_input
+            ), idempotent=False)
     except Exception as e:
         print(f"Failed to add message to thread: {e}")
 
 
+# Thread rollover: once a conversation's thread passes a message or token threshold, its history is summarized
+# into a fresh thread, so runs stop re-reading an ever-growing history. The defaults can be overridden with a
+# "thread_rollover" object in config.json, e.g. {"max_messages": 60, "max_tokens": 16000, "keep_messages": 4}.
+ROLLOVER_MAX_MESSAGES = 100
+ROLLOVER_MAX_TOKENS = 24000
+ROLLOVER_KEEP_MESSAGES = 6
+ROLLOVER_HISTORY_LIMIT = 100  # The most the messages API returns in one page.
+ROLLOVER_SUMMARY_MODEL = "gpt-4-1106-preview"
+ROLLOVER_SUMMARY_PROMPT = ("Summarize the following conversation between a user and their calendar assistant. "
+                           "Keep names, dates, times, time zones, event ids and any open requests or preferences. "
+                           "Be concise.")
+
+def get_rollover_policy():
+    policy = {'max_messages': ROLLOVER_MAX_MESSAGES, 'max_tokens': ROLLOVER_MAX_TOKENS,
+              'keep_messages': ROLLOVER_KEEP_MESSAGES}
+    policy.update(get_config().get('thread_rollover') or {})
+    return policy
+
+def rollover_reason(stats, policy):
+    """
+    Returns 'messages' or 'tokens' when the thread described by stats is due for a rollover, otherwise None.
+    A threshold of 0 or None disables that check.
+    """
+    if stats is None:
+        return None
+    if policy['max_messages'] and stats['message_count'] >= policy['max_messages']:
+        return "messages"
+    if policy['max_tokens'] and stats.get('token_count', 0) >= policy['max_tokens']:
+        return "tokens"
+    return None
 
+def format_transcript(messages):
+    return "\n".join(f"{msg.role.capitalize()}: {message_text(msg)}" for msg in messages)
 
-def retrieve_or_create_assistant(assistant_id, client, timezone_config=None, list_tools=[]):
-    my_time, my_timezone = get_current_time_and_timezone(timezone_config)
+def build_rollover_seed(summary, recent_messages):
+    """
+    The messages a rolled-over thread starts with: the summary of the older history, then the recent turns verbatim.
+    """
+    seed = []
+    if summary:
+        seed.append({'role': "assistant", 'content': f"Summary of our conversation so far:\n{summary}"})
+    for msg in recent_messages:
+        text = message_text(msg)
+        if text:
+            seed.append({'role': msg.role, 'content': text})
+    return seed
+
+def split_history(history, keep_messages):
+    if not keep_messages:
+        return history, []
+    return history[:-keep_messages], history[-keep_messages:]
+
+def maybe_roll_over_thread(lookup_id, thread, client):
+    """
+    Rolls the thread over if it has passed the rollover policy's thresholds.
+
+    :param lookup_id: The lookup identifier for the thread.
+    :param thread: The thread currently mapped to the lookup id.
+    :param client: The client object for interacting with the OpenAI API.
+    :return: The thread to use for this request: a fresh one if a rollover happened, otherwise the given one.
+
+    The rollover summarizes the older part of the thread with a chat completion, creates a new thread seeded
+    with the summary and the last 'keep_messages' messages, and then swaps the store mapping with
+    replace_thread. If another process rolled the same thread over first, that thread is used and ours is
+    deleted. Any failure leaves the old thread in place.
+
+    If the store maps the lookup id to another thread than the one given, the mapping cached in this process
+    is stale (another process replaced it); the current thread is looked up and used instead.
+    """
+    policy = get_rollover_policy()
+    stats = get_thread_stats(lookup_id)
+    if stats is not None and stats['thread_id'] != thread.id:
+        print(f"Thread for lookupId {lookup_id} was replaced elsewhere: {thread.id} -> {stats['thread_id']}")
+        invalidate_cached_thread(lookup_id)
+        return create_or_retrieve_thread(None, lookup_id, client) or thread
+    reason = rollover_reason(stats, policy)
+    if reason is None:
+        return thread
+
+    try:
+        with span("thread_rollover", reason=reason):
+            page = call_api("openai", "messages.list", lambda: client.beta.threads.messages.list(
+                thread_id=thread.id, order="desc", limit=ROLLOVER_HISTORY_LIMIT))
+            older, recent = split_history(list(reversed(page.data)), policy['keep_messages'])
+
+            summary = None
+            if older:
+                completion = call_api("openai", "chat.completions.create", lambda: client.chat.completions.create(
+                    model=ROLLOVER_SUMMARY_MODEL,
+                    messages=[{"role": "system", "content": ROLLOVER_SUMMARY_PROMPT},
+                              {"role": "user", "content": format_transcript(older)}]))
+                summary = completion.choices[0].message.content
+
+            seed = build_rollover_seed(summary, recent)
+            new_thread = call_api("openai", "threads.create", lambda: client.beta.threads.create(messages=seed),
+                                  idempotent=False)
+
+            if not replace_thread(lookup_id, thread.id, new_thread.id, message_count=len(seed),
+                                  token_count=sum(estimate_tokens(message['content']) for message in seed)):
+                print(f"Thread for lookupId {lookup_id} was already rolled over elsewhere")
+                increment("thread_rollovers", reason=reason, outcome="superseded")
+                call_api("openai", "threads.delete", lambda: client.beta.threads.delete(new_thread.id))
+                return create_or_retrieve_thread(None, lookup_id, client)
+
+        print(f"Rolled over thread for lookupId {lookup_id} ({reason}): {thread.id} -> {new_thread.id}")
+        increment("thread_rollovers", reason=reason, outcome="rolled_over")
+        return new_thread
+    except Exception as e:
+        print(f"Failed to roll over thread ({thread.id}), keeping it: {e}")
+        increment("thread_rollovers", reason=reason, outcome="failed")
+        return thread
+
+
+ASSISTANT_NAME = "ParallelFunction"
+ASSISTANT_MODEL = "gpt-4-1106-preview"
+ASSISTANT_INSTRUCTIONS = "You are a helpful AI. You have the ability to schedule events in Google Calendar."
+# The date changes daily, so it is passed per run instead of being baked into the assistant.
+RUN_INSTRUCTIONS_TEMPLATE = "Assume today's date is {my_time} and timezone is {my_timezone}."
+
+assistant_registry_lock = threading.Lock()
+
+def retrieve_or_create_assistant(assistant_id, client, list_tools=[]):
+    """
+    Resolves the ID of the assistant to run.
+
+    :param assistant_id: The ID of an existing assistant (optional).
+    :param client: The client object for interacting with the OpenAI API.
+    :param list_tools: The tool schema the assistant should expose.
+    :return: The assistant ID.
+
+    Without an explicit ID the assistant is looked up in the local registry, keyed by name, model and
+    instructions. It is created only the first time, and updated in place when the tool schema changes.
+    """
     if assistant_id:
-        return client.beta.assistants.retrieve(assistant_id)
-    else:
-        return client.beta.assistants.create(
-            name="ParallelFunction",
-            instructions=f"You are a helpful AI. You have the ability to schedule events in Google Calendar. Assume today's date is {my_time} and timezone is {my_timezone}.",
-            model="gpt-4-1106-preview",
+        return assistant_id
+
+    key = assistant_registry_key(ASSISTANT_NAME, ASSISTANT_MODEL, ASSISTANT_INSTRUCTIONS)
+    fingerprint = tools_fingerprint(list_tools)
+
+    with assistant_registry_lock:
+        record = lookup_assistant(key)
+        if record and record['tools_fingerprint'] == fingerprint:
+            return record['assistant_id']
+
+        if record:
+            try:
+                print(f"Updating tools of assistant {record['assistant_id']}")
+                assistant = call_api("openai", "assistants.update",
+                                     lambda: client.beta.assistants.update(record['assistant_id'], tools=list_tools))
+                return register_assistant(key, assistant.id, fingerprint)['assistant_id']
+            except Exception as e:
+                print(f"Failed to update assistant ({record['assistant_id']}), creating a new one: {e}")
+
+        assistant = call_api("openai", "assistants.create", lambda: client.beta.assistants.create(
+            name=ASSISTANT_NAME,
+            instructions=ASSISTANT_INSTRUCTIONS,
+            model=ASSISTANT_MODEL,
             tools=list_tools
-        )
+        ), idempotent=False)
+        return register_assistant(key, assistant.id, fingerprint)['assistant_id']
+
+def replace_missing_assistant(assistant_id, client, list_tools=[]):
+    """
+    Called when a run could not be created because something was not found (404).
+
+    :return: The ID of a newly created assistant if the registered one no longer exists (its registry record
+             is dropped first), otherwise None.
+    """
+    try:
+        call_api("openai", "assistants.retrieve", lambda: client.beta.assistants.retrieve(assistant_id))
+        return None
+    except Exception as e:
+        if error_status(e) != 404:
+            raise
+    print(f"Assistant {assistant_id} no longer exists, creating a new one")
+    forget_assistant(assistant_registry_key(ASSISTANT_NAME, ASSISTANT_MODEL, ASSISTANT_INSTRUCTIONS), assistant_id)
+    return retrieve_or_create_assistant(None, client, list_tools)
+
+def get_run_instructions(timezone_config):
+    my_time, my_timezone = get_current_time_and_timezone(timezone_config)
+    return RUN_INSTRUCTIONS_TEMPLATE.format(my_time=my_time, my_timezone=my_timezone)
 
 def get_current_time_and_timezone(timezone_config):
     if not timezone_config:
@@ -209,8 +544,99 @@ def get_current_time_and_timezone(timezone_config):
     my_time = datetime.now(my_timezone).strftime('%Y-%m-%d')
     return my_time, my_timezone
 
-def create_run_for_assistant(assistant_id, thread_id, client):
-    return client.beta.threads.runs.create(thread_id=thread_id, assistant_id=assistant_id)
+# Polling fallback: start fast and back off while the run is still queued / in progress.
+POLL_INITIAL_INTERVAL = 0.05
+POLL_MAX_INTERVAL = 2.0
+POLL_BACKOFF_FACTOR = 1.5
+
+RUN_TERMINAL_FAILURE_STATUSES = ("failed", "cancelled", "expired", "incomplete")
+RUN_TERMINAL_FAILURE_EVENTS = tuple(f"thread.run.{status}" for status in RUN_TERMINAL_FAILURE_STATUSES)
+
+def create_run_for_assistant(assistant_id, thread_id, client, stream=False, additional_instructions=None):
+    with span("run_create", stream=stream):
+        if stream:
+            return call_api("openai", "runs.create", lambda: client.beta.threads.runs.create(
+                thread_id=thread_id, assistant_id=assistant_id, additional_instructions=additional_instructions,
+                stream=True), idempotent=False)
+        return call_api("openai", "runs.create", lambda: client.beta.threads.runs.create(
+            thread_id=thread_id, assistant_id=assistant_id, additional_instructions=additional_instructions),
+            idempotent=False)
+
+def run_assistant(assistant_id, thread, client, stream=True, additional_instructions=None, on_delta=None):
+    """
+    Starts a run for the assistant on the thread and drives it to completion.
+
+    :param assistant_id: The ID of the assistant to run.
+    :param thread: The thread object to run the assistant on.
+    :param client: The client object for interacting with the OpenAI API.
+    :param stream: Use the Assistants streaming events when True, polling otherwise.
+    :param additional_instructions: Per-run instructions appended to the assistant's own (e.g. today's date).
+    :param on_delta: Optional callable receiving each fragment of the reply text as it streams in.
+    :return: The response from the completed run, if successful.
+
+    Streaming reacts to 'requires_action' and 'completed' the moment the server emits them. If the installed
+    client does not support streaming runs, this falls back to adaptive polling.
+    """
+    if stream:
+        try:
+            run_stream = create_run_for_assistant(assistant_id, thread.id, client, stream=True,
+                                                  additional_instructions=additional_instructions)
+        except TypeError as e:
+            print(f"Streaming runs unavailable, falling back to polling: {e}")
+        else:
+            return stream_assistant_response(thread, run_stream, client, on_delta)
+
+    run = create_run_for_assistant(assistant_id, thread.id, client, additional_instructions=additional_instructions)
+    if run is None:
+        raise Exception("Failed to create and run assistant.")
+    return get_assistant_response(thread, run, client)
+
+def stream_assistant_response(thread, run_stream, client, on_delta=None):
+    """
+    Consumes the server-sent events of a run and retrieves the response once completed.
+
+    :param thread: The thread object associated with the run.
+    :param run_stream: The event stream returned when creating the run with stream=True.
+    :param client: The client object for interacting with the OpenAI API.
+    :param on_delta: Optional callable receiving each fragment of the reply text as it streams in.
+    :return: The response from the completed run, if successful.
+
+    When the run pauses on 'thread.run.requires_action' the tool calls are executed and their outputs are submitted
+    with a new stream, which is consumed in turn until the run completes or ends in a failure state.
+    """
+    while run_stream is not None:
+        next_stream = None
+        try:
+            for event in run_stream:
+                if event.event == "thread.message.delta":
+                    if on_delta:
+                        emit_text_deltas(event.data, on_delta)
+
+                elif event.event == "thread.run.completed":
+                    return process_completed_run(thread, event.data, client)
+
+                elif event.event == "thread.run.requires_action":
+                    run = event.data
+                    tools_output = process_required_action(run, thread, run, client, submit=False)
+                    next_stream = submit_tool_outputs(thread, run, tools_output, client, stream=True)
+                    break
+
+                elif event.event in RUN_TERMINAL_FAILURE_EVENTS:
+                    print(f"Run {event.data.id} ended with status '{event.data.status}': {event.data.last_error}")
+                    return None
+        finally:
+            close = getattr(run_stream, "close", None)
+            if close:
+                close()
+
+        run_stream = next_stream
+
+    return None
+
+def emit_text_deltas(message_delta, on_delta):
+    for part in message_delta.delta.content or []:
+        if part.type == "text" and part.text and part.text.value:
+            on_delta(part.text.value)
 
 def get_assistant_response(thread, run, client):
     """
@@ -222,53 +648,181 @@ def get_assistant_response(thread, run, client):
     :return: The response from the completed run, if successful.
 
     The function performs the following actions:
-    1. Continuously checks the status of the run in a loop.
+    1. Checks the status of the run right away, then keeps rechecking in a loop.
     2. If the run is completed, it processes the completed run to retrieve the response.
     3. If the run requires additional action, it processes the required actions.
-    4. If the run is still in progress, it waits for a specified time before rechecking.
+    4. If the run is still in progress, it waits before rechecking, backing off from POLL_INITIAL_INTERVAL
+       up to POLL_MAX_INTERVAL.
+    5. If the run failed, was cancelled or expired, it gives up and returns None.
 
-    The function exits the loop and returns the response when the run is completed. In cases where the run requires
-    action, it triggers appropriate processes to handle those actions. The function employs a delay between each status
-    check to avoid overwhelming the server with requests.
+    The polling interval is reset to POLL_INITIAL_INTERVAL after tool outputs are submitted, since the run
+    usually resumes quickly.
     """
+    interval = POLL_INITIAL_INTERVAL
     while True:
-        time.sleep(5)
-        run_status = client.beta.threads.runs.retrieve(thread_id=thread.id, run_id=run.id)
+        increment("poll_iterations")
+        with span("poll"):
+            run_status = call_api("openai", "runs.retrieve",
+                                  lambda: client.beta.threads.runs.retrieve(thread_id=thread.id, run_id=run.id))
 
         if run_status.status == "completed":
-            return process_completed_run(thread, client)
+            return process_completed_run(thread, run_status, client)
 
         elif run_status.status == "requires_action":
-            process_required_action(run_status, thread, run, client)
+            if not process_required_action(run_status, thread, run, client):
+                print(f"Run {run.id} requires action, but there are no tool outputs to submit.")
+                return None
+            interval = POLL_INITIAL_INTERVAL
+
+        elif run_status.status in RUN_TERMINAL_FAILURE_STATUSES:
+            print(f"Run {run.id} ended with status '{run_status.status}': {run_status.last_error}")
+            return None
 
         else:
             print("Waiting for the Assistant to process...")
 
-def process_completed_run(thread, client):
-    messages = client.beta.threads.messages.list(thread_id=thread.id)
-    for msg in messages.data:
-        if msg.role == "assistant":
-            print(f"Assistant: {msg.content[0].text.value}")
-            return
+        time.sleep(interval)
+        interval = min(interval * POLL_BACKOFF_FACTOR, POLL_MAX_INTERVAL)
+
+RUN_MESSAGES_PAGE_SIZE = 20
+
+def message_text(message):
+    """
+    Joins the text of every part of a message. Non-text parts, such as images, are skipped.
+    """
+    parts = []
+    for part in message.content:
+        if part.type == "text":
+            parts.append(part.text.value)
+        elif part.type == "refusal":
+            parts.append(part.refusal)
+    return "\n".join(parts)
+
+def run_reply(messages):
+    return "\n\n".join(text for text in (message_text(msg) for msg in messages if msg.role == "assistant") if text)
+
+def process_completed_run(thread, run, client):
+    """
+    Retrieves the reply written by a completed run.
+
+    :param thread: The thread object associated with the run.
+    :param run: The completed run.
+    :param client: The client object for interacting with the OpenAI API.
+    :return: The text of the assistant messages created by this run, oldest first.
+
+    Only the run's own messages are listed (filtered by run_id, oldest first, RUN_MESSAGES_PAGE_SIZE per page),
+    so the request stays the same size however long the thread grows, and a reply from an earlier run is never
+    returned by mistake.
+    """
+    messages = []
+    after = None
+    with span("completed_message_retrieval"):
+        while True:
+            page = call_api("openai", "messages.list", lambda: client.beta.threads.messages.list(
+                thread_id=thread.id, run_id=run.id, order="asc", limit=RUN_MESSAGES_PAGE_SIZE,
+                **({'after': after} if after else {})))
+            messages.extend(page.data)
+            if not page.has_more or not page.data:
+                break
+            after = page.data[-1].id
+    return run_reply(messages)
+
+def process_required_action(run_status, thread, run, client, submit=True):
+    with span("requires_action_round"):
+        required_actions = run_status.required_action.submit_tool_outputs.model_dump()
+        tool_calls_output, tools_output = process_tool_calls(required_actions)
+
+        print(f"{tool_calls_output}")
+        if submit:
+            submit_tool_outputs(thread, run, tools_output, client)
+    return tools_output
+
+# Tool calls from one 'requires_action' step run concurrently on a pool shared by every conversation.
+TOOL_CALL_MAX_WORKERS = 8
+TOOL_CALL_TIMEOUT = 30  # seconds a call may run, counted from when a worker starts it
+TOOL_CALL_QUEUE_TIMEOUT = 120  # seconds a call may wait for a free worker before it is given up
+
+tool_call_executor = ThreadPoolExecutor(max_workers=TOOL_CALL_MAX_WORKERS, thread_name_prefix="tool-call")
+
+class ToolCallTask:
+    """
+    One tool call submitted to tool_call_executor.
 
-def process_required_action(run_status, thread, run, client):
-    required_actions = run_status.required_action.submit_tool_outputs.model_dump()
-    tool_calls_output, tools_output = process_tool_calls(required_actions)
+    Calls from many conversations share the pool, so a call may wait for a worker; its timeout only starts
+    once a worker picks it up, so waiting in the queue under load doesn't count against it.
 
-    print(f"{tool_calls_output}")
-    submit_tool_outputs(thread, run, tools_output, client)
+    :param on_start: Called from the worker thread when the call starts, e.g. to wake an event loop.
+    """
+
+    def __init__(self, action, on_start=None):
+        self.action = action
+        self.started = threading.Event()
+        self.started_at = None
+        self._on_start = on_start
+        self.future = tool_call_executor.submit(self._run)
+
+    def _run(self):
+        self.started_at = time.monotonic()
+        self.started.set()
+        if self._on_start:
+            self._on_start()
+        return process_single_tool_call(self.action)
+
+    def remaining(self, timeout):
+        # A call whose cancel just failed is starting right now, possibly before started_at is set.
+        started_at = self.started_at or time.monotonic()
+        return max(started_at + timeout - time.monotonic(), 0)
+
+def process_tool_calls(required_actions, timeout=TOOL_CALL_TIMEOUT):
+    """
+    Executes the tool calls of a 'requires_action' step concurrently.
+
+    :param required_actions: The dumped 'submit_tool_outputs' payload of the run.
+    :param timeout: Seconds each call may run, counted from when it starts.
+    :return: A tuple of the tool calls made and their outputs, in the order of the tool calls.
 
-def process_tool_calls(required_actions):
+    A call that raises or runs past the timeout gets an error string as its output, so it never blocks
+    the other calls or drops their outputs. A running call can't be stopped, so its output says it may still
+    complete. Only a call that found no free worker for TOOL_CALL_QUEUE_TIMEOUT seconds is cancelled unrun.
+    """
     tool_calls_output = {'tool_calls': []}
     tools_output = []
 
-    for action in required_actions["tool_calls"]:
-        tool_call, tool_output = process_single_tool_call(action)
+    tasks = [ToolCallTask(action) for action in required_actions["tool_calls"]]
+    queue_deadline = time.monotonic() + TOOL_CALL_QUEUE_TIMEOUT
+
+    for task in tasks:
+        try:
+            if not task.started.wait(max(queue_deadline - time.monotonic(), 0)) and task.future.cancel():
+                tool_call, tool_output = tool_call_failure(task.action, tool_call_queue_timeout_message())
+            else:
+                tool_call, tool_output = task.future.result(timeout=task.remaining(timeout))
+        except FutureTimeoutError:
+            tool_call, tool_output = tool_call_failure(task.action, tool_call_timeout_message(timeout))
+        except Exception as e:
+            tool_call, tool_output = tool_call_failure(task.action, f"An error occurred: {e}")
         tool_calls_output['tool_calls'].append(tool_call)
         tools_output.append(tool_output)
 
     return tool_calls_output, tools_output
 
+def tool_call_timeout_message(timeout):
+    return (f"Tool call timed out after {timeout} seconds but is still running and may yet complete; "
+            "check its effect (e.g. with list_events) before retrying it.")
+
+def tool_call_queue_timeout_message():
+    return (f"Tool call was not run: every tool worker stayed busy for {TOOL_CALL_QUEUE_TIMEOUT} seconds. "
+            "It is safe to retry.")
+
+def tool_call_failure(action, message):
+    print(f"Tool call {action['function']['name']} ({action['id']}) failed: {message}")
+    tool_call = {
+        'id': action['id'],
+        'function': {'arguments': action["function"]["arguments"], 'name': action["function"]["name"]},
+        'type': 'function'
+    }
+    return tool_call, {"tool_call_id": action["id"], "output": message}
+
 def process_single_tool_call(action):
     func_name = action["function"]["name"]
     arguments = json.loads(action["function"]["arguments"]) if isinstance(action["function"]["arguments"], str) else action["function"]["arguments"]
@@ -280,25 +834,128 @@ def process_single_tool_call(action):
     }
 
     func = function_dispatch_table.get(func_name)
-    if func:
-        result = func(**arguments)
-        output = json.dumps(result) if not isinstance(result, str) else result
-    else:
-        print(f"Function {func_name} not found")
-        output = None
+    if func is None:
+        # Every tool call needs an output, or the whole submission is rejected.
+        return tool_call_failure(action, f"An error occurred: unknown tool '{func_name}'.")
 
-    tool_output = {"tool_call_id": action["id"], "output": output} if output else None
-    return tool_call, tool_output
+    with span("tool_call", tool=func_name):
+        result = func(**arguments)
+    output = encode_tool_output(result, TOOL_OUTPUT_TOKEN_BUDGETS.get(func_name, DEFAULT_TOKEN_BUDGET))
+    return tool_call, {"tool_call_id": action["id"], "output": output}
 
-def submit_tool_outputs(thread, run, tools_output, client):
-    if tools_output:
-        client.beta.threads.runs.submit_tool_outputs(
+def submit_tool_outputs(thread, run, tools_output, client, stream=False):
+    tools_output = [output for output in tools_output if output]
+    if not tools_output:
+        return None
+    if stream:
+        return call_api("openai", "runs.submit_tool_outputs", lambda: client.beta.threads.runs.submit_tool_outputs(
             thread_id=thread.id,
             run_id=run.id,
-            tool_outputs=tools_output
-        )
+            tool_outputs=tools_output,
+            stream=True
+        ), idempotent=False)
+    return call_api("openai", "runs.submit_tool_outputs", lambda: client.beta.threads.runs.submit_tool_outputs(
+        thread_id=thread.id,
+        run_id=run.id,
+        tool_outputs=tools_output
+    ), idempotent=False)
+
+# Fast path: simple calendar questions are answered locally by an intent router, without a run. The exchange is
+# then added to the thread in the background, so later turns still have it in context. Configure it with a
+# "fast_path" object in config.json, e.g. {"enabled": true, "confidence_threshold": 0.9, "intents": ["list_events"]}.
+FAST_PATH_APPEND_WORKERS = 4
+
+_intent_router = None
+_intent_router_configured = False
+fast_path_executor = ThreadPoolExecutor(max_workers=FAST_PATH_APPEND_WORKERS, thread_name_prefix="fast-path")
+pending_thread_appends = {}
+pending_thread_appends_lock = threading.Lock()
+
+def get_intent_router():
+    """
+    Returns the router built from the "fast_path" configuration, or None if the fast path is disabled.
+    """
+    global _intent_router, _intent_router_configured
+    if not _intent_router_configured:
+        settings = get_config().get('fast_path') or {}
+        with _lazy_init_lock:
+            if not _intent_router_configured:
+                if settings.get('enabled', True):
+                    _intent_router = create_default_router(
+                        settings.get('confidence_threshold', DEFAULT_CONFIDENCE_THRESHOLD), settings.get('intents'))
+                _intent_router_configured = True
+    return _intent_router
+
+def set_intent_router(router):
+    """
+    Replaces the fast-path router, e.g. with one that has extra intents registered; None disables the fast path.
+    """
+    global _intent_router, _intent_router_configured
+    with _lazy_init_lock:
+        _intent_router = router
+        _intent_router_configured = True
+
+def answer_locally(user_input, timezone_config):
+    router = get_intent_router()
+    if router is None:
+        return None
+    try:
+        return router.handle(user_input, timezone_config or 'UTC')
+    except Exception as e:
+        print(f"Fast path failed, using the assistant: {e}")
+        return None
+
+def append_exchange_to_thread(lookup_id, user_input, response, client):
+    """
+    Adds a request answered on the fast path, and its reply, to the lookup id's thread.
+    """
+    thread = create_or_retrieve_thread(user_input, lookup_id, client)
+    if thread is None:
+        raise Exception("Failed to create thread.")
+    add_message_to_thread(thread.id, user_input, client)
+    add_message_to_thread(thread.id, response, client, role="assistant")
+    record_thread_usage(lookup_id, messages_added=2, tokens_added=estimate_tokens(user_input) + estimate_tokens(response))
+
+def schedule_thread_append(lookup_id, user_input, response, client):
+    """
+    Runs append_exchange_to_thread in the background, after any append still pending for the same lookup id.
+    """
+    key = str(lookup_id)
+
+    def append(previous):
+        if previous is not None:
+            wait_quietly(previous)
+        try:
+            append_exchange_to_thread(lookup_id, user_input, response, client)
+        except Exception as e:
+            print(f"Failed to add the fast-path exchange to thread (lookupId {lookup_id}): {e}")
+
+    def forget(future):
+        with pending_thread_appends_lock:
+            if pending_thread_appends.get(key) is future:
+                del pending_thread_appends[key]
+
+    with pending_thread_appends_lock:
+        future = fast_path_executor.submit(append, pending_thread_appends.get(key))
+        pending_thread_appends[key] = future
+    future.add_done_callback(forget)
+
+def wait_quietly(future):
+    try:
+        future.result()
+    except Exception:
+        pass
+
+def wait_for_thread_appends(lookup_id):
+    """
+    Blocks until fast-path exchanges for the lookup id are in its thread, so messages stay in order.
+    """
+    with pending_thread_appends_lock:
+        future = pending_thread_appends.get(str(lookup_id))
+    if future is not None:
+        wait_quietly(future)
 
-def process_user_request(client=None, user_input, assistant_id=None, list_tools=[], thread_lookup_id, timezone_config=None):
+def process_user_request(client, user_input, assistant_id=None, list_tools=[], thread_lookup_id=None, timezone_config=None, stream=True, fast_path=True):
     """
     Processes a user's request by creating a thread, running an assistant, and then retrieving the assistant's response.
 
@@ -306,51 +963,757 @@ def process_user_request(client=None, user_input, assistant_id=None, list_tools=
     :param thread_lookup_id: The lookup identifier for the thread.
     :param assistant_id: The ID of an existing assistant (optional).
     :param client: The client object for interacting with the OpenAI API.
+    :param stream: Drive the run with streaming events (True) or adaptive polling (False).
+    :param fast_path: Let the intent router answer simple calendar questions without the assistant.
     :return: The response from the assistant or None if an error occurs.
 
     This function encapsulates the full process of handling a user request:
-    1. Create assistant
-    2. Creating a thread (or retrieving an existing one) based on the 'thread_lookup_id'.
+    0. Answer on the fast path if the intent router is confident enough, and return.
+    1. Create assistant (or reuse the registered one)
+    2. Creating a thread (or retrieving an existing one) based on the 'thread_lookup_id', rolling it over to a
+       summarized thread if it has grown past the rollover policy's thresholds.
     3. Add message to thread
-    4. Create run from assistant and thread
-    5. Retrieving the response from the assistant.
+    4. Create run from assistant and thread, passing today's date as additional instructions. If the
+       registered assistant turns out to have been deleted, a new one is created and the run retried once.
+    5. Retrieving the response from the assistant as soon as the run completes.
 
     If any step in the process fails, the function captures the exception, logs the error, and returns None.
     """
+    increment("requests")
+    with span("request"):
+        try:
+            # 0. Fast path
+            if fast_path:
+                response = answer_locally(user_input, timezone_config)
+                if response is not None:
+                    schedule_thread_append(thread_lookup_id, user_input, response, client)
+                    return response
+
+            # 1. Create assistant
+            registered = not assistant_id
+            try:
+                with span("assistant_retrieval"):
+                    assistant_id = retrieve_or_create_assistant(assistant_id, client, list_tools)
+            except Exception as e:
+                print(f"Error in retrieve_or_create_assistant: {e}")
+                raise
+
+            # 2. Creating a thread (or retrieving an existing one) based on the 'thread_lookup_id'.
+            wait_for_thread_appends(thread_lookup_id)
+            thread = create_or_retrieve_thread(user_input, thread_lookup_id, client)
+            if thread is None:
+                raise Exception("Failed to create thread.")
+            thread = maybe_roll_over_thread(thread_lookup_id, thread, client)
+
+            # 3. Add message to thread
+            add_message_to_thread(thread.id, user_input, client)
+            record_thread_usage(thread_lookup_id, messages_added=1, tokens_added=estimate_tokens(user_input))
+
+            # 4. Create run from assistant and thread
+            # 5. Retrieving the response from the assistant.
+            try:
+                response = run_assistant(assistant_id, thread, client, stream=stream,
+                                         additional_instructions=get_run_instructions(timezone_config))
+            except Exception as e:
+                # A registered assistant that was deleted is replaced, so the registry doesn't keep failing every run.
+                new_assistant_id = replace_missing_assistant(assistant_id, client, list_tools) \
+                    if registered and error_status(e) == 404 else None
+                if new_assistant_id is None:
+                    raise
+                response = run_assistant(new_assistant_id, thread, client, stream=stream,
+                                         additional_instructions=get_run_instructions(timezone_config))
+            if response is not None:
+                record_thread_usage(thread_lookup_id, messages_added=1, tokens_added=estimate_tokens(response))
+            return response
+
+        except Exception as e:
+            print(f"Error in process_user_request: {e}")
+            return None
+
+
+# ---------------------------------------------------------------------------
+# Async request engine: the same pipeline on the async OpenAI client, so one
+# event loop can keep many conversations in flight at once.
+# ---------------------------------------------------------------------------
+
+DEFAULT_MAX_CONCURRENCY = 64
+
+async def async_create_or_retrieve_thread(user_input, lookup_id, async_client):
+    """
+    Async counterpart of create_or_retrieve_thread.
+
+    :param user_input: The input provided by the user.
+    :param lookup_id: The lookup identifier for the thread.
+    :param async_client: The AsyncOpenAI client object.
+    :return: The thread object.
+    """
+    with span("thread_lookup"):
+        thread_id = await asyncio.to_thread(check_if_thread_exists, lookup_id)
+
+        if thread_id is None:
+            return await async_create_new_thread(lookup_id, async_client)
+        return await async_retrieve_existing_thread(thread_id, lookup_id, async_client)
+
+async def async_create_new_thread(lookup_id, async_client):
+    print(f"Creating new thread with lookupId {lookup_id}")
+    try:
+        thread = await acall_api("openai", "threads.create", lambda: async_client.beta.threads.create(), idempotent=False)
+        await asyncio.to_thread(store_thread, lookup_id, thread.id)
+        return thread
+    except Exception as e:
+        print(f"Failed to create new thread: {e}")
+        return None
+
+async def async_retrieve_existing_thread(thread_id, lookup_id, async_client):
+    print(f"Retrieving existing thread with lookupId {lookup_id}")
+    try:
+        return await acall_api("openai", "threads.retrieve", lambda: async_client.beta.threads.retrieve(thread_id))
+    except Exception as e:
+        print(f"Failed to retrieve existing thread ({thread_id}): {e}")
+        return None
+
+async def async_add_message_to_thread(thread_id, user_input, async_client, role="user"):
+    try:
+        with span("message_add"):
+            await acall_api("openai", "messages.create", lambda: async_client.beta.threads.messages.create(
+                thread_id=thread_id,
+                role=role,
+                content=user_input
+            ), idempotent=False)
+    except Exception as e:
+        print(f"Failed to add message to thread: {e}")
+
+async def async_maybe_roll_over_thread(lookup_id, thread, async_client):
+    """
+    Async counterpart of maybe_roll_over_thread.
+    """
+    policy = get_rollover_policy()
+    stats = await asyncio.to_thread(get_thread_stats, lookup_id)
+    if stats is not None and stats['thread_id'] != thread.id:
+        print(f"Thread for lookupId {lookup_id} was replaced elsewhere: {thread.id} -> {stats['thread_id']}")
+        await asyncio.to_thread(invalidate_cached_thread, lookup_id)
+        return await async_create_or_retrieve_thread(None, lookup_id, async_client) or thread
+    reason = rollover_reason(stats, policy)
+    if reason is None:
+        return thread
+
     try:
+        with span("thread_rollover", reason=reason):
+            page = await acall_api("openai", "messages.list", lambda: async_client.beta.threads.messages.list(
+                thread_id=thread.id, order="desc", limit=ROLLOVER_HISTORY_LIMIT))
+            older, recent = split_history(list(reversed(page.data)), policy['keep_messages'])
+
+            summary = None
+            if older:
+                completion = await acall_api("openai", "chat.completions.create", lambda: async_client.chat.completions.create(
+                    model=ROLLOVER_SUMMARY_MODEL,
+                    messages=[{"role": "system", "content": ROLLOVER_SUMMARY_PROMPT},
+                              {"role": "user", "content": format_transcript(older)}]))
+                summary = completion.choices[0].message.content
+
+            seed = build_rollover_seed(summary, recent)
+            new_thread = await acall_api("openai", "threads.create", lambda: async_client.beta.threads.create(messages=seed),
+                                         idempotent=False)
+
+            replaced = await asyncio.to_thread(replace_thread, lookup_id, thread.id, new_thread.id, len(seed),
+                                               sum(estimate_tokens(message['content']) for message in seed))
+            if not replaced:
+                print(f"Thread for lookupId {lookup_id} was already rolled over elsewhere")
+                increment("thread_rollovers", reason=reason, outcome="superseded")
+                await acall_api("openai", "threads.delete", lambda: async_client.beta.threads.delete(new_thread.id))
+                return await async_create_or_retrieve_thread(None, lookup_id, async_client)
+
+        print(f"Rolled over thread for lookupId {lookup_id} ({reason}): {thread.id} -> {new_thread.id}")
+        increment("thread_rollovers", reason=reason, outcome="rolled_over")
+        return new_thread
+    except Exception as e:
+        print(f"Failed to roll over thread ({thread.id}), keeping it: {e}")
+        increment("thread_rollovers", reason=reason, outcome="failed")
+        return thread
 
-        # 1. Create assistant
+async def async_retrieve_or_create_assistant(assistant_id, async_client, list_tools=[]):
+    """
+    Async counterpart of retrieve_or_create_assistant, sharing the same registry.
+    """
+    if assistant_id:
+        return assistant_id
+
+    key = assistant_registry_key(ASSISTANT_NAME, ASSISTANT_MODEL, ASSISTANT_INSTRUCTIONS)
+    fingerprint = tools_fingerprint(list_tools)
+
+    record = await asyncio.to_thread(lookup_assistant, key)
+    if record and record['tools_fingerprint'] == fingerprint:
+        return record['assistant_id']
+
+    if record:
         try:
-            assistant = retrieve_or_create_assistant(assistant_id, client, timezone_config, list_tools)
+            print(f"Updating tools of assistant {record['assistant_id']}")
+            assistant = await acall_api("openai", "assistants.update",
+                                        lambda: async_client.beta.assistants.update(record['assistant_id'], tools=list_tools))
+            await asyncio.to_thread(register_assistant, key, assistant.id, fingerprint)
+            return assistant.id
         except Exception as e:
-            print(f"Error in retrieve_or_create_assistant: {e}")
+            print(f"Failed to update assistant ({record['assistant_id']}), creating a new one: {e}")
+
+    assistant = await acall_api("openai", "assistants.create", lambda: async_client.beta.assistants.create(
+        name=ASSISTANT_NAME,
+        instructions=ASSISTANT_INSTRUCTIONS,
+        model=ASSISTANT_MODEL,
+        tools=list_tools
+    ), idempotent=False)
+    await asyncio.to_thread(register_assistant, key, assistant.id, fingerprint)
+    return assistant.id
+
+async def async_replace_missing_assistant(assistant_id, async_client, list_tools=[]):
+    """
+    Async counterpart of replace_missing_assistant.
+    """
+    try:
+        await acall_api("openai", "assistants.retrieve", lambda: async_client.beta.assistants.retrieve(assistant_id))
+        return None
+    except Exception as e:
+        if error_status(e) != 404:
+            raise
+    print(f"Assistant {assistant_id} no longer exists, creating a new one")
+    await asyncio.to_thread(forget_assistant, assistant_registry_key(ASSISTANT_NAME, ASSISTANT_MODEL, ASSISTANT_INSTRUCTIONS),
+                            assistant_id)
+    return await async_retrieve_or_create_assistant(None, async_client, list_tools)
+
+async def async_create_run_for_assistant(assistant_id, thread_id, async_client, stream=False, additional_instructions=None):
+    with span("run_create", stream=stream):
+        if stream:
+            return await acall_api("openai", "runs.create", lambda: async_client.beta.threads.runs.create(
+                thread_id=thread_id, assistant_id=assistant_id, additional_instructions=additional_instructions,
+                stream=True), idempotent=False)
+        return await acall_api("openai", "runs.create", lambda: async_client.beta.threads.runs.create(
+            thread_id=thread_id, assistant_id=assistant_id, additional_instructions=additional_instructions),
+            idempotent=False)
+
+async def async_run_assistant(assistant_id, thread, async_client, stream=True, additional_instructions=None, on_delta=None):
+    """
+    Async counterpart of run_assistant.
+    """
+    if stream:
+        try:
+            run_stream = await async_create_run_for_assistant(assistant_id, thread.id, async_client, stream=True,
+                                                              additional_instructions=additional_instructions)
+        except TypeError as e:
+            print(f"Streaming runs unavailable, falling back to polling: {e}")
+        else:
+            return await async_stream_assistant_response(thread, run_stream, async_client, on_delta)
+
+    run = await async_create_run_for_assistant(assistant_id, thread.id, async_client,
+                                               additional_instructions=additional_instructions)
+    if run is None:
+        raise Exception("Failed to create and run assistant.")
+    return await async_get_assistant_response(thread, run, async_client)
+
+async def async_stream_assistant_response(thread, run_stream, async_client, on_delta=None):
+    """
+    Async counterpart of stream_assistant_response.
+    """
+    while run_stream is not None:
+        next_stream = None
+        try:
+            async for event in run_stream:
+                if event.event == "thread.message.delta":
+                    if on_delta:
+                        emit_text_deltas(event.data, on_delta)
+
+                elif event.event == "thread.run.completed":
+                    return await async_process_completed_run(thread, event.data, async_client)
+
+                elif event.event == "thread.run.requires_action":
+                    run = event.data
+                    tools_output = await async_process_required_action(run, thread, run, async_client, submit=False)
+                    next_stream = await async_submit_tool_outputs(thread, run, tools_output, async_client, stream=True)
+                    break
+
+                elif event.event in RUN_TERMINAL_FAILURE_EVENTS:
+                    print(f"Run {event.data.id} ended with status '{event.data.status}': {event.data.last_error}")
+                    return None
+        finally:
+            close = getattr(run_stream, "close", None)
+            if close:
+                await close()
 
-        # 2. Creating a thread (or retrieving an existing one) based on the 'thread_lookup_id'.
-        thread = create_or_retrieve_thread(user_input, thread_lookup_id, client)
-        if thread is None:
-            raise Exception("Failed to create thread.")
+        run_stream = next_stream
 
-        # 3. Add message to thread
-        add_message_to_thread(thread.id, user_input, client)
+    return None
+
+async def async_get_assistant_response(thread, run, async_client):
+    """
+    Async counterpart of get_assistant_response. Waiting between polls yields to the event loop.
+    """
+    interval = POLL_INITIAL_INTERVAL
+    while True:
+        increment("poll_iterations")
+        with span("poll"):
+            run_status = await acall_api("openai", "runs.retrieve",
+                                         lambda: async_client.beta.threads.runs.retrieve(thread_id=thread.id, run_id=run.id))
 
-        # 4. Create run from assistant and thread
+        if run_status.status == "completed":
+            return await async_process_completed_run(thread, run_status, async_client)
+
+        elif run_status.status == "requires_action":
+            if not await async_process_required_action(run_status, thread, run, async_client):
+                print(f"Run {run.id} requires action, but there are no tool outputs to submit.")
+                return None
+            interval = POLL_INITIAL_INTERVAL
+
+        elif run_status.status in RUN_TERMINAL_FAILURE_STATUSES:
+            print(f"Run {run.id} ended with status '{run_status.status}': {run_status.last_error}")
+            return None
+
+        await asyncio.sleep(interval)
+        interval = min(interval * POLL_BACKOFF_FACTOR, POLL_MAX_INTERVAL)
+
+async def async_process_completed_run(thread, run, async_client):
+    """
+    Async counterpart of process_completed_run.
+    """
+    messages = []
+    after = None
+    with span("completed_message_retrieval"):
+        while True:
+            page = await acall_api("openai", "messages.list", lambda: async_client.beta.threads.messages.list(
+                thread_id=thread.id, run_id=run.id, order="asc", limit=RUN_MESSAGES_PAGE_SIZE,
+                **({'after': after} if after else {})))
+            messages.extend(page.data)
+            if not page.has_more or not page.data:
+                break
+            after = page.data[-1].id
+    return run_reply(messages)
+
+async def async_process_required_action(run_status, thread, run, async_client, submit=True):
+    with span("requires_action_round"):
+        required_actions = run_status.required_action.submit_tool_outputs.model_dump()
+        tool_calls_output, tools_output = await async_process_tool_calls(required_actions)
+
+        print(f"{tool_calls_output}")
+        if submit:
+            await async_submit_tool_outputs(thread, run, tools_output, async_client)
+    return tools_output
+
+async def async_process_tool_calls(required_actions, timeout=TOOL_CALL_TIMEOUT):
+    """
+    Async counterpart of process_tool_calls. The tool functions are blocking, so each one runs on
+    tool_call_executor; gather keeps the results in the order of the tool calls.
+    """
+    loop = asyncio.get_running_loop()
+    actions = required_actions["tool_calls"]
+    queue_deadline = time.monotonic() + TOOL_CALL_QUEUE_TIMEOUT
+
+    async def run_one(action):
+        started = asyncio.Event()
+        task = ToolCallTask(action, on_start=lambda: loop.call_soon_threadsafe(started.set))
+        try:
+            await asyncio.wait_for(started.wait(), max(queue_deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            if task.future.cancel():
+                return tool_call_failure(action, tool_call_queue_timeout_message())
         try:
-            run = create_run_for_assistant(assistant.id, thread.id, client)
+            return await asyncio.wait_for(asyncio.wrap_future(task.future, loop=loop), task.remaining(timeout))
+        except asyncio.TimeoutError:
+            return tool_call_failure(action, tool_call_timeout_message(timeout))
         except Exception as e:
-            print(f"Error in create_run_for_assistant: {e}")
+            return tool_call_failure(action, f"An error occurred: {e}")
 
-        if run is None:
-            raise Exception("Failed to create and run assistant.")
+    results = await asyncio.gather(*(run_one(action) for action in actions))
 
-        # 5. Retrieving the response from the assistant.
-        return get_assistant_response(thread, run, client)
+    tool_calls_output = {'tool_calls': [tool_call for tool_call, _ in results]}
+    tools_output = [tool_output for _, tool_output in results]
+    return tool_calls_output, tools_output
 
-    except Exception as e:
-        print(f"Error in process_user_request: {e}")
+async def async_submit_tool_outputs(thread, run, tools_output, async_client, stream=False):
+    tools_output = [output for output in tools_output if output]
+    if not tools_output:
         return None
+    if stream:
+        return await acall_api("openai", "runs.submit_tool_outputs", lambda: async_client.beta.threads.runs.submit_tool_outputs(
+            thread_id=thread.id,
+            run_id=run.id,
+            tool_outputs=tools_output,
+            stream=True
+        ), idempotent=False)
+    return await acall_api("openai", "runs.submit_tool_outputs", lambda: async_client.beta.threads.runs.submit_tool_outputs(
+        thread_id=thread.id,
+        run_id=run.id,
+        tool_outputs=tools_output
+    ), idempotent=False)
+
+class AsyncRequestEngine:
+    """
+    Serves many conversations concurrently from one event loop.
+
+    At most 'max_concurrency' requests are in flight at once. Requests that share a thread_lookup_id are
+    serialized, so their runs never interleave on the same thread; requests for different lookup ids proceed
+    independently.
+    """
+
+    def __init__(self, async_client, assistant_id=None, list_tools=[], timezone_config=None,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY, stream=True, fast_path=True):
+        self.async_client = async_client
+        self.assistant_id = assistant_id
+        self.list_tools = list_tools
+        self.timezone_config = timezone_config
+        self.max_concurrency = max_concurrency
+        self.stream = stream
+        self.fast_path = fast_path
+        self._semaphore = None
+        self._assistant_id = None
+        self._assistant_lock = None
+        self._thread_locks = {}
+        self._pending_appends = {}
+
+    def _ensure_primitives(self):
+        # asyncio primitives are created inside the running loop.
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._assistant_lock = asyncio.Lock()
+
+    async def _get_assistant_id(self):
+        # Resolved once and shared, so concurrent requests don't each hit the registry or the API.
+        async with self._assistant_lock:
+            if self._assistant_id is None:
+                self._assistant_id = await async_retrieve_or_create_assistant(
+                    self.assistant_id, self.async_client, self.list_tools)
+            return self._assistant_id
+
+    async def _replace_missing_assistant(self, missing_id):
+        """
+        Replaces the registered assistant if it was deleted. Returns the ID to retry with, or None.
+        """
+        if self.assistant_id:
+            return None
+        async with self._assistant_lock:
+            if self._assistant_id == missing_id:
+                new_id = await async_replace_missing_assistant(missing_id, self.async_client, self.list_tools)
+                if new_id is None:
+                    return None
+                self._assistant_id = new_id
+            # Otherwise a concurrent request already replaced it.
+            return self._assistant_id
+
+    @contextlib.asynccontextmanager
+    async def _thread_lock(self, lookup_id):
+        key = str(lookup_id)
+        entry = self._thread_locks.get(key)
+        if entry is None:
+            entry = self._thread_locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._thread_locks[key]
+
+    async def _append_exchange(self, lookup_id, user_input, response, previous):
+        if previous is not None:
+            await previous
+        try:
+            thread = await async_create_or_retrieve_thread(user_input, lookup_id, self.async_client)
+            if thread is None:
+                raise Exception("Failed to create thread.")
+            await async_add_message_to_thread(thread.id, user_input, self.async_client)
+            await async_add_message_to_thread(thread.id, response, self.async_client, role="assistant")
+            await asyncio.to_thread(record_thread_usage, lookup_id, 2, estimate_tokens(user_input) + estimate_tokens(response))
+        except Exception as e:
+            print(f"Failed to add the fast-path exchange to thread (lookupId {lookup_id}): {e}")
+
+    def _schedule_append(self, lookup_id, user_input, response):
+        # Each append waits for the previous one for the same lookup id, so messages keep their order.
+        key = str(lookup_id)
+        task = asyncio.get_running_loop().create_task(
+            self._append_exchange(lookup_id, user_input, response, self._pending_appends.get(key)))
+        self._pending_appends[key] = task
+        task.add_done_callback(lambda done: self._pending_appends.pop(key, None) if self._pending_appends.get(key) is done else None)
+
+    async def _wait_for_append(self, lookup_id):
+        task = self._pending_appends.get(str(lookup_id))
+        if task is not None:
+            await task
+
+    async def drain(self):
+        """
+        Waits until every fast-path exchange has been added to its thread.
+
+        Await this before the event loop closes (asyncio.run cancels the tasks still pending when it returns).
+        """
+        while self._pending_appends:
+            await asyncio.gather(*list(self._pending_appends.values()))
+
+    async def process_user_request(self, user_input, thread_lookup_id, on_delta=None):
+        """
+        Async counterpart of process_user_request.
+
+        :param user_input: The input provided by the user.
+        :param thread_lookup_id: The lookup identifier for the thread.
+        :param on_delta: Optional callable receiving each fragment of the reply text as it streams in.
+        :return: The response from the assistant or None if an error occurs.
+        """
+        self._ensure_primitives()
+        async with self._thread_lock(thread_lookup_id):
+            async with self._semaphore:
+                increment("requests")
+                with span("request"):
+                    try:
+                        # 0. Fast path
+                        if self.fast_path:
+                            response = await asyncio.to_thread(answer_locally, user_input, self.timezone_config)
+                            if response is not None:
+                                self._schedule_append(thread_lookup_id, user_input, response)
+                                if on_delta:
+                                    on_delta(response)
+                                return response
+
+                        # 1. Create assistant
+                        with span("assistant_retrieval"):
+                            assistant_id = await self._get_assistant_id()
+
+                        # 2. Creating a thread (or retrieving an existing one) based on the 'thread_lookup_id'.
+                        await self._wait_for_append(thread_lookup_id)
+                        thread = await async_create_or_retrieve_thread(user_input, thread_lookup_id, self.async_client)
+                        if thread is None:
+                            raise Exception("Failed to create thread.")
+                        thread = await async_maybe_roll_over_thread(thread_lookup_id, thread, self.async_client)
+
+                        # 3. Add message to thread
+                        await async_add_message_to_thread(thread.id, user_input, self.async_client)
+                        await asyncio.to_thread(record_thread_usage, thread_lookup_id, 1, estimate_tokens(user_input))
+
+                        # 4. Create run from assistant and thread
+                        # 5. Retrieving the response from the assistant.
+                        try:
+                            response = await async_run_assistant(assistant_id, thread, self.async_client, stream=self.stream,
+                                                                 additional_instructions=get_run_instructions(self.timezone_config),
+                                                                 on_delta=on_delta)
+                        except Exception as e:
+                            new_assistant_id = await self._replace_missing_assistant(assistant_id) \
+                                if error_status(e) == 404 else None
+                            if new_assistant_id is None:
+                                raise
+                            response = await async_run_assistant(new_assistant_id, thread, self.async_client, stream=self.stream,
+                                                                 additional_instructions=get_run_instructions(self.timezone_config),
+                                                                 on_delta=on_delta)
+                        if response is not None:
+                            await asyncio.to_thread(record_thread_usage, thread_lookup_id, 1, estimate_tokens(response))
+                        return response
+
+                    except Exception as e:
+                        print(f"Error in process_user_request (lookupId {thread_lookup_id}): {e}")
+                        return None
+
+    async def process_many(self, requests):
+        """
+        Processes (user_input, thread_lookup_id) pairs concurrently.
+
+        :param requests: An iterable of (user_input, thread_lookup_id) tuples.
+        :return: The responses, in the same order as the requests.
+
+        Requests for the same lookup id are run in the order they appear in 'requests'. Returns once the
+        fast-path exchanges have been added to their threads as well.
+        """
+        self._ensure_primitives()
+        responses = await asyncio.gather(*(
+            self.process_user_request(user_input, thread_lookup_id) for user_input, thread_lookup_id in requests
+        ))
+        await self.drain()
+        return responses
+
+
+# ---------------------------------------------------------------------------
+# Batch mode: stream a JSONL file of {"lookup_id", "text"} records through the async engine.
+# ---------------------------------------------------------------------------
+
+DEFAULT_BATCH_WORKERS = 8
+BATCH_PENDING_PER_WORKER = 4
+BATCH_CHECKPOINT_INTERVAL = 1.0
+
+class BatchCheckpoint:
+    """
+    Tracks which input lines have been processed, so an interrupted batch can resume.
 
+    Lines finish out of order, so the checkpoint keeps a watermark (every line below it is done) plus the
+    finished lines above it. It is written at most every BATCH_CHECKPOINT_INTERVAL seconds, after the
+    results it covers have been written; after a crash, recover() catches up from the output file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.watermark = 0
+        self.done = set()
+        self._last_save = 0
+        if path and os.path.exists(path):
+            with open(path, 'r') as checkpoint_file:
+                data = json.load(checkpoint_file)
+            self.watermark = data['watermark']
+            self.done = set(data['done'])
+
+    def is_done(self, line_number):
+        return line_number < self.watermark or line_number in self.done
+
+    def mark_done(self, line_number):
+        self.done.add(line_number)
+        while self.watermark in self.done:
+            self.done.remove(self.watermark)
+            self.watermark += 1
+
+    def save(self, force=False):
+        if not self.path or (not force and time.monotonic() - self._last_save < BATCH_CHECKPOINT_INTERVAL):
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as checkpoint_file:
+            json.dump({'watermark': self.watermark, 'done': sorted(self.done)}, checkpoint_file)
+        os.replace(tmp_path, self.path)
+        self._last_save = time.monotonic()
+
+    def recover(self, output_path):
+        """
+        Marks the lines that already have a result in the output file as done, and returns how many that were
+        missing from the checkpoint. The output can be ahead of the last save after a crash, and replaying
+        those requests would repeat their effects, such as creating an event twice.
+        """
+        if not os.path.exists(output_path):
+            return 0
+        recovered = 0
+        with open(output_path, 'r') as output_file:
+            for line in output_file:
+                try:
+                    line_number = json.loads(line)['line']
+                except (ValueError, KeyError, TypeError):
+                    continue  # e.g. a result cut short by the crash
+                if not self.is_done(line_number):
+                    self.mark_done(line_number)
+                    recovered += 1
+        return recovered
+
+def end_with_newline(path):
+    """
+    Terminates a last line cut short by a crash, so the next result appended to the file starts on its own line.
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb+') as output_file:
+        if output_file.seek(0, os.SEEK_END) == 0:
+            return
+        output_file.seek(-1, os.SEEK_END)
+        if output_file.read(1) != b'\n':
+            output_file.write(b'\n')
 
-def main():
+async def async_process_jsonl(engine, input_path, output_path, checkpoint_path=None, max_pending=None):
+    """
+    Streams a JSONL file of {"lookup_id", "text"} records through the engine.
+
+    :param engine: The AsyncRequestEngine; its max_concurrency is the number of workers.
+    :param input_path: The JSONL file to read, one record per line.
+    :param output_path: Results are appended here as one JSON object per line, as soon as each request finishes.
+    :param checkpoint_path: Progress file; when the batch is rerun, lines it records as done are skipped, and so
+                            are lines with a result in output_path that finished after its last save.
+    :param max_pending: Records read ahead of completion (defaults to BATCH_PENDING_PER_WORKER per worker).
+    :return: Counts of processed, failed and skipped records.
+
+    The file is read lazily and at most max_pending records are held in memory, whatever the file size.
+    Records for the same lookup_id are processed in file order.
+    """
+    checkpoint = BatchCheckpoint(checkpoint_path)
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        recovered = checkpoint.recover(output_path)
+        if recovered:
+            print(f"Recovered {recovered} finished lines from {output_path} that the checkpoint had not recorded yet.")
+        end_with_newline(output_path)
+    pending = asyncio.Semaphore(max_pending or engine.max_concurrency * BATCH_PENDING_PER_WORKER)
+    tasks = set()
+    counts = {'processed': 0, 'errors': 0, 'skipped': 0}
+
+    with open(input_path, 'r') as input_file, open(output_path, 'a') as output_file:
+
+        def finish(result):
+            output_file.write(json.dumps(result) + '\n')
+            output_file.flush()
+            checkpoint.mark_done(result['line'])
+            checkpoint.save()
+            counts['processed'] += 1
+            if 'error' in result:
+                counts['errors'] += 1
+
+        async def handle(line_number, record):
+            try:
+                response = await engine.process_user_request(record['text'], record['lookup_id'])
+                result = {'line': line_number, 'lookup_id': record['lookup_id'], 'response': response}
+                if response is None:
+                    result['error'] = "Request failed."
+                finish(result)
+            finally:
+                pending.release()
+
+        for line_number, line in enumerate(input_file):
+            if checkpoint.is_done(line_number):
+                counts['skipped'] += 1
+                continue
+            if not line.strip():
+                checkpoint.mark_done(line_number)
+                continue
+
+            try:
+                record = json.loads(line)
+                if 'lookup_id' not in record or not isinstance(record.get('text'), str):
+                    raise ValueError("records need 'lookup_id' and 'text'")
+            except ValueError as e:
+                finish({'line': line_number, 'lookup_id': None, 'response': None, 'error': f"Invalid record: {e}"})
+                continue
+
+            await pending.acquire()
+            task = asyncio.create_task(handle(line_number, record))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        await asyncio.gather(*tasks)
+        await engine.drain()
+
+    checkpoint.save(force=True)
+    return counts
+
+def run_batch(input_path, output_path, checkpoint_path=None, workers=DEFAULT_BATCH_WORKERS, assistant_id=None):
+    engine = AsyncRequestEngine(get_async_client(), assistant_id, user_proxy_list_tools, get_config()['timezone'],
+                                max_concurrency=workers)
+    counts = asyncio.run(async_process_jsonl(engine, input_path, output_path, checkpoint_path))
+    print(f"Batch finished: {counts['processed']} processed, {counts['errors']} failed, {counts['skipped']} skipped.")
+    return counts
+
+def run_service(host, port, workers, max_queue, max_user_queue=DEFAULT_MAX_USER_QUEUE, assistant_id=None):
+    engine = AsyncRequestEngine(get_async_client(), assistant_id, user_proxy_list_tools, get_config()['timezone'],
+                                max_concurrency=workers)
+    AgentService(engine, workers=workers, max_queue=max_queue, host=host, port=port,
+                 max_user_queue=max_user_queue).serve_forever()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Schedule Google Calendar events with the OpenAI Assistants API.")
+    parser.add_argument('--batch', metavar='INPUT', help="Process a JSONL file of {\"lookup_id\", \"text\"} records and exit.")
+    parser.add_argument('--output', help="JSONL file the batch results are appended to (default: INPUT.results.jsonl).")
+    parser.add_argument('--checkpoint', help="Checkpoint file for resuming a batch (default: INPUT.checkpoint).")
+    parser.add_argument('--workers', type=int, default=DEFAULT_BATCH_WORKERS, help="Concurrent requests in batch and service mode.")
+    parser.add_argument('--serve', action='store_true', help="Run as an HTTP service, one conversation per X-User-Id.")
+    parser.add_argument('--host', default='127.0.0.1', help="Service mode: address to listen on.")
+    parser.add_argument('--port', type=int, default=8080, help="Service mode: port to listen on.")
+    parser.add_argument('--max-queue', type=int, default=100, help="Service mode: queued requests before rejecting with 429.")
+    parser.add_argument('--max-user-queue', type=int, default=DEFAULT_MAX_USER_QUEUE, help="Service mode: queued requests per user before rejecting with 429.")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.batch:
+        run_batch(args.batch, args.output or args.batch + ".results.jsonl",
+                  args.checkpoint or args.batch + ".checkpoint", args.workers)
+        return
+    if args.serve:
+        run_service(args.host, args.port, args.workers, args.max_queue, args.max_user_queue)
+        return
+
+    client = get_client()
+    timezone_config = get_config()['timezone']
     thread_lookup_id = 111
     assistant_id = None  # Replace with a valid assistant_id if needed
     list_tools = user_proxy_list_tools
@@ -358,14 +1721,16 @@ def main():
     while True:
         user_input = get_user_input()
 
-        if user_input == 'exit':
+        if user_input.strip().lower() == 'exit':
             exit_program()
 
-        process_user_request(client, user_input, assistant_id, list_tools, thread_lookup_id, timezone_config)
+        response = process_user_request(client, user_input, assistant_id, list_tools, thread_lookup_id, timezone_config)
+        if response is not None:
+            print(f"Assistant: {response}")
 
 
 def get_user_input():
-    return input("Please enter your request (or type 'exit'): ").lower()
+    return input("Please enter your request (or type 'exit'): ")
 
 def exit_program():
     print("Exiting the program.")
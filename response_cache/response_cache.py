@@ -0,0 +1,205 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future
+
+DEFAULT_TTL = 24 * 60 * 60
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+DEFAULT_DISK_MAX_BYTES = 64 * 1024 * 1024
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = re.compile(r"[\s?!.]+$")
+
+def normalize_input(text):
+    """
+    Folds inputs that only differ in case, Unicode form, spacing or trailing punctuation onto one key.
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = _WHITESPACE.sub(" ", text).strip()
+    return _TRAILING_PUNCTUATION.sub("", text)
+
+def cache_key(model, system_prompt, user_input):
+    payload = json.dumps([model, system_prompt, normalize_input(user_input)], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    TTL + LRU cache of string responses, bounded by the total size of the cached values in bytes.
+
+    :param max_bytes: Upper bound for the encoded size of the values kept in memory.
+    :param ttl: Seconds an entry stays valid.
+    :param disk_path: Optional SQLite file used as a second tier that survives restarts.
+    :param disk_max_bytes: Upper bound for the size of the values kept on disk; the entries closest to
+                           expiring are dropped first.
+
+    get_or_compute() collapses concurrent misses for the same key into one call (single-flight): the first
+    caller computes the value, the others wait for it. Exceptions are passed to every waiter and not cached;
+    neither are values that aren't strings (e.g. None for a refused completion), which are returned as they are.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL, disk_path=None, disk_max_bytes=DEFAULT_DISK_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_path = disk_path
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()  # key -> (value, size, expires_at)
+        self._bytes = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'collapsed': 0, 'evictions': 0, 'disk_evictions': 0, 'expired': 0}
+
+    # Disk tier
+
+    def _disk(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.disk_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS responses ("
+                         " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, size INTEGER NOT NULL DEFAULT 0)")
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(responses)")}
+            if 'size' not in columns:
+                conn.execute("ALTER TABLE responses ADD COLUMN size INTEGER NOT NULL DEFAULT 0")
+                conn.execute("UPDATE responses SET size = LENGTH(CAST(value AS BLOB))")
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_expires_at ON responses (expires_at)")
+            self._local.conn = conn
+        return conn
+
+    def _disk_get(self, key, now):
+        row = self._disk().execute("SELECT value, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] <= now:
+            self._disk().execute("DELETE FROM responses WHERE key = ?", (key,))
+            return None
+        return row
+
+    def _disk_set(self, key, value, size, expires_at):
+        conn = self._disk()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("INSERT OR REPLACE INTO responses (key, value, expires_at, size) VALUES (?, ?, ?, ?)",
+                         (key, value, expires_at, size))
+            self._disk_purge(conn, time.time())
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _disk_purge(self, conn, now):
+        # Expired rows are dropped on every write, not just when their key is read again, and the rest is
+        # kept under disk_max_bytes by dropping the entries closest to expiring (the oldest writes).
+        conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+        excess = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0] - self.disk_max_bytes
+        if excess <= 0:
+            return
+        evicted = []
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY expires_at"):
+            evicted.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        with self._lock:
+            self._stats['disk_evictions'] += len(evicted)
+
+    # Memory tier
+
+    def _remember(self, key, value, size, expires_at):
+        # Called with the lock held.
+        if size > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous:
+            self._bytes -= previous[1]
+        self._entries[key] = (value, size, expires_at)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self._stats['evictions'] += 1
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[2] > now:
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return entry[0]
+                del self._entries[key]
+                self._bytes -= entry[1]
+                self._stats['expired'] += 1
+
+        if self.disk_path:
+            row = self._disk_get(key, now)
+            if row is not None:
+                with self._lock:
+                    self._remember(key, row[0], len(row[0].encode("utf-8")), row[1])
+                    self._stats['disk_hits'] += 1
+                return row[0]
+        return None
+
+    def set(self, key, value):
+        if not isinstance(value, str):
+            return
+        expires_at = time.time() + self.ttl
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            self._remember(key, value, size, expires_at)
+        if self.disk_path and size <= self.disk_max_bytes:
+            self._disk_set(key, value, size, expires_at)
+
+    def get_or_compute(self, key, compute):
+        """
+        Returns the cached value for key, or calls compute() once for all concurrent callers and caches it.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+                self._stats['misses'] += 1
+            else:
+                self._stats['collapsed'] += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            value = compute()
+            self.set(key, value)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self.disk_path:
+            self._disk().execute("DELETE FROM responses")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._entries), bytes=self._bytes)
+        lookups = stats['hits'] + stats['disk_hits'] + stats['misses'] + stats['collapsed']
+        stats['hit_rate'] = (stats['hits'] + stats['disk_hits'] + stats['collapsed']) / lookups if lookups else 0.0
+        return stats
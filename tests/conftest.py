@@ -0,0 +1,68 @@
+import importlib.util
+import os
+import sys
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+
+@pytest.fixture(scope="session")
+def m_agent():
+    # m-agent.py isn't importable by name; it is loaded the way benchmarks/run_benchmarks.py does it.
+    spec = importlib.util.spec_from_file_location("m_agent", os.path.join(REPO_ROOT, "m-agent.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def calendar_server(tmp_path, monkeypatch):
+    """
+    Starts a FakeCalendarServer and points the calendar tools at it; call it with the server's options.
+    """
+    import httplib2
+    from googleapiclient.discovery import build_from_document
+    import call_scheduler
+    from benchmarks.fake_calendar import FakeCalendarServer
+    from calendar_package import google_calendar_utils
+
+    servers = []
+    # The event caches are written to the working directory.
+    monkeypatch.chdir(tmp_path)
+    call_scheduler.configure_schedulers({'calendar': {'rate': 1e6, 'burst': 1e6}})
+
+    def start(**options):
+        server = FakeCalendarServer(**options).start()
+        servers.append(server)
+        document = server.discovery_document(google_calendar_utils.get_discovery_document())
+        google_calendar_utils.set_service_pool(google_calendar_utils.ServicePool(
+            lambda: build_from_document(document, http=httplib2.Http())))
+        google_calendar_utils._event_caches.clear()
+        return server
+
+    yield start
+    google_calendar_utils.set_service_pool(None)
+    google_calendar_utils._event_caches.clear()
+    for server in servers:
+        server.stop()
+
+
+@pytest.fixture
+def agent_env():
+    """
+    A freshly loaded m-agent pointed at the fake OpenAI and Calendar servers (see benchmarks/run_benchmarks.py).
+
+    Runs look up their scripted tool calls by the marker in the request, e.g. "[multi_tool]".
+    """
+    from benchmarks.run_benchmarks import BenchmarkEnvironment
+
+    with BenchmarkEnvironment(run_latency=0.01, api_latency=0.0, stream=True) as env:
+        yield env
+
+
+def pytest_configure(config):
+    # The openai client warns on every Assistants API call.
+    config.addinivalue_line("filterwarnings", "ignore:deprecated:DeprecationWarning")
+    config.addinivalue_line("filterwarnings", "ignore:The Assistants API is deprecated:DeprecationWarning")
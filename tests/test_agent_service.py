@@ -0,0 +1,131 @@
+import asyncio
+import http.client
+import json
+import socket
+import threading
+import pytest
+from agent_service import AgentService
+
+
+class BlockingEngine:
+    """
+    Stands in for AsyncRequestEngine: each request waits for release, then answers with its text.
+    """
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.log = []
+
+    async def process_user_request(self, text, lookup_id, on_delta=None):
+        self.log.append(('start', lookup_id, text))
+        await asyncio.to_thread(self.release.wait, 5)
+        if on_delta:
+            on_delta("partial")
+        self.log.append(('end', lookup_id, text))
+        return f"answer: {text}"
+
+
+@pytest.fixture
+def engine():
+    engine = BlockingEngine()
+    yield engine
+    engine.release.set()
+
+@pytest.fixture
+def make_service(engine):
+    services = []
+
+    def make(**kwargs):
+        service = AgentService(engine, host='127.0.0.1', port=0, **kwargs).start()
+        services.append(service)
+        return service
+
+    yield make
+    engine.release.set()
+    for service in services:
+        service.stop()
+
+def post(service, body, user_id='alice', headers=None):
+    conn = http.client.HTTPConnection(*service.address, timeout=5)
+    conn.request('POST', '/v1/requests', body=body, headers=dict({'X-User-Id': user_id}, **(headers or {})))
+    response = conn.getresponse()
+    return response.status, dict(response.getheaders()), response.read()
+
+def wait_for(job, event):
+    while True:
+        name, data = job.events.get(timeout=5)
+        if name == event:
+            return data
+
+
+def test_answers_as_json(engine, make_service):
+    service = make_service()
+    engine.release.set()
+    status, _, body = post(service, json.dumps({'text': "what's on tomorrow"}))
+    assert (status, json.loads(body)) == (200, {'response': "answer: what's on tomorrow"})
+    assert engine.log[0] == ('start', 'user:alice', "what's on tomorrow")
+
+def test_streams_server_sent_events(engine, make_service):
+    service = make_service()
+    engine.release.set()
+    status, headers, body = post(service, json.dumps({'text': "hi"}), headers={'Accept': 'text/event-stream'})
+    assert status == 200 and headers['Content-Type'] == 'text/event-stream'
+    events = [block.split('\n')[0][len('event: '):] for block in body.decode().strip().split('\n\n')]
+    assert events == ['queued', 'started', 'delta', 'completed']
+
+@pytest.mark.parametrize("body, headers, status", [
+    (b'{"text": "hi"}', {'X-User-Id': 'not valid!'}, 400),
+    (b'{"text": ""}', {}, 400),
+    (b'not json', {}, 400),
+    (b'x' * (64 * 1024 + 1), {}, 413),
+], ids=["bad user id", "empty text", "not json", "too large"])
+def test_rejects_bad_requests(make_service, body, headers, status):
+    service = make_service()
+    assert post(service, body, user_id=headers.get('X-User-Id', 'alice'))[0] == status
+
+@pytest.mark.parametrize("length", ["abc", "-1"])
+def test_rejects_invalid_content_length(make_service, length):
+    service = make_service()
+    # http.client always sends a valid Content-Length, so the request is written by hand.
+    with socket.create_connection(service.address, timeout=5) as sock:
+        sock.sendall(f"POST /v1/requests HTTP/1.1\r\nHost: test\r\nX-User-Id: alice\r\nContent-Length: {length}\r\n\r\n".encode())
+        status_line = sock.makefile('rb').readline()
+    assert status_line.split()[1] == b'400'
+
+def test_full_queue_answers_429_with_retry_after(engine, make_service):
+    service = make_service(workers=1, max_queue=1)
+    wait_for(service.submit('alice', "first"), 'started')
+    assert service.submit('bob', "second") is not None
+    status, headers, body = post(service, json.dumps({'text': "third"}), user_id='carol')
+    assert status == 429
+    assert int(headers['Retry-After']) >= 1 and json.loads(body)['retry_after'] == int(headers['Retry-After'])
+    conn = http.client.HTTPConnection(*service.address, timeout=5)
+    conn.request('GET', '/health')
+    assert conn.getresponse().status == 503
+
+def test_user_requests_run_in_order_without_blocking_others(engine, make_service):
+    service = make_service(workers=4, max_queue=10, max_user_queue=1)
+    first = service.submit('alice', "first")
+    wait_for(first, 'started')
+    second = service.submit('alice', "second")
+    assert second is not None
+    # Alice already has one request waiting behind the one in flight.
+    assert service.submit('alice', "third") is None
+    bob = service.submit('bob', "other")
+    wait_for(bob, 'started')
+    assert ('start', 'user:alice', "second") not in engine.log
+    engine.release.set()
+    for job in (first, second, bob):
+        wait_for(job, 'completed')
+    alice = [entry for entry in engine.log if entry[1] == 'user:alice']
+    assert alice == [('start', 'user:alice', "first"), ('end', 'user:alice', "first"),
+                     ('start', 'user:alice', "second"), ('end', 'user:alice', "second")]
+
+def test_metrics_count_accepted_and_rejected_requests(engine, make_service):
+    service = make_service(workers=1, max_queue=0)
+    post(service, json.dumps({'text': "hi"}))
+    conn = http.client.HTTPConnection(*service.address, timeout=5)
+    conn.request('GET', '/metrics')
+    metrics = conn.getresponse().read().decode()
+    assert 'service_requests' in metrics and 'rejected' in metrics
+    assert 'm_agent_service_queue_depth 0' in metrics
@@ -0,0 +1,45 @@
+import shelve
+import pytest
+import assistant_registry
+from assistant_registry import (assistant_registry_key, tools_fingerprint, lookup_assistant, register_assistant,
+                                forget_assistant, SQLiteAssistantRegistry, create_default_registry, set_assistant_registry)
+
+
+@pytest.fixture
+def registry_path(tmp_path):
+    path = str(tmp_path / 'assistants.sqlite3')
+    set_assistant_registry(SQLiteAssistantRegistry(path))
+    yield path
+    set_assistant_registry(None)
+
+
+def test_keys_and_fingerprints_are_stable():
+    key = assistant_registry_key("Scheduler", "gpt-4o", "You schedule things.")
+    assert key == assistant_registry_key("Scheduler", "gpt-4o", "You schedule things.")
+    assert key != assistant_registry_key("Scheduler", "gpt-4o-mini", "You schedule things.")
+    assert tools_fingerprint([{'b': 1, 'a': 2}]) == tools_fingerprint([{'a': 2, 'b': 1}])
+
+def test_records_are_shared_between_registries_on_one_file(registry_path):
+    register_assistant('key', 'asst_1', 'fp_1')
+    # A second process opens the same database.
+    other = SQLiteAssistantRegistry(registry_path)
+    assert other.get('key') == {'assistant_id': 'asst_1', 'tools_fingerprint': 'fp_1'}
+    other.put('key', {'assistant_id': 'asst_1', 'tools_fingerprint': 'fp_2'})
+    set_assistant_registry(SQLiteAssistantRegistry(registry_path))
+    assert lookup_assistant('key') == {'assistant_id': 'asst_1', 'tools_fingerprint': 'fp_2'}
+
+def test_forget_only_drops_a_record_still_pointing_at_the_assistant(registry_path):
+    register_assistant('key', 'asst_2', 'fp')
+    forget_assistant('key', 'asst_1')
+    assert lookup_assistant('key')['assistant_id'] == 'asst_2'
+    forget_assistant('key', 'asst_2')
+    assert lookup_assistant('key') is None
+    assert SQLiteAssistantRegistry(registry_path).get('key') is None
+
+def test_new_database_imports_the_shelve_registry(tmp_path, monkeypatch):
+    legacy = str(tmp_path / 'assistants_db')
+    with shelve.open(legacy) as registry_shelf:
+        registry_shelf['key'] = {'assistant_id': 'asst_old', 'tools_fingerprint': 'fp_old'}
+    monkeypatch.setattr(assistant_registry.assistant_registry, 'LEGACY_SHELVE_DB', legacy)
+    registry = create_default_registry(str(tmp_path / 'assistants.sqlite3'))
+    assert registry.get('key') == {'assistant_id': 'asst_old', 'tools_fingerprint': 'fp_old'}
@@ -0,0 +1,30 @@
+import asyncio
+import pytest
+import thread_store
+
+
+def thread_messages(env, lookup_id):
+    thread_id = thread_store.check_if_thread_exists(lookup_id)
+    page = env.client.beta.threads.messages.list(thread_id=thread_id, order="asc", limit=100)
+    return [(message.role, env.m_agent.message_text(message)) for message in page.data]
+
+
+@pytest.mark.parametrize("stream", [True, False], ids=["stream", "poll"])
+def test_async_engine_serves_conversations_concurrently_in_order(agent_env, stream):
+    m_agent = agent_env.m_agent
+    engine = m_agent.AsyncRequestEngine(agent_env.async_client, list_tools=m_agent.user_proxy_list_tools,
+                                        timezone_config="UTC", max_concurrency=8, stream=stream, fast_path=False)
+    requests = [(f"[single_query] {user} {turn}", user) for turn in range(3) for user in ("alice", "bob", "carol")]
+    responses = asyncio.run(engine.process_many(requests))
+    assert responses == ["You have a few meetings tomorrow."] * len(requests)
+    # Requests sharing a lookup id ran one after another, in the order they were submitted.
+    assert [text for role, text in thread_messages(agent_env, "alice") if role == 'user'] == [
+        "[single_query] alice 0", "[single_query] alice 1", "[single_query] alice 2"]
+
+def test_async_engine_runs_tool_rounds(agent_env):
+    m_agent = agent_env.m_agent
+    engine = m_agent.AsyncRequestEngine(agent_env.async_client, list_tools=m_agent.user_proxy_list_tools,
+                                        timezone_config="UTC", fast_path=False)
+    responses = asyncio.run(engine.process_many([("[bulk_scheduling] quarter", "dave")]))
+    assert responses == ["Scheduled your weekly 1:1s for the quarter."]
+    assert agent_env.snapshot_counts()[1]["POST batch"] == 1
@@ -0,0 +1,78 @@
+import asyncio
+import json
+
+
+def test_batch_checkpoint_watermark_and_resume(m_agent, tmp_path):
+    path = str(tmp_path / 'requests.jsonl.checkpoint')
+    checkpoint = m_agent.BatchCheckpoint(path)
+    for line_number in (0, 2, 3, 5):
+        checkpoint.mark_done(line_number)
+    assert checkpoint.watermark == 1
+    assert checkpoint.done == {2, 3, 5}
+    checkpoint.save(force=True)
+
+    resumed = m_agent.BatchCheckpoint(path)
+    assert [line for line in range(7) if not resumed.is_done(line)] == [1, 4, 6]
+    resumed.mark_done(1)
+    assert resumed.watermark == 4
+    assert resumed.done == {5}
+
+def test_batch_checkpoint_without_path_is_not_saved(m_agent, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    checkpoint = m_agent.BatchCheckpoint(None)
+    checkpoint.mark_done(0)
+    checkpoint.save(force=True)
+    assert list(tmp_path.iterdir()) == []
+
+def test_recover_marks_results_newer_than_the_checkpoint(m_agent, tmp_path):
+    output_path = tmp_path / 'results.jsonl'
+    output_path.write_text('{"line": 0}\n{"line": 3}\n{"line": 1}\n{"li')
+    checkpoint = m_agent.BatchCheckpoint(None)
+    checkpoint.mark_done(0)
+    assert checkpoint.recover(str(output_path)) == 2
+    assert [line for line in range(5) if not checkpoint.is_done(line)] == [2, 4]
+
+
+class FakeEngine:
+    max_concurrency = 4
+
+    def __init__(self):
+        self.requests = []
+
+    async def process_user_request(self, text, lookup_id):
+        self.requests.append(text)
+        return f"done: {text}"
+
+    async def drain(self):
+        pass
+
+
+def write_batch(path, texts):
+    path.write_text(''.join(json.dumps({'lookup_id': index, 'text': text}) + '\n' for index, text in enumerate(texts)))
+
+def test_batch_resume_does_not_replay_finished_requests(m_agent, tmp_path):
+    input_path, output_path, checkpoint_path = tmp_path / 'in.jsonl', tmp_path / 'out.jsonl', tmp_path / 'in.checkpoint'
+    write_batch(input_path, ["schedule A", "schedule B", "schedule C", "schedule D"])
+    # The previous run saved a checkpoint after line 0, then finished lines 1 and 3 and crashed mid-write.
+    checkpoint = m_agent.BatchCheckpoint(str(checkpoint_path))
+    checkpoint.mark_done(0)
+    checkpoint.save(force=True)
+    output_path.write_text('{"line": 0, "response": "ok"}\n{"line": 1, "response": "ok"}\n'
+                           '{"line": 3, "response": "ok"}\n{"line": 2, "resp')
+
+    engine = FakeEngine()
+    counts = asyncio.run(m_agent.async_process_jsonl(engine, str(input_path), str(output_path), str(checkpoint_path)))
+    assert engine.requests == ["schedule C"]
+    assert counts == {'processed': 1, 'errors': 0, 'skipped': 3}
+    results = [json.loads(line) for line in output_path.read_text().splitlines()[-1:]]
+    assert results == [{'line': 2, 'lookup_id': 2, 'response': "done: schedule C"}]
+    assert m_agent.BatchCheckpoint(str(checkpoint_path)).watermark == 4
+
+def test_batch_reports_invalid_records(m_agent, tmp_path):
+    input_path, output_path = tmp_path / 'in.jsonl', tmp_path / 'out.jsonl'
+    input_path.write_text('{"lookup_id": 1, "text": "hi"}\n\nnot json\n{"text": "no id"}\n')
+    engine = FakeEngine()
+    counts = asyncio.run(m_agent.async_process_jsonl(engine, str(input_path), str(output_path)))
+    assert counts == {'processed': 3, 'errors': 2, 'skipped': 0}
+    errors = {result['line']: result.get('error', '') for result in map(json.loads, output_path.read_text().splitlines())}
+    assert errors[0] == '' and errors[2].startswith("Invalid record") and errors[3].startswith("Invalid record")
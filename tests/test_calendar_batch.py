@@ -0,0 +1,66 @@
+from datetime import datetime, timezone
+import pytest
+from calendar_package import google_calendar_utils
+from calendar_package.google_calendar_utils import batch_calendar_mutations, get_event_cache
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(google_calendar_utils.time, "sleep", sleeps.append)
+    return sleeps
+
+def event_body(event_id, summary, hour):
+    return {'id': event_id, 'summary': summary,
+            'start': {'dateTime': f'2024-10-21T{hour:02d}:00:00+00:00'}, 'end': {'dateTime': f'2024-10-21T{hour:02d}:30:00+00:00'}}
+
+def stored(server):
+    _, response = server.list_events({}, {}, 'primary')
+    return {event['id']: event for event in response['items']}
+
+
+def test_results_are_reported_per_item_in_order(calendar_server):
+    server = calendar_server()
+    server.seed('primary', [event_body('existing', "Old title", 9)])
+    results = batch_calendar_mutations(
+        inserts=[event_body('new1', "Planning", 10), event_body('new2', "Review", 11)],
+        updates=[{'event_id': 'existing', 'update_body': event_body('existing', "New title", 9)}],
+        deletes=['missing'])
+    assert [(result['operation'], result['event_id'], 'error' in result) for result in results] == [
+        ('insert', 'new1', False), ('insert', 'new2', False), ('update', 'existing', False), ('delete', 'missing', True)]
+    assert stored(server)['existing']['summary'] == "New title"
+    assert server.call_counts["POST batch"] == 1
+    # Applied changes are written through to the event cache.
+    day = (datetime(2024, 10, 21, tzinfo=timezone.utc).timestamp(), datetime(2024, 10, 22, tzinfo=timezone.utc).timestamp())
+    assert [event['summary'] for event in get_event_cache('primary').query(*day)] == ["New title", "Planning", "Review"]
+
+def test_batches_are_split_into_chunks(calendar_server, monkeypatch):
+    server = calendar_server()
+    monkeypatch.setattr(google_calendar_utils, "BATCH_MAX_SIZE", 2)
+    results = batch_calendar_mutations(inserts=[event_body(f'event{index}', "Standup", 9 + index) for index in range(5)])
+    assert all('error' not in result for result in results)
+    assert server.call_counts["POST batch"] == 3
+    assert len(stored(server)) == 5
+
+def test_rate_limited_items_are_retried(calendar_server, no_backoff):
+    server = calendar_server(rate_limit_every=3)
+    results = batch_calendar_mutations(inserts=[event_body(f'event{index}', "Standup", 9 + index) for index in range(6)])
+    assert all('error' not in result for result in results)
+    assert sorted(stored(server)) == [f'event{index}' for index in range(6)]
+    assert no_backoff and server.call_counts["POST batch"] >= 2
+
+def test_duplicate_insert_from_an_earlier_attempt_counts_as_inserted(calendar_server):
+    server = calendar_server()
+    # An earlier attempt of this batch already created the event before the response was lost.
+    server.seed('primary', [event_body('event1', "Planning", 10)])
+    results = batch_calendar_mutations(inserts=[event_body('event1', "Planning", 10)])
+    assert results[0]['operation'] == 'insert' and 'error' not in results[0]
+    assert results[0]['event']['summary'] == "Planning"
+    assert len(stored(server)) == 1
+
+def test_backoff_gives_up_at_the_deadline(calendar_server, monkeypatch, no_backoff):
+    calendar_server(rate_limit_every=2)
+    monkeypatch.setattr(google_calendar_utils, "BATCH_RETRY_DEADLINE", 0)
+    results = batch_calendar_mutations(inserts=[event_body(f'event{index}', "Standup", 9 + index) for index in range(4)])
+    assert [result.get('error') for result in results] == [None, "Rate limited; not applied. Retry it later."] * 2
+    assert no_backoff == []
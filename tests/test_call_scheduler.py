@@ -0,0 +1,88 @@
+import pytest
+from call_scheduler import call_scheduler
+from call_scheduler.call_scheduler import TokenBucket, CircuitBreaker, CircuitOpenError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(call_scheduler.time, "monotonic", clock)
+    return clock
+
+
+def test_token_bucket_serves_burst_then_queues(clock):
+    bucket = TokenBucket(rate=10, capacity=2)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.1)
+    assert bucket.reserve() == pytest.approx(0.2)
+
+def test_token_bucket_refills_up_to_capacity(clock):
+    bucket = TokenBucket(rate=10, capacity=2)
+    bucket.reserve(2)
+    clock.now += 60
+    assert bucket.reserve(2) == 0
+    assert bucket.reserve() == pytest.approx(0.1)
+
+def test_token_bucket_pause_holds_back_callers(clock):
+    bucket = TokenBucket(rate=10, capacity=5)
+    bucket.pause(3)
+    assert bucket.reserve() == pytest.approx(3.1)
+
+
+def test_circuit_breaker_opens_after_threshold(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    for _ in range(2):
+        breaker.before_call("calendar")
+        breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call("calendar")
+
+def test_circuit_breaker_success_resets_failure_count(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+def test_circuit_breaker_lets_one_trial_through_when_half_open(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    breaker.before_call("calendar")
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call("calendar")
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.before_call("calendar")
+
+def test_circuit_breaker_reopens_when_trial_fails(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    breaker.before_call("calendar")
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call("calendar")
+
+def test_circuit_breaker_neutral_result_frees_trial_slot(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    breaker.before_call("calendar")
+    breaker.record_neutral()
+    assert breaker.state == "half_open"
+    breaker.before_call("calendar")
@@ -0,0 +1,45 @@
+from types import SimpleNamespace
+
+import pytest
+import thread_store
+
+MULTI_TOOL_REPLY = "Checked three ranges and scheduled the follow-up."
+
+
+def request(env, text, lookup_id, stream):
+    m_agent = env.m_agent
+    return m_agent.process_user_request(env.client, text, None, m_agent.user_proxy_list_tools, lookup_id, "UTC",
+                                        stream=stream, fast_path=False)
+
+
+def thread_messages(env, lookup_id):
+    thread_id = thread_store.check_if_thread_exists(lookup_id)
+    page = env.client.beta.threads.messages.list(thread_id=thread_id, order="asc", limit=100)
+    return [(message.role, env.m_agent.message_text(message)) for message in page.data]
+
+
+@pytest.mark.parametrize("stream", [True, False], ids=["stream", "poll"])
+def test_follow_up_reuses_the_thread_and_returns_only_its_reply(agent_env, stream):
+    assert request(agent_env, "[multi_tool] first", "user-1", stream) == MULTI_TOOL_REPLY
+    assert request(agent_env, "[single_query] second", "user-1", stream) == "You have a few meetings tomorrow."
+    assert thread_messages(agent_env, "user-1") == [
+        ('user', "[multi_tool] first"), ('assistant', MULTI_TOOL_REPLY),
+        ('user', "[single_query] second"), ('assistant', "You have a few meetings tomorrow.")]
+
+
+def test_completed_run_pages_through_only_its_own_messages(agent_env, monkeypatch):
+    m_agent, server = agent_env.m_agent, agent_env.openai_server
+    monkeypatch.setattr(m_agent, "RUN_MESSAGES_PAGE_SIZE", 1)
+    thread = agent_env.client.beta.threads.create()
+    server._add_message(thread.id, "assistant", "Earlier reply.", run_id="run_old")
+    server._add_message(thread.id, "user", "Book it.")
+    for text in ["Booked.", "", "Anything else?"]:
+        server._add_message(thread.id, "assistant", text, run_id="run_new")
+    server._add_message(thread.id, "assistant", "Later reply.", run_id="run_later")
+
+    pages_before = server.call_counts["GET list_messages"]
+    reply = m_agent.process_completed_run(thread, SimpleNamespace(id="run_new"), agent_env.client)
+
+    assert reply == "Booked.\n\nAnything else?"
+    # One page per message of the run; the last page reports has_more=False.
+    assert server.call_counts["GET list_messages"] - pages_before == 3
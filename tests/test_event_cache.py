@@ -0,0 +1,88 @@
+from datetime import datetime
+import pytz
+from calendar_package.event_cache import EventCache, event_bounds, trim_event
+
+LOS_ANGELES = pytz.timezone('America/Los_Angeles')
+
+
+def timed_event(event_id, start, end):
+    return {'id': event_id, 'status': 'confirmed', 'summary': event_id,
+            'start': {'dateTime': start}, 'end': {'dateTime': end}}
+
+def all_day_event(event_id, day, next_day):
+    return {'id': event_id, 'status': 'confirmed', 'summary': event_id, 'start': {'date': day}, 'end': {'date': next_day}}
+
+def local_day(tz, year, month, day):
+    return tz.localize(datetime(year, month, day)).timestamp(), tz.localize(datetime(year, month, day + 1)).timestamp()
+
+def ids(events):
+    return [event['id'] for event in events]
+
+
+def test_all_day_event_is_placed_in_calendar_time_zone():
+    event = all_day_event('a', '2024-10-20', '2024-10-21')
+    assert event_bounds(event, 'America/Los_Angeles') == local_day(LOS_ANGELES, 2024, 10, 20)
+    # The event's own timeZone wins over the calendar's.
+    event['start']['timeZone'] = event['end']['timeZone'] = 'UTC'
+    assert event_bounds(event, 'America/Los_Angeles') == local_day(pytz.utc, 2024, 10, 20)
+
+def test_query_returns_all_day_event_only_on_its_local_day(tmp_path):
+    cache = EventCache('primary', path=str(tmp_path / 'primary.json'))
+    cache.set_time_zone('America/Los_Angeles')
+    cache.apply(all_day_event('holiday', '2024-10-20', '2024-10-21'))
+    assert ids(cache.query(*local_day(LOS_ANGELES, 2024, 10, 19))) == []
+    assert ids(cache.query(*local_day(LOS_ANGELES, 2024, 10, 20))) == ['holiday']
+
+def test_set_time_zone_replaces_cached_all_day_events(tmp_path):
+    cache = EventCache('primary', path=str(tmp_path / 'primary.json'))
+    cache.apply(all_day_event('holiday', '2024-10-20', '2024-10-21'))
+    # Placed in UTC, the day starts on the evening of Oct 19 in Los Angeles.
+    assert ids(cache.query(*local_day(LOS_ANGELES, 2024, 10, 19))) == ['holiday']
+    cache.set_time_zone('America/Los_Angeles')
+    assert ids(cache.query(*local_day(LOS_ANGELES, 2024, 10, 19))) == []
+
+def test_query_finds_long_events_started_before_range(tmp_path):
+    cache = EventCache('primary', path=str(tmp_path / 'primary.json'))
+    cache.apply(timed_event('conference', '2024-10-14T09:00:00+00:00', '2024-10-18T17:00:00+00:00'))
+    cache.apply(timed_event('standup', '2024-10-16T09:00:00+00:00', '2024-10-16T09:15:00+00:00'))
+    cache.apply(timed_event('lunch', '2024-10-16T12:00:00+00:00', '2024-10-16T13:00:00+00:00'))
+    day = local_day(pytz.utc, 2024, 10, 16)
+    assert ids(cache.query(*day)) == ['conference', 'standup', 'lunch']
+    assert ids(cache.query(*day, max_results=2)) == ['conference', 'standup']
+    # Back-to-back events don't overlap.
+    end_of_standup = datetime(2024, 10, 16, 9, 15, tzinfo=pytz.utc).timestamp()
+    assert ids(cache.query(end_of_standup, end_of_standup + 3600)) == ['conference']
+
+def test_cancelled_and_moved_events_leave_the_index(tmp_path):
+    cache = EventCache('primary', path=str(tmp_path / 'primary.json'))
+    cache.apply(timed_event('a', '2024-10-16T09:00:00+00:00', '2024-10-16T10:00:00+00:00'))
+    cache.apply(timed_event('b', '2024-10-16T11:00:00+00:00', '2024-10-16T12:00:00+00:00'))
+    cache.apply(timed_event('a', '2024-10-17T09:00:00+00:00', '2024-10-17T10:00:00+00:00'))
+    cache.apply({'id': 'b', 'status': 'cancelled'})
+    assert ids(cache.query(*local_day(pytz.utc, 2024, 10, 16))) == []
+    assert ids(cache.query(*local_day(pytz.utc, 2024, 10, 17))) == ['a']
+
+def test_save_and_load_keep_time_zone(tmp_path):
+    path = str(tmp_path / 'primary.json')
+    cache = EventCache('primary', path=path)
+    cache.set_time_zone('America/Los_Angeles')
+    cache.apply(all_day_event('holiday', '2024-10-20', '2024-10-21'))
+    cache.sync_token = 'token-1'
+    cache.save()
+
+    reloaded = EventCache('primary', path=path)
+    assert reloaded.sync_token == 'token-1'
+    assert reloaded.time_zone == 'America/Los_Angeles'
+    assert ids(reloaded.query(*local_day(LOS_ANGELES, 2024, 10, 20))) == ['holiday']
+
+
+def test_trim_event_keeps_only_own_attendee_entry():
+    event = {'id': 'a', 'summary': 'Review', 'description': 'long text', 'etag': '"1"',
+             'start': {'dateTime': '2024-10-16T09:00:00Z'}, 'end': {'dateTime': '2024-10-16T10:00:00Z'},
+             'attendees': [{'email': 'me@example.com', 'self': True, 'responseStatus': 'declined'},
+                           {'email': 'you@example.com', 'responseStatus': 'accepted'}]}
+    trimmed = trim_event(event)
+    assert 'description' not in trimmed and 'etag' not in trimmed
+    assert trimmed['attendees'] == [{'self': True, 'responseStatus': 'declined'}]
+    del event['attendees'][0]
+    assert 'attendees' not in trim_event(event)
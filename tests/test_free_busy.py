@@ -0,0 +1,50 @@
+import random
+from datetime import datetime, time
+import pytz
+from calendar_package.free_busy import IntervalTree, search_windows, free_slots
+
+
+def test_overlapping_matches_brute_force():
+    rng = random.Random(7)
+    blocks = []
+    for index in range(300):
+        start = rng.uniform(0, 10000)
+        blocks.append((start, start + rng.uniform(1, 500), index))
+    tree = IntervalTree(blocks)
+    assert len(tree) == 300
+    for _ in range(200):
+        start = rng.uniform(-100, 10100)
+        end = start + rng.uniform(1, 1000)
+        expected = sorted((block for block in blocks if block[0] < end and block[1] > start),
+                          key=lambda block: (block[0], block[1]))
+        assert tree.overlapping(start, end) == expected
+
+def test_overlapping_excludes_touching_blocks():
+    tree = IntervalTree([(0, 10, 'a'), (20, 30, 'b')])
+    assert tree.overlapping(10, 20) == []
+    assert tree.overlapping(9, 21) == [(0, 10, 'a'), (20, 30, 'b')]
+
+def test_free_gaps_merges_overlapping_blocks():
+    tree = IntervalTree([(10, 20, 'a'), (15, 30, 'b'), (18, 25, 'c'), (40, 50, 'd')])
+    assert list(tree.free_gaps(0, 60)) == [(0, 10), (30, 40), (50, 60)]
+    assert list(tree.free_gaps(12, 28)) == []
+
+def test_free_gaps_of_empty_tree():
+    assert list(IntervalTree([]).free_gaps(0, 60)) == [(0, 60)]
+
+
+def test_search_windows_skip_weekends_and_follow_dst():
+    tz = pytz.timezone('America/New_York')
+    # Friday 2024-03-08 to Tuesday 2024-03-12; clocks moved forward on Sunday 2024-03-10.
+    windows = search_windows(tz.localize(datetime(2024, 3, 8)), tz.localize(datetime(2024, 3, 12, 23)), tz,
+                             time(9), time(17), include_weekends=False)
+    opened = [datetime.fromtimestamp(start, tz) for start, _ in windows]
+    assert [moment.strftime('%a %H:%M') for moment in opened] == ['Fri 09:00', 'Mon 09:00', 'Tue 09:00']
+    assert all(end - start == 8 * 3600 for start, end in windows)
+
+def test_free_slots_align_to_step_and_need_full_duration():
+    tree = IntervalTree([(0, 1000, 'a'), (2000, 5000, 'b')])
+    # The first gap starts at 1000, which rounds up to 1800, leaving only 200 seconds before 2000.
+    assert free_slots(tree, [(0, 8000)], duration=900, step=900) == [(5400, 8000)]
+    assert free_slots(tree, [(0, 8000)], duration=600) == [(1000, 2000), (5000, 8000)]
+    assert free_slots(tree, [(0, 8000)], duration=600, max_results=1) == [(1000, 2000)]
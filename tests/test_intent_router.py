@@ -0,0 +1,65 @@
+from datetime import date, datetime
+import pytest
+import pytz
+from intent_router.intent_router import match_list_events, parse_date_range
+
+# A Wednesday.
+NOW = pytz.timezone('America/New_York').localize(datetime(2024, 10, 16, 10, 0))
+
+
+def matched_range(text):
+    match = match_list_events(text, NOW)
+    assert match is not None, text
+    return match['params']['start_date'], match['params']['end_date']
+
+
+@pytest.mark.parametrize("text, start, end", [
+    ("What's on my calendar today?", date(2024, 10, 16), date(2024, 10, 17)),
+    ("show my events tomorrow", date(2024, 10, 17), date(2024, 10, 18)),
+    ("what do I have this week", date(2024, 10, 16), date(2024, 10, 21)),
+    ("list events next week", date(2024, 10, 21), date(2024, 10, 28)),
+    ("anything on my calendar this weekend?", date(2024, 10, 19), date(2024, 10, 21)),
+    ("anything on my calendar next weekend?", date(2024, 10, 26), date(2024, 10, 28)),
+    ("what's on my calendar on friday", date(2024, 10, 18), date(2024, 10, 19)),
+    ("my meetings next wednesday", date(2024, 10, 23), date(2024, 10, 24)),
+    ("my schedule for the next 3 days", date(2024, 10, 16), date(2024, 10, 19)),
+])
+def test_matches_date_ranges(text, start, end):
+    assert matched_range(text) == (start, end)
+
+def test_next_weekend_from_sunday_skips_current_weekend():
+    start, end, label, _ = parse_date_range("next weekend", date(2024, 10, 20))
+    assert (start, end, label) == (date(2024, 10, 26), date(2024, 10, 28), "next weekend")
+    start, end, label, _ = parse_date_range("this weekend", date(2024, 10, 20))
+    assert (start, end) == (date(2024, 10, 20), date(2024, 10, 21))
+
+@pytest.mark.parametrize("text", [
+    "what's on my calendar until friday",
+    "events since monday",
+    "what did I have last weekend",
+    "my meetings the week after next week",
+    "what is on my calendar on the weekend of 2024-05-04",
+    "What is on my calendar for the week of 2024-05-06?",
+    "my events for the month of 2024-05-01",
+    "what do I have on friday next week",
+    "my meetings on monday and tuesday",
+    "anything on my calendar tomorrow or the day after tomorrow",
+])
+def test_refuses_qualified_date_ranges(text):
+    assert match_list_events(text, NOW) is None
+
+@pytest.mark.parametrize("text", [
+    "cancel my meetings tomorrow",
+    "move everything on friday",
+    "schedule lunch tomorrow",
+    "what's the weather tomorrow",
+])
+def test_refuses_changes_and_requests_without_a_date_query(text):
+    match = match_list_events(text, NOW)
+    assert match is None or match['confidence'] < 0.8
+
+def test_confidence_drops_with_unexplained_words():
+    plain = match_list_events("what's on my calendar tomorrow", NOW)['confidence']
+    noisy = match_list_events("what's on my calendar tomorrow with the marketing folks", NOW)['confidence']
+    assert plain == 1.0
+    assert noisy < 0.8
@@ -0,0 +1,107 @@
+import sqlite3
+import threading
+import time
+import pytest
+from response_cache import ResponseCache, cache_key
+from response_cache import response_cache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(response_cache.time, "time", clock)
+    return clock
+
+def disk_rows(path):
+    with sqlite3.connect(path) as conn:
+        return dict(conn.execute("SELECT key, value FROM responses").fetchall())
+
+
+def test_keys_fold_case_spacing_and_trailing_punctuation():
+    assert cache_key("m", "p", "What is  a Calendar?") == cache_key("m", "p", "what is a calendar")
+    assert cache_key("m", "p", "what is a calendar") != cache_key("other", "p", "what is a calendar")
+
+def test_memory_tier_is_bounded_by_bytes_in_lru_order():
+    cache = ResponseCache(max_bytes=10)
+    cache.set('a', "aaaa")
+    cache.set('b', "bbbb")
+    assert cache.get('a') == "aaaa"
+    cache.set('c', "cccc")
+    assert (cache.get('a'), cache.get('b'), cache.get('c')) == ("aaaa", None, "cccc")
+    cache.set('big', "x" * 11)
+    assert cache.get('big') is None
+    assert cache.stats()['bytes'] == 8
+
+def test_entries_expire(clock):
+    cache = ResponseCache(ttl=60)
+    cache.set('a', "answer")
+    clock.now += 59
+    assert cache.get('a') == "answer"
+    clock.now += 2
+    assert cache.get('a') is None
+
+def test_concurrent_misses_compute_once():
+    cache = ResponseCache()
+    calls = []
+    gate = threading.Event()
+
+    def compute():
+        calls.append(1)
+        gate.wait(5)
+        return "answer"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute('k', compute))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    gate.set()
+    for thread in threads:
+        thread.join()
+    assert results == ["answer"] * 8
+    assert len(calls) == 1
+    assert cache.stats()['collapsed'] == 7
+
+def test_failures_and_non_strings_are_not_cached(tmp_path):
+    cache = ResponseCache(disk_path=str(tmp_path / 'cache.sqlite3'))
+
+    def fail():
+        raise RuntimeError("rate limited")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_compute('k', fail)
+    assert cache.get_or_compute('k', lambda: None) is None
+    assert cache.get_or_compute('k', lambda: "answer") == "answer"
+    assert cache.get('k') == "answer"
+
+def test_disk_tier_survives_a_restart(tmp_path):
+    path = str(tmp_path / 'cache.sqlite3')
+    ResponseCache(disk_path=path).set('k', "answer")
+    restarted = ResponseCache(disk_path=path)
+    assert restarted.get('k') == "answer"
+    assert restarted.stats()['disk_hits'] == 1
+
+def test_disk_tier_purges_expired_rows_on_write(tmp_path, clock):
+    path = str(tmp_path / 'cache.sqlite3')
+    cache = ResponseCache(ttl=60, disk_path=path)
+    cache.set('old', "stale")
+    clock.now += 61
+    cache.set('new', "fresh")
+    assert disk_rows(path) == {'new': "fresh"}
+
+def test_disk_tier_is_bounded_by_bytes(tmp_path, clock):
+    path = str(tmp_path / 'cache.sqlite3')
+    cache = ResponseCache(disk_path=path, disk_max_bytes=10)
+    for key in ('a', 'b', 'c'):
+        cache.set(key, key * 4)
+        clock.now += 1
+    assert disk_rows(path) == {'b': "bbbb", 'c': "cccc"}
+    assert cache.stats()['disk_evictions'] == 1
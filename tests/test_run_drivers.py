@@ -0,0 +1,22 @@
+import pytest
+
+MULTI_TOOL_REPLY = "Checked three ranges and scheduled the follow-up."
+
+
+def request(env, text, lookup_id, stream):
+    m_agent = env.m_agent
+    return m_agent.process_user_request(env.client, text, None, m_agent.user_proxy_list_tools, lookup_id, "UTC",
+                                        stream=stream, fast_path=False)
+
+
+@pytest.mark.parametrize("stream", [True, False], ids=["stream", "poll"])
+def test_run_with_tool_rounds_completes(agent_env, stream):
+    assert request(agent_env, "[multi_tool] plan my week", "user-1", stream) == MULTI_TOOL_REPLY
+    openai_calls, calendar_calls = agent_env.snapshot_counts()
+    # Both rounds of tool calls reached the calendar: three listings, then the insert.
+    assert calendar_calls["POST insert_event"] == 1
+    assert openai_calls["POST submit_tool_outputs"] == 2
+    if stream:
+        assert openai_calls.get("GET retrieve_run", 0) == 0
+    else:
+        assert openai_calls["GET retrieve_run"] >= 3
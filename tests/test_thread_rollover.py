@@ -0,0 +1,91 @@
+import pytest
+import thread_store
+
+HISTORY = [("user", "Book lunch with Sam on Friday."), ("assistant", "Booked lunch with Sam for Friday at noon."),
+           ("user", "Move it to 1pm."), ("assistant", "Moved lunch with Sam to 1pm."),
+           ("user", "What's on Monday?"), ("assistant", "You have a standup at 9am.")]
+
+
+@pytest.fixture
+def rollover(agent_env, monkeypatch):
+    monkeypatch.setitem(agent_env.m_agent.get_config(), 'thread_rollover',
+                        {'max_messages': 6, 'max_tokens': 1000, 'keep_messages': 2})
+    return agent_env
+
+
+def seed_thread(env, lookup_id, messages=len(HISTORY), tokens=0):
+    thread = env.client.beta.threads.create(messages=[{'role': role, 'content': text} for role, text in HISTORY])
+    thread_store.store_thread(lookup_id, thread.id)
+    thread_store.record_thread_usage(lookup_id, messages_added=messages, tokens_added=tokens)
+    return thread
+
+
+def thread_messages(env, thread_id):
+    page = env.client.beta.threads.messages.list(thread_id=thread_id, order="asc", limit=100)
+    return [(message.role, env.m_agent.message_text(message)) for message in page.data]
+
+
+def test_thread_below_the_thresholds_is_kept(rollover):
+    thread = seed_thread(rollover, "user-1", messages=5)
+    assert rollover.m_agent.maybe_roll_over_thread("user-1", thread, rollover.client) is thread
+    assert thread_store.check_if_thread_exists("user-1") == thread.id
+
+
+@pytest.mark.parametrize("messages,tokens", [(6, 0), (1, 1000)], ids=["messages", "tokens"])
+def test_rollover_seeds_a_new_thread_with_a_summary_and_the_recent_turns(rollover, messages, tokens):
+    thread = seed_thread(rollover, "user-1", messages=messages, tokens=tokens)
+
+    new_thread = rollover.m_agent.maybe_roll_over_thread("user-1", thread, rollover.client)
+
+    assert new_thread.id != thread.id
+    assert thread_store.check_if_thread_exists("user-1") == new_thread.id
+    seeded = thread_messages(rollover, new_thread.id)
+    assert seeded[1:] == HISTORY[-2:]
+    role, summary = seeded[0]
+    assert role == "assistant"
+    assert summary.startswith("Summary of our conversation so far:\n")
+    # The fake chat completion echoes the transcript of the older turns it was asked to summarize.
+    assert "User: Book lunch with Sam on Friday." in summary and "You have a standup" not in summary
+    stats = thread_store.get_thread_stats("user-1")
+    assert stats['message_count'] == 3
+    assert rollover.openai_server.call_counts["POST chat_completion"] == 1
+
+
+def test_stale_mapping_switches_to_the_stored_thread(rollover):
+    thread = seed_thread(rollover, "user-1")
+    replacement = rollover.client.beta.threads.create()
+    assert thread_store.replace_thread("user-1", thread.id, replacement.id)
+
+    current = rollover.m_agent.maybe_roll_over_thread("user-1", thread, rollover.client)
+
+    assert current.id == replacement.id
+    assert thread_store.check_if_thread_exists("user-1") == replacement.id
+
+
+def test_failed_summary_keeps_the_old_thread(rollover, monkeypatch):
+    thread = seed_thread(rollover, "user-1")
+
+    def fail(**kwargs):
+        raise RuntimeError("summary unavailable")
+    monkeypatch.setattr(rollover.client.chat.completions, "create", fail)
+
+    assert rollover.m_agent.maybe_roll_over_thread("user-1", thread, rollover.client) is thread
+    assert thread_store.check_if_thread_exists("user-1") == thread.id
+    assert thread_store.get_thread_stats("user-1")['message_count'] == len(HISTORY)
+
+
+def test_rollover_that_loses_the_race_uses_the_winners_thread(rollover, monkeypatch):
+    thread = seed_thread(rollover, "user-1")
+    winner = rollover.client.beta.threads.create()
+    replace_thread = thread_store.replace_thread
+
+    def replaced_elsewhere_first(lookup_id, expected_thread_id, thread_id, **kwargs):
+        assert replace_thread(lookup_id, expected_thread_id, winner.id)
+        return replace_thread(lookup_id, expected_thread_id, thread_id, **kwargs)
+    monkeypatch.setattr(rollover.m_agent, "replace_thread", replaced_elsewhere_first)
+
+    current = rollover.m_agent.maybe_roll_over_thread("user-1", thread, rollover.client)
+
+    assert current.id == winner.id
+    assert thread_store.check_if_thread_exists("user-1") == winner.id
+    assert rollover.openai_server.call_counts["DELETE delete_thread"] == 1
@@ -0,0 +1,100 @@
+import shelve
+import pytest
+from thread_store import thread_store
+from thread_store import InMemoryThreadStore, SQLiteThreadStore, CachedThreadStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(thread_store.time, "monotonic", clock)
+    return clock
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return InMemoryThreadStore()
+    return SQLiteThreadStore(str(tmp_path / 'threads.sqlite3'))
+
+
+def test_replace_thread_only_succeeds_from_the_expected_thread(backend):
+    backend.put_thread('user', 'thread_1')
+    assert backend.replace_thread('user', 'thread_1', 'thread_2', message_count=7)
+    # A second rollover that started from thread_1 lost the race.
+    assert not backend.replace_thread('user', 'thread_1', 'thread_3')
+    assert not backend.replace_thread('missing', 'thread_1', 'thread_3')
+    assert backend.get_threads(['user', 'missing']) == {'user': 'thread_2'}
+    assert backend.get_stats('user')['message_count'] == 7
+
+def test_usage_is_accumulated(backend):
+    backend.put_thread('user', 'thread_1')
+    backend.record_usage('user', messages_added=2, tokens_added=100)
+    backend.record_usage('user', messages_added=1, tokens_added=50)
+    stats = backend.get_stats('user')
+    assert (stats['thread_id'], stats['message_count'], stats['token_count']) == ('thread_1', 3, 150)
+    assert backend.get_stats('missing') is None
+
+def test_sqlite_store_is_shared_between_connections(tmp_path):
+    path = str(tmp_path / 'threads.sqlite3')
+    SQLiteThreadStore(path).put_thread('user', 'thread_1')
+    assert SQLiteThreadStore(path).get_threads(['user']) == {'user': 'thread_1'}
+
+def test_sqlite_store_imports_shelve(tmp_path):
+    legacy = str(tmp_path / 'threads_db')
+    with shelve.open(legacy) as threads_shelf:
+        threads_shelf['user'] = 'thread_old'
+    store = SQLiteThreadStore(str(tmp_path / 'threads.sqlite3'))
+    assert store.import_shelve(legacy) == 1
+    assert store.get_threads(['user']) == {'user': 'thread_old'}
+
+
+def test_cache_revalidates_after_ttl(tmp_path, clock):
+    path = str(tmp_path / 'threads.sqlite3')
+    mine = CachedThreadStore(SQLiteThreadStore(path), ttl=30)
+    other_process = CachedThreadStore(SQLiteThreadStore(path), ttl=30)
+    mine.put_thread('user', 'thread_1')
+    assert other_process.get_threads(['user']) == {'user': 'thread_1'}
+    assert mine.replace_thread('user', 'thread_1', 'thread_2')
+
+    clock.now += 29
+    assert other_process.get_threads(['user']) == {'user': 'thread_1'}
+    clock.now += 2
+    assert other_process.get_threads(['user']) == {'user': 'thread_2'}
+
+def test_invalidate_rereads_at_once(tmp_path, clock):
+    path = str(tmp_path / 'threads.sqlite3')
+    mine = CachedThreadStore(SQLiteThreadStore(path))
+    other_process = CachedThreadStore(SQLiteThreadStore(path))
+    mine.put_thread('user', 'thread_1')
+    other_process.get_threads(['user'])
+    mine.replace_thread('user', 'thread_1', 'thread_2')
+    other_process.invalidate('user')
+    assert other_process.get_threads(['user']) == {'user': 'thread_2'}
+
+def test_lost_replace_drops_the_cached_mapping(tmp_path, clock):
+    path = str(tmp_path / 'threads.sqlite3')
+    mine = CachedThreadStore(SQLiteThreadStore(path))
+    other_process = CachedThreadStore(SQLiteThreadStore(path))
+    mine.put_thread('user', 'thread_1')
+    other_process.get_threads(['user'])
+    assert mine.replace_thread('user', 'thread_1', 'thread_2')
+    assert not other_process.replace_thread('user', 'thread_1', 'thread_3')
+    assert other_process.get_threads(['user']) == {'user': 'thread_2'}
+
+def test_cache_is_bounded_lru(clock):
+    backend = InMemoryThreadStore()
+    cache = CachedThreadStore(backend, max_entries=2)
+    for lookup_id in ('a', 'b', 'c'):
+        cache.put_thread(lookup_id, f'thread_{lookup_id}')
+    # Changed behind the cache's back: only the evicted entry is read from the backend again.
+    backend.put_thread('a', 'thread_a2')
+    backend.put_thread('c', 'thread_c2')
+    assert cache.get_threads(['a', 'c']) == {'a': 'thread_a2', 'c': 'thread_c'}
@@ -0,0 +1,101 @@
+import asyncio
+import json
+import threading
+import time
+import pytest
+
+
+def tool_call(call_id, name, **arguments):
+    return {'id': call_id, 'type': 'function', 'function': {'name': name, 'arguments': json.dumps(arguments)}}
+
+def outputs(tools_output):
+    return {output['tool_call_id']: output['output'] for output in tools_output}
+
+
+@pytest.fixture
+def tools(m_agent, monkeypatch):
+    def echo(text):
+        return text
+
+    def broken():
+        raise RuntimeError("calendar unavailable")
+
+    monkeypatch.setitem(m_agent.function_dispatch_table, "echo", echo)
+    monkeypatch.setitem(m_agent.function_dispatch_table, "broken", broken)
+    return m_agent.function_dispatch_table
+
+
+def test_unknown_tool_gets_an_error_output(m_agent, tools):
+    actions = {'tool_calls': [tool_call('call_1', 'echo', text="hi"), tool_call('call_2', 'no_such_tool')]}
+    tool_calls_output, tools_output = m_agent.process_tool_calls(actions)
+    assert [call['id'] for call in tool_calls_output['tool_calls']] == ['call_1', 'call_2']
+    assert outputs(tools_output) == {'call_1': "hi", 'call_2': "An error occurred: unknown tool 'no_such_tool'."}
+
+def test_failing_tool_does_not_drop_other_outputs(m_agent, tools):
+    actions = {'tool_calls': [tool_call('call_1', 'broken'), tool_call('call_2', 'echo', text="still here")]}
+    _, tools_output = m_agent.process_tool_calls(actions)
+    assert outputs(tools_output) == {'call_1': "An error occurred: calendar unavailable", 'call_2': "still here"}
+
+def test_queued_calls_get_their_full_timeout(m_agent, tools, monkeypatch):
+    def slow():
+        time.sleep(0.15)
+        return "done"
+
+    monkeypatch.setitem(tools, "slow", slow)
+    # Twice as many calls as the pool has workers: the second half waits for the first, which takes longer
+    # than the timeout counted from dispatch but not from when each call starts.
+    count = 2 * m_agent.TOOL_CALL_MAX_WORKERS
+    actions = {'tool_calls': [tool_call(f'call_{index}', 'slow') for index in range(count)]}
+    _, tools_output = m_agent.process_tool_calls(actions, timeout=0.25)
+    assert [output['output'] for output in tools_output] == ["done"] * count
+
+def test_running_call_past_timeout_is_reported_as_still_running(m_agent, tools, monkeypatch):
+    release = threading.Event()
+
+    def stuck():
+        release.wait(5)
+        return "late"
+
+    monkeypatch.setitem(tools, "stuck", stuck)
+    actions = {'tool_calls': [tool_call('call_1', 'stuck'), tool_call('call_2', 'echo', text="hi")]}
+    try:
+        _, tools_output = m_agent.process_tool_calls(actions, timeout=0.1)
+    finally:
+        release.set()
+    assert outputs(tools_output) == {'call_1': m_agent.tool_call_timeout_message(0.1), 'call_2': "hi"}
+
+def test_calls_that_never_get_a_worker_are_not_run(m_agent, tools, monkeypatch):
+    release = threading.Event()
+    ran = []
+
+    def stuck():
+        release.wait(5)
+
+    def record():
+        ran.append(True)
+
+    monkeypatch.setitem(tools, "stuck", stuck)
+    monkeypatch.setitem(tools, "record", record)
+    monkeypatch.setattr(m_agent, "TOOL_CALL_QUEUE_TIMEOUT", 0.2)
+    actions = {'tool_calls': [tool_call(f'call_{index}', 'stuck') for index in range(m_agent.TOOL_CALL_MAX_WORKERS)]
+               + [tool_call('queued', 'record')]}
+    try:
+        _, tools_output = m_agent.process_tool_calls(actions, timeout=0.1)
+    finally:
+        release.set()
+    assert outputs(tools_output)['queued'] == m_agent.tool_call_queue_timeout_message()
+    time.sleep(0.1)
+    assert ran == []
+
+def test_async_queued_calls_get_their_full_timeout(m_agent, tools, monkeypatch):
+    def slow():
+        time.sleep(0.15)
+        return "done"
+
+    monkeypatch.setitem(tools, "slow", slow)
+    count = 2 * m_agent.TOOL_CALL_MAX_WORKERS
+    actions = {'tool_calls': [tool_call(f'call_{index}', 'slow') for index in range(count)]
+               + [tool_call('unknown', 'no_such_tool')]}
+    _, tools_output = asyncio.run(m_agent.async_process_tool_calls(actions, timeout=0.25))
+    assert [output['output'] for output in tools_output[:-1]] == ["done"] * count
+    assert tools_output[-1]['output'] == "An error occurred: unknown tool 'no_such_tool'."
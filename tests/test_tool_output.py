@@ -0,0 +1,63 @@
+from datetime import date
+import pytest
+import pytz
+from calendar_package.event_format import format_event_table
+from tool_output import encode_tool_output, encode_cursor, decode_cursor, read_continuation, estimate_tokens
+
+
+def cursor_of(output):
+    return output.rsplit('cursor=', 1)[1].rstrip(']')
+
+
+def test_small_output_is_left_alone():
+    assert encode_tool_output("3 events") == "3 events"
+    assert encode_tool_output({'status': 'ok', 'ids': [1, 2]}) == '{"status":"ok","ids":[1,2]}'
+
+def test_cut_lines_can_be_read_back():
+    text = '\n'.join(f"line {index}: " + "x" * 40 for index in range(400))
+    output = encode_tool_output(text, budget_tokens=200)
+    assert estimate_tokens(output) <= 200
+    first_page, marker = output.rsplit('\n', 1)
+    assert marker.startswith('[') and 'more lines' in marker
+    assert first_page + '\n' + read_continuation(cursor_of(output)) == text
+
+def test_single_long_line_is_cut_by_characters():
+    text = "y" * 5000
+    output = encode_tool_output(text, budget_tokens=100)
+    assert 'more characters' in output
+    assert output.split(' [', 1)[0] + read_continuation(cursor_of(output)) == text
+
+def test_cursors_round_trip_and_reject_garbage():
+    assert decode_cursor(encode_cursor({'o': 10, 'z': 'Europe/Paris'})) == {'o': 10, 'z': 'Europe/Paris'}
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+    with pytest.raises(ValueError):
+        read_continuation(encode_cursor({'r': 'unknown'}))
+
+def test_read_more_tool_output_reports_bad_cursor(m_agent):
+    assert m_agent.read_more_tool_output("not-a-cursor").startswith("An error occurred:")
+
+
+def test_event_table_folds_recurring_instances():
+    tz = pytz.timezone('Europe/Paris')
+    events = [{'id': f'standup_{day}', 'recurringEventId': 'standup', 'summary': 'Standup',
+               'start': {'dateTime': f'2024-10-{day}T07:00:00+00:00'}, 'end': {'dateTime': f'2024-10-{day}T07:15:00+00:00'}}
+              for day in (14, 15, 16, 17, 18)]
+    events.append({'id': 'offsite', 'summary': 'Offsite', 'location': 'Lyon',
+                   'start': {'date': '2024-10-16'}, 'end': {'date': '2024-10-18'}})
+    table, shown = format_event_table(events, tz, date(2024, 10, 14), budget_tokens=500)
+    assert shown == 6
+    assert table.split('\n')[1:] == [
+        "+0 Mon 09:00-09:15 Standup x5 on +0..+4 series=standup",
+        "+2 Wed all day, 2 days Offsite @ Lyon id=offsite",
+    ]
+
+def test_event_table_shows_a_prefix_within_budget():
+    tz = pytz.utc
+    events = [{'id': f'event_{index}', 'summary': f'Meeting {index}',
+               'start': {'dateTime': '2024-10-14T09:00:00+00:00'}, 'end': {'dateTime': '2024-10-14T10:00:00+00:00'}}
+              for index in range(100)]
+    table, shown = format_event_table(events, tz, date(2024, 10, 14), budget_tokens=150)
+    assert 0 < shown < 100
+    assert estimate_tokens(table) <= 150
+    assert table.startswith(f"{shown} events;")
@@ -1 +1 @@
-from .thread_store import store_thread, check_if_thread_exists
\ No newline at end of file
+from .thread_store import store_thread, check_if_thread_exists, check_if_threads_exist, replace_thread, record_thread_usage, get_thread_stats, invalidate_cached_thread, get_thread_store, set_thread_store, InMemoryThreadStore, SQLiteThreadStore, CachedThreadStore
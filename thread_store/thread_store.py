@@ -1,11 +1,282 @@
+import glob
+import os
 import shelve
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+THREADS_DB = "threads.sqlite3"
+LEGACY_SHELVE_DB = "threads_db"
+DEFAULT_CACHE_SIZE = 10000
+# Seconds a cached mapping is trusted before it is read from the backend again.
+DEFAULT_CACHE_TTL = 30
+
+
+class InMemoryThreadStore:
+    """
+    Process-local backend, mostly useful for tests and benchmarks.
+    """
+
+    def __init__(self):
+        self._threads = {}
+        self._lock = threading.Lock()
+
+    def get_threads(self, lookup_ids):
+        with self._lock:
+            return {lookup_id: self._threads[lookup_id]['thread_id'] for lookup_id in lookup_ids if lookup_id in self._threads}
+
+    def put_thread(self, lookup_id, thread_id, message_count=0, token_count=0):
+        with self._lock:
+            self._threads[lookup_id] = {'thread_id': thread_id, 'last_used': time.time(),
+                                        'message_count': message_count, 'token_count': token_count}
+
+    def replace_thread(self, lookup_id, expected_thread_id, thread_id, message_count=0, token_count=0):
+        with self._lock:
+            record = self._threads.get(lookup_id)
+            if record is None or record['thread_id'] != expected_thread_id:
+                return False
+            self._threads[lookup_id] = {'thread_id': thread_id, 'last_used': time.time(),
+                                        'message_count': message_count, 'token_count': token_count}
+            return True
+
+    def record_usage(self, lookup_id, messages_added=0, tokens_added=0):
+        with self._lock:
+            record = self._threads.get(lookup_id)
+            if record:
+                record['last_used'] = time.time()
+                record['message_count'] += messages_added
+                record['token_count'] += tokens_added
+
+    def get_stats(self, lookup_id):
+        with self._lock:
+            record = self._threads.get(lookup_id)
+            return dict(record) if record else None
+
+
+class SQLiteThreadStore:
+    """
+    SQLite backend in WAL mode, safe to share between threads and processes.
+
+    Each thread gets its own connection, since sqlite3 connections must not be shared across threads.
+    """
+
+    def __init__(self, path=THREADS_DB):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS threads ("
+                " lookup_id TEXT PRIMARY KEY,"
+                " thread_id TEXT NOT NULL,"
+                " last_used REAL NOT NULL,"
+                " message_count INTEGER NOT NULL DEFAULT 0,"
+                " token_count INTEGER NOT NULL DEFAULT 0)"
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(threads)")}
+            if 'token_count' not in columns:
+                conn.execute("ALTER TABLE threads ADD COLUMN token_count INTEGER NOT NULL DEFAULT 0")
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_threads(self, lookup_ids):
+        lookup_ids = list(lookup_ids)
+        found = {}
+        # Stay well under SQLite's bound-parameter limit.
+        for i in range(0, len(lookup_ids), 500):
+            chunk = lookup_ids[i:i + 500]
+            rows = self._connection().execute(
+                f"SELECT lookup_id, thread_id FROM threads WHERE lookup_id IN ({','.join('?' * len(chunk))})", chunk)
+            found.update(rows.fetchall())
+        return found
+
+    def put_thread(self, lookup_id, thread_id, message_count=0, token_count=0):
+        self._connection().execute(
+            "INSERT INTO threads (lookup_id, thread_id, last_used, message_count, token_count) VALUES (?, ?, ?, ?, ?)"
+            " ON CONFLICT(lookup_id) DO UPDATE SET thread_id = excluded.thread_id,"
+            " last_used = excluded.last_used, message_count = excluded.message_count, token_count = excluded.token_count",
+            (lookup_id, thread_id, time.time(), message_count, token_count))
+
+    def replace_thread(self, lookup_id, expected_thread_id, thread_id, message_count=0, token_count=0):
+        # A single conditional UPDATE, so two processes rolling over the same lookup id can't both win.
+        cursor = self._connection().execute(
+            "UPDATE threads SET thread_id = ?, last_used = ?, message_count = ?, token_count = ?"
+            " WHERE lookup_id = ? AND thread_id = ?",
+            (thread_id, time.time(), message_count, token_count, lookup_id, expected_thread_id))
+        return cursor.rowcount == 1
+
+    def record_usage(self, lookup_id, messages_added=0, tokens_added=0):
+        self._connection().execute(
+            "UPDATE threads SET last_used = ?, message_count = message_count + ?, token_count = token_count + ?"
+            " WHERE lookup_id = ?",
+            (time.time(), messages_added, tokens_added, lookup_id))
+
+    def get_stats(self, lookup_id):
+        row = self._connection().execute(
+            "SELECT thread_id, last_used, message_count, token_count FROM threads WHERE lookup_id = ?",
+            (lookup_id,)).fetchone()
+        if row is None:
+            return None
+        return {'thread_id': row[0], 'last_used': row[1], 'message_count': row[2], 'token_count': row[3]}
+
+    def import_shelve(self, shelve_path=LEGACY_SHELVE_DB):
+        """
+        Copies lookup_id -> thread_id entries from the old shelve store, keeping existing rows.
+        """
+        with shelve.open(shelve_path, flag='r') as threads_shelf:
+            entries = list(threads_shelf.items())
+        self._connection().executemany(
+            "INSERT OR IGNORE INTO threads (lookup_id, thread_id, last_used, message_count) VALUES (?, ?, ?, 0)",
+            [(lookup_id, thread_id, time.time()) for lookup_id, thread_id in entries])
+        return len(entries)
+
+
+class CachedThreadStore:
+    """
+    Bounded LRU cache of lookup_id -> thread_id in front of another backend.
+
+    Only the mapping is cached; usage and stats always go to the backend. A mapping changed by another
+    process becomes visible here after at most 'ttl' seconds, or at once after invalidate(lookup_id).
+    """
+
+    def __init__(self, backend, max_entries=DEFAULT_CACHE_SIZE, ttl=DEFAULT_CACHE_TTL):
+        self.backend = backend
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._cache = OrderedDict()  # lookup_id -> (thread_id, expires_at)
+        self._lock = threading.Lock()
+
+    def _remember(self, lookup_id, thread_id):
+        self._cache[lookup_id] = (thread_id, time.monotonic() + self.ttl)
+        self._cache.move_to_end(lookup_id)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    def get_threads(self, lookup_ids):
+        found = {}
+        missing = []
+        now = time.monotonic()
+        with self._lock:
+            for lookup_id in lookup_ids:
+                entry = self._cache.get(lookup_id)
+                if entry is None or entry[1] <= now:
+                    missing.append(lookup_id)
+                else:
+                    self._cache.move_to_end(lookup_id)
+                    found[lookup_id] = entry[0]
+
+        if missing:
+            loaded = self.backend.get_threads(missing)
+            with self._lock:
+                for lookup_id, thread_id in loaded.items():
+                    self._remember(lookup_id, thread_id)
+            found.update(loaded)
+        return found
+
+    def put_thread(self, lookup_id, thread_id, message_count=0, token_count=0):
+        self.backend.put_thread(lookup_id, thread_id, message_count, token_count)
+        with self._lock:
+            self._remember(lookup_id, thread_id)
+
+    def replace_thread(self, lookup_id, expected_thread_id, thread_id, message_count=0, token_count=0):
+        replaced = self.backend.replace_thread(lookup_id, expected_thread_id, thread_id, message_count, token_count)
+        with self._lock:
+            if replaced:
+                self._remember(lookup_id, thread_id)
+            else:
+                # Someone else changed the mapping; the next lookup reads it from the backend.
+                self._cache.pop(lookup_id, None)
+        return replaced
+
+    def record_usage(self, lookup_id, messages_added=0, tokens_added=0):
+        self.backend.record_usage(lookup_id, messages_added, tokens_added)
+
+    def get_stats(self, lookup_id):
+        return self.backend.get_stats(lookup_id)
+
+    def invalidate(self, lookup_id):
+        with self._lock:
+            self._cache.pop(lookup_id, None)
+
+
+_thread_store = None
+_thread_store_lock = threading.Lock()
+
+def create_default_thread_store(path=THREADS_DB, cache_size=DEFAULT_CACHE_SIZE, cache_ttl=DEFAULT_CACHE_TTL):
+    """
+    SQLite store behind an LRU cache. A new database picks up entries from the old shelve store, if present.
+    """
+    is_new = not os.path.exists(path)
+    backend = SQLiteThreadStore(path)
+    if is_new and glob.glob(LEGACY_SHELVE_DB + "*"):
+        try:
+            print(f"Imported {backend.import_shelve(LEGACY_SHELVE_DB)} threads from {LEGACY_SHELVE_DB}")
+        except Exception as e:
+            print(f"Failed to import threads from {LEGACY_SHELVE_DB}: {e}")
+    return CachedThreadStore(backend, cache_size, cache_ttl)
+
+def get_thread_store():
+    global _thread_store
+    if _thread_store is None:
+        with _thread_store_lock:
+            if _thread_store is None:
+                _thread_store = create_default_thread_store()
+    return _thread_store
+
+def set_thread_store(store):
+    """
+    Replaces the store used by the module-level functions, e.g. with InMemoryThreadStore() in tests.
+    """
+    global _thread_store
+    with _thread_store_lock:
+        _thread_store = store
 
 def check_if_thread_exists(lookup_id):
     lookup_id_str = str(lookup_id)  # Convert lookup_id to string
-    with shelve.open("threads_db") as threads_shelf:
-        return threads_shelf.get(lookup_id_str, None)
+    return get_thread_store().get_threads([lookup_id_str]).get(lookup_id_str)
+
+def check_if_threads_exist(lookup_ids):
+    """
+    Bulk lookup: returns {lookup_id: thread_id} for the lookup ids that have a thread.
+    """
+    lookup_id_strs = {str(lookup_id): lookup_id for lookup_id in lookup_ids}
+    found = get_thread_store().get_threads(lookup_id_strs)
+    return {lookup_id_strs[lookup_id_str]: thread_id for lookup_id_str, thread_id in found.items()}
 
 def store_thread(lookup_id, thread_id):
     lookup_id_str = str(lookup_id)  # Convert lookup_id to string
-    with shelve.open("threads_db", writeback=True) as threads_shelf:
-        threads_shelf[lookup_id_str] = thread_id
+    get_thread_store().put_thread(lookup_id_str, thread_id)
+
+def replace_thread(lookup_id, expected_thread_id, thread_id, message_count=0, token_count=0):
+    """
+    Points the lookup id at a new thread, but only if it still maps to expected_thread_id.
+    Returns False, leaving the mapping untouched, if another request replaced it first.
+    """
+    return get_thread_store().replace_thread(str(lookup_id), expected_thread_id, thread_id, message_count, token_count)
+
+def record_thread_usage(lookup_id, messages_added=0, tokens_added=0):
+    """
+    Updates the last-used time of the thread and adds to its message and (estimated) token counts.
+    """
+    get_thread_store().record_usage(str(lookup_id), messages_added, tokens_added)
+
+def invalidate_cached_thread(lookup_id):
+    """
+    Drops the cached mapping of the lookup id, e.g. after finding it stale, so the next lookup reads the backend.
+    """
+    store = get_thread_store()
+    if hasattr(store, 'invalidate'):
+        store.invalidate(str(lookup_id))
+
+def get_thread_stats(lookup_id):
+    """
+    Returns {'thread_id', 'last_used', 'message_count', 'token_count'} for the lookup id, or None.
+    """
+    return get_thread_store().get_stats(str(lookup_id))
@@ -0,0 +1 @@
+from .tool_output import encode_tool_output, estimate_tokens, encode_cursor, decode_cursor, longest_fitting_prefix, read_continuation, DEFAULT_TOKEN_BUDGET
@@ -0,0 +1,105 @@
+import base64
+import json
+import threading
+import uuid
+from collections import OrderedDict
+
+DEFAULT_TOKEN_BUDGET = 1500
+# Room kept for the truncation marker (with its cursor) when fitting output into a budget.
+MARKER_RESERVE_TOKENS = 40
+# Cut-off remainders kept for read_more_tool_output, oldest dropped first.
+CONTINUATION_MAX_ENTRIES = 256
+
+_continuations = OrderedDict()
+_continuations_lock = threading.Lock()
+
+
+def estimate_tokens(text):
+    """
+    Rough token count (about four characters per token), good enough for budgets and thresholds.
+    """
+    return len(text) // 4 + 1
+
+def encode_cursor(state):
+    """
+    Packs a small dict into an opaque string the model can pass back to fetch the next page.
+    """
+    payload = json.dumps(state, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """
+    Reverses encode_cursor. Raises ValueError for anything that isn't a cursor we produced.
+    """
+    try:
+        state = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+    if not isinstance(state, dict):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return state
+
+def longest_fitting_prefix(count, render, budget_tokens):
+    """
+    Returns the largest n <= count for which render(n) fits the budget, assuming the output only grows with n.
+    """
+    low, high = 0, count
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(render(middle)) <= budget_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+def store_continuation(text):
+    """
+    Keeps the cut-off rest of an output in memory and returns a cursor for read_continuation.
+    """
+    key = uuid.uuid4().hex[:16]
+    with _continuations_lock:
+        _continuations[key] = text
+        while len(_continuations) > CONTINUATION_MAX_ENTRIES:
+            _continuations.popitem(last=False)
+    return encode_cursor({'r': key})
+
+def read_continuation(cursor):
+    """
+    Returns the text stored under a cursor from store_continuation. Raises ValueError if the cursor is
+    invalid or its text is no longer kept.
+    """
+    key = decode_cursor(cursor).get('r')
+    with _continuations_lock:
+        text = _continuations.get(key)
+        if text is not None:
+            _continuations.move_to_end(key)
+    if text is None:
+        raise ValueError("That output is no longer available; call the original tool again.")
+    return text
+
+def encode_tool_output(result, budget_tokens=DEFAULT_TOKEN_BUDGET):
+    """
+    Turns a tool's return value into the string submitted to the run, cut down to the token budget.
+
+    :param result: A string, or anything JSON-serializable (encoded without whitespace).
+    :param budget_tokens: Upper bound for the estimated size of the output.
+    :return: The output. If it was cut, it ends with a "[N more lines]" or "[N more characters]" marker
+             carrying a cursor for the rest (see store_continuation).
+
+    Multi-line output keeps whole lines from the top; a single long line is cut at a character boundary.
+    """
+    text = result if isinstance(result, str) else json.dumps(result, separators=(',', ':'), ensure_ascii=False, default=str)
+    if estimate_tokens(text) <= budget_tokens:
+        return text
+
+    budget_tokens = max(budget_tokens - MARKER_RESERVE_TOKENS, 1)
+    lines = text.split('\n')
+    if len(lines) > 1:
+        kept = longest_fitting_prefix(len(lines), lambda n: '\n'.join(lines[:n]), budget_tokens)
+        if kept:
+            cursor = store_continuation('\n'.join(lines[kept:]))
+            return '\n'.join(lines[:kept]) + f"\n[{len(lines) - kept} more lines; read them with read_more_tool_output cursor={cursor}]"
+
+    kept = budget_tokens * 4
+    cursor = store_continuation(text[kept:])
+    return text[:kept] + f" [{len(text) - kept} more characters; read them with read_more_tool_output cursor={cursor}]"